@@ -0,0 +1,97 @@
+import os
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from xpcs_viewer.fileIO.aps_8idi import key as aps_8idi_key
+
+
+def make_xpcs_file(fname, seed=0, shape=(64, 80), snoq=20, snophi=4,
+                   dnoq=5):
+    """
+    write a small multitau result file in the aps_8idi legacy layout; g2 is
+    a single exp with tau = 1e-2 * (1e-3 / q) ** 2
+    """
+    key = aps_8idi_key['legacy']
+    rng = np.random.default_rng(seed)
+    v, h = np.mgrid[0:shape[0], 0:shape[1]]
+    r = np.hypot(v - 30.0, h - 40.0)
+
+    t0 = 1e-3
+    tau = np.array([[1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128,
+                     192, 256]], dtype=np.float64)
+    ql_dyn = np.linspace(0.001, 0.008, dnoq)
+    t_el = tau.ravel() * t0
+    g2 = 0.2 * np.exp(-2 * t_el[:, None] / (1e-2 * (1e-3 / ql_dyn) ** 2))
+    g2 += 1.0 + rng.normal(0, 0.002, g2.shape)
+
+    vals = {
+        'saxs_1d': rng.random((1, snoq * snophi)) + 1,
+        'Iqp': rng.random((10, snoq * snophi)) + 1,
+        'ql_sta': np.linspace(0.0002, 0.009, snoq * snophi).reshape(1, -1),
+        'ql_dyn': ql_dyn.reshape(1, -1),
+        'dqmap': (r / 8).astype(np.int64),
+        'sqmap': (r / 3).astype(np.int64),
+        'mask': (r > 3).astype(np.int64),
+        'snophi': np.array([[snophi]]), 'snoq': np.array([[snoq]]),
+        'sphilist': np.tile(np.linspace(0, 270, snophi),
+                            snoq).reshape(1, -1),
+        'dnophi': np.array([[1]]), 'dnoq': np.array([[dnoq]]),
+        'dphilist': np.zeros((1, dnoq)),
+        'sphispan': np.linspace(0, 360, snophi + 1).reshape(1, -1),
+        'sqspan': np.linspace(0, 0.0092, snoq + 1).reshape(1, -1),
+        'type': np.bytes_(b'Multitau'),
+        't0': np.array([[t0]]), 't1': np.array([[t0]]),
+        'tau': tau, 'g2': g2, 'g2_err': np.full_like(g2, 0.002),
+        'saxs_2d': 1000 * np.exp(-r / 20),
+        'Int_t': rng.random((2, 100)),
+        'avg_frames': np.array([[1]]), 'stride_frames': np.array([[1]]),
+        'bcx': np.array([[40.0]]), 'bcy': np.array([[30.0]]),
+        'ccdx': np.array([[0.0]]), 'ccdx0': np.array([[0.0]]),
+        'ccdy': np.array([[0.0]]), 'ccdy0': np.array([[0.0]]),
+        'det_dist': np.array([[4000.0]]),
+        'pix_dim_x': np.array([[0.075]]), 'pix_dim_y': np.array([[0.075]]),
+        'X_energy': np.array([[10.0]]),
+        'xdim': np.array([[shape[1]]]), 'ydim': np.array([[shape[0]]]),
+    }
+    with h5py.File(fname, 'w') as f:
+        f['/xpcs/Version'] = np.bytes_(b'1.0')
+        for x, val in vals.items():
+            f[key[x]] = val
+    return fname
+
+
+@pytest.fixture
+def xpcs_files(tmp_path):
+    """
+    the full paths of four synthetic xpcs files in tmp_path
+    """
+    return [make_xpcs_file(os.path.join(str(tmp_path),
+                                        'A%03d_sample_%04d_0001-1000.hdf' %
+                                        (n, n)), seed=n) for n in range(4)]
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    """
+    the application that delivers the queued signals; call wait_for to run
+    its event loop
+    """
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+    return app
+
+
+def wait_for(app, condition, timeout=10):
+    """
+    process the events until condition() is True or the timeout is reached
+    """
+    t0 = time.perf_counter()
+    while not condition() and time.perf_counter() - t0 < timeout:
+        app.processEvents()
+        time.sleep(0.005)
+    return condition()
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from xpcs_viewer.helper.fit_cache import FitCache, file_signature
+
+
+def make_result(size=1000):
+    return {'fit_val': np.zeros((size, 2, 4)), 'fit_func': 'single'}
+
+
+def test_key(tmp_path):
+    fname = tmp_path / 'a.hdf'
+    fname.write_bytes(b'0' * 10)
+    sig = file_signature(str(fname))
+    cache = FitCache(None)
+    key = cache.get_key(sig, fit_func='single', bounds=np.array([1.0, 2.0]))
+    assert key == cache.get_key(sig, bounds=(1.0, 2.0), fit_func='single')
+    assert key != cache.get_key(sig, fit_func='double', bounds=[1.0, 2.0])
+    # the same values of other settings
+    assert key != cache.get_key(sig, fit_func='single', t_range=[1.0, 2.0])
+    assert cache.get_key(None, fit_func='single') is None
+    assert file_signature(str(tmp_path / 'missing.hdf')) is None
+
+    # a changed file has another signature
+    fname.write_bytes(b'0' * 11)
+    assert file_signature(str(fname)) != sig
+
+
+def test_memory_and_disk(tmp_path):
+    cache = FitCache(str(tmp_path), max_size=1024 ** 2)
+    val = make_result()
+    cache.put('k', val)
+    assert os.path.isfile(str(tmp_path / 'k.pkl'))
+    assert cache.get('k')['fit_func'] == 'single'
+
+    # a new session reads the result from disk
+    cache = FitCache(str(tmp_path), max_size=1024 ** 2)
+    np.testing.assert_array_equal(cache.get('k')['fit_val'], val['fit_val'])
+    assert cache.get('missing') is None
+    stats = cache.get_stats()
+    assert stats['disk_hits'] == 1 and stats['misses'] == 1
+
+
+def test_get_returns_copies():
+    cache = FitCache(None)
+    val = make_result()
+    cache.put('k', val)
+    val['tauq_q'] = 1
+    ret = cache.get('k')
+    ret['tauq_tau'] = 2
+    assert set(cache.get('k').keys()) == {'fit_val', 'fit_func'}
+
+
+def test_disk_eviction(tmp_path):
+    cache = FitCache(str(tmp_path), max_size=1024 ** 2,
+                     max_disk_size=100 * 1024)
+    for n in range(10):
+        cache.put('k%d' % n, make_result())
+        # the mtime orders the entries
+        os.utime(str(tmp_path / ('k%d.pkl' % n)), (n, n))
+    cache.evict()
+    assert cache.disk_size <= 100 * 1024 * 0.9
+    names = sorted(os.listdir(str(tmp_path)))
+    assert 'k9.pkl' in names and 'k0.pkl' not in names
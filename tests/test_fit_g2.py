@@ -0,0 +1,180 @@
+import numpy as np
+
+from xpcs_viewer.helper.fitting import (fit_g2_data, fit_power_law_batch,
+                                        fit_tauq_batch, match_prev_fit,
+                                        same_fit_flag, seed_g2, single_exp_all)
+
+
+bounds = [[0, 1e-6, 0.5, 0.95], [1, 1e2, 1.5, 1.05]]
+
+
+def make_data(num_q=16, seed=0):
+    rng = np.random.default_rng(seed)
+    t_el = np.logspace(-5, 1, 64)
+    q = np.linspace(0.001, 0.01, num_q)
+    tau = 10 ** rng.uniform(-3, -1, num_q)
+    sigma = np.full((t_el.size, num_q), 0.005)
+    g2 = single_exp_all(t_el[:, None], 0.2, tau, 1.0, 1.0) + \
+        sigma * rng.standard_normal(sigma.shape)
+    return (t_el, q, g2, sigma, (0, num_q), (0, t_el.size))
+
+
+def test_warm_start():
+    data = make_data()
+    t_el, q = data[0:2]
+    prev = fit_g2_data([data], bounds)[0]
+    p0 = np.mean(bounds, axis=0)
+
+    # an inactive bound changes, so all the columns are reused
+    new_bounds = [list(bounds[0]), list(bounds[1])]
+    new_bounds[1][0] = 1.2
+    res = fit_g2_data([data], new_bounds, prev=[prev])[0]
+    np.testing.assert_array_equal(res['fit_val'], prev['fit_val'])
+    for x, y in zip(res['fit_line'], prev['fit_line']):
+        assert x['fit_y'] is y['fit_y'] and x['stop'] == 'reused'
+    assert res['fit_stats']['num_reused'] == 16
+
+    # the new bound of tau is active for the slow columns
+    new_bounds[1][1] = 5e-3
+    _, reuse = match_prev_fit(prev, t_el, q, new_bounds, [True] * 4,
+                              'single', p0)
+    slow = prev['fit_val'][:, 0, 1] >= 5e-3
+    assert np.any(slow) and not np.all(slow)
+    np.testing.assert_array_equal(reuse, np.where(slow, -1, np.arange(16)))
+
+    # a new fixed value changes all the columns; they start from prev
+    flag = [True, True, True, False]
+    p0_new, reuse = match_prev_fit(prev, t_el, q, bounds, flag, 'single', p0)
+    assert np.all(reuse == -1)
+    np.testing.assert_array_equal(p0_new[:, 0:3], prev['fit_val'][:, 0, 0:3])
+    np.testing.assert_array_equal(p0_new[:, 3], p0[3])
+
+    # the other function or delay times aren't comparable
+    for args in [(t_el, q, bounds, [True] * 4, 'double'),
+                 (t_el * 2, q, bounds, [True] * 4, 'single')]:
+        p0_new, reuse = match_prev_fit(prev, *args, p0)
+        assert np.all(reuse == -1) and np.all(p0_new == p0)
+
+
+def test_bootstrap_with_warm_start():
+    data = make_data()
+    prev = fit_g2_data([data], bounds, bootstrap=50)[0]
+
+    # an inactive bound changes, so all the columns are reused
+    new_bounds = [list(bounds[0]), list(bounds[1])]
+    new_bounds[1][0] = 1.2
+    res = fit_g2_data([data], new_bounds, prev=[prev], bootstrap=50)[0]
+
+    assert all(x['stop'] == 'reused' for x in res['fit_line'])
+    np.testing.assert_array_equal(res['fit_val'], prev['fit_val'])
+    assert np.all(res['bootstrap']['num_ok'] > 0)
+    ci, val = res['fit_ci'], res['fit_val'][:, 0]
+    assert np.all(ci[:, 0] <= val) and np.all(val <= ci[:, 1])
+    # the intervals of the varied parameters aren't empty
+    assert np.all(ci[:, 1, :2] > ci[:, 0, :2])
+
+
+def test_warm_start_settings():
+    data = make_data()
+    t_el, q = data[0:2]
+    prev = fit_g2_data([data], bounds)[0]
+    p0 = np.mean(bounds, axis=0)
+    args = (prev, t_el, q, bounds, [True] * 4, 'single', p0)
+    _, reuse = match_prev_fit(*args)
+    assert np.all(reuse >= 0)
+
+    # other starts or bootstrap settings aren't the same fitting
+    for kwargs in [{'num_starts': 4}, {'bootstrap': 50}]:
+        p0_new, reuse = match_prev_fit(*args, **kwargs)
+        assert np.all(reuse == -1)
+        np.testing.assert_array_equal(p0_new, prev['fit_val'][:, 0])
+    prev = fit_g2_data([data], bounds, bootstrap=50, level=0.9)[0]
+    _, reuse = match_prev_fit(prev, *args[1:], bootstrap=50, level=0.95)
+    assert np.all(reuse == -1)
+    _, reuse = match_prev_fit(prev, *args[1:], bootstrap=50, level=0.9)
+    assert np.all(reuse >= 0)
+
+    # the results of a global fit are only the initial values
+    prev = dict(prev, fit_mode='global', bootstrap=None)
+    p0_new, reuse = match_prev_fit(prev, *args[1:])
+    assert np.all(reuse == -1)
+    np.testing.assert_array_equal(p0_new, prev['fit_val'][:, 0])
+
+
+def test_same_fit_flag():
+    assert same_fit_flag(str([True, False]), (True, False))
+    assert same_fit_flag(str((True, False)), np.array([1, 0]))
+    assert not same_fit_flag(str([True, True]), [True, False])
+
+
+def test_warm_start_with_tuple_flag():
+    data = make_data()
+    prev = fit_g2_data([data], bounds, fit_flag=[True] * 4)[0]
+    res = fit_g2_data([data], bounds, fit_flag=(True, ) * 4, prev=[prev])[0]
+    assert all(x['stop'] == 'reused' for x in res['fit_line'])
+
+
+class Result(object):
+    # the part of XpcsFile that fit_tauq_batch uses
+    def __init__(self, fit_summary):
+        self.fit_summary = fit_summary
+
+
+def test_fit_tauq_batch():
+    tauq_bounds = [[1e-10, -4], [1e-4, 0]]
+    rng = np.random.default_rng(0)
+    result = []
+    for num_q in (12, 8):
+        q = np.linspace(0.002, 0.02, num_q)
+        fit_val = np.zeros((num_q, 2, 4))
+        fit_val[:, 0, 1] = 1e-7 * q ** -2.1 * \
+            (1 + 0.02 * rng.standard_normal(num_q))
+        fit_val[:, 1, 1] = 0.05 * fit_val[:, 0, 1]
+        result.append(Result({'q_val': q, 'fit_val': fit_val}))
+    # the failed g2 fittings are left out
+    result[1].fit_summary['fit_val'][2, 1] = -1
+    result.append(Result(None))
+
+    fit_tauq_batch(result, (0, 1), tauq_bounds, [True, True])
+    assert result[2].fit_summary is None
+    for x in result[:2]:
+        t = x.fit_summary
+        assert t['tauq_success']
+        keep = t['fit_val'][:, 1, 1] > 0
+        np.testing.assert_array_equal(t['tauq_q'], t['q_val'][keep])
+        ref = fit_power_law_batch(t['tauq_q'], t['tauq_tau'],
+                                  t['tauq_tau_err'], tauq_bounds,
+                                  [True, True], t['tauq_q'])[1][0]
+        np.testing.assert_allclose(t['tauq_fit_val'], ref, rtol=1e-10)
+        np.testing.assert_allclose(t['tauq_fit_val'][0, 1], -2.1, atol=0.1)
+
+
+def test_seed_g2():
+    t_el = np.logspace(-5, 1, 64)
+    tau = np.array([1e-3, 3e-3, 1e-2])
+    g2 = single_exp_all(t_el[:, None], 0.2, tau, 0.8, 1.0)
+    # a flat column has no decay to seed from
+    g2 = np.hstack([g2, np.full((t_el.size, 1), 1.0)])
+    p0, found = seed_g2(t_el, g2, bounds, 'single')
+    np.testing.assert_array_equal(found, [True, True, True, False])
+    # the seeds are close, not exact; the head has decayed a little
+    np.testing.assert_allclose(p0[:3, 0], 0.2, rtol=0.1)
+    np.testing.assert_allclose(p0[:3, 1], tau, rtol=0.1)
+    np.testing.assert_allclose(p0[:3, 2], 0.8, rtol=0.2)
+    np.testing.assert_allclose(p0[:3, 3], 1.0, rtol=1e-3)
+    b = np.array(bounds)
+    assert np.all((p0 >= b[0]) & (p0 <= b[1]))
+
+    double_bounds = [bounds[0] + [1e-6, 0.5, 0], bounds[1] + [1e2, 1.5, 1]]
+    p0, _ = seed_g2(t_el, g2, double_bounds, 'double')
+    assert p0.shape == (4, 7)
+    assert np.all(p0[:3, 1] < tau) and np.all(p0[:3, 4] > tau)
+
+
+def test_fit_stats():
+    data = make_data()
+    res = fit_g2_data([data], bounds)[0]
+    stats = res['fit_stats']
+    assert stats['num_failed'] == 0 and stats['num_reused'] == 0
+    assert stats['nit'] == sum([x['nit'] for x in res['fit_line']])
+    assert all([x['stop'] in ('ftol', 'xtol') for x in res['fit_line']])
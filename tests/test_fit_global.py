@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+
+from xpcs_viewer.helper import fitting
+from xpcs_viewer.helper.fit_cache import FitCache
+from xpcs_viewer.helper.fitting import fit_g2_global_data, single_exp_all
+from xpcs_viewer.xpcs_file import XpcsFile
+
+
+bounds = [[0.01, 1e-6, 0.5, 0.95], [1, 1e2, 1.5, 1.05]]
+tauq_bounds = [[1e-12, -3], [1e-4, -1]]
+
+
+def make_data(contrast, a=1e-8, b=-2.0, stretch=1.0, seed=0):
+    # tau = a * q ** b
+    rng = np.random.default_rng(seed)
+    t_el = np.logspace(-6, 0, 64)
+    q = np.linspace(0.002, 0.02, contrast.size)
+    tau = a * q ** b
+    sigma = np.full((t_el.size, q.size), 0.002)
+    g2 = single_exp_all(t_el[:, None], contrast, tau, stretch, 1.0) + \
+        sigma * rng.standard_normal(sigma.shape)
+    return (t_el, q, g2, sigma, (0, 1), (0, 1))
+
+
+def check_power_law(res, a, b):
+    val, err = res['tauq_fit_val']
+    assert res['tauq_success'] and res['fit_mode'] == 'global'
+    assert abs(val[1] - b) < 3 * err[1] + 1e-3
+    assert abs(np.log(val[0] / a)) < 3 * err[0] / val[0] + 1e-2
+    np.testing.assert_allclose(res['tauq_tau'],
+                               val[0] * res['q_val'] ** val[1])
+
+
+def test_per_q():
+    contrast = np.linspace(0.1, 0.3, 10)
+    res = fit_g2_global_data([make_data(contrast)], bounds,
+                             tauq_bounds=tauq_bounds)[0]
+    check_power_law(res, 1e-8, -2.0)
+    fit_val = res['fit_val']
+    np.testing.assert_allclose(fit_val[:, 0, 0], contrast, rtol=0.02)
+    np.testing.assert_allclose(fit_val[:, 0, 2], 1.0, rtol=0.05)
+    assert np.all(fit_val[:, 1] > 0)
+    assert all([x['success'] for x in res['fit_line']])
+
+
+def test_shared():
+    data = [make_data(np.full(10, 0.2), a=3e-8, b=-1.8, stretch=0.9,
+                      seed=n) for n in range(2)]
+    share = (True, True, True)
+    result = fit_g2_global_data(data, bounds, tauq_bounds=tauq_bounds,
+                                share=share)
+    for res in result:
+        check_power_law(res, 3e-8, -1.8)
+        fit_val = res['fit_val']
+        # one value for all q
+        for k in (0, 2, 3):
+            assert np.all(fit_val[:, :, k] == fit_val[0, :, k])
+        np.testing.assert_allclose(fit_val[0, 0, [0, 2, 3]],
+                                   [0.2, 0.9, 1.0], rtol=0.02)
+        assert res['global_share'] == str(share)
+
+
+def test_fixed():
+    data = make_data(np.full(10, 0.2))
+    # a is fixed at its upper bound, so is the stretch
+    fixed_bounds = [bounds[0], [1, 1e2, 1.0, 1.05]]
+    res = fit_g2_global_data([data], fixed_bounds,
+                             fit_flag=[True, True, False, True],
+                             tauq_bounds=[[1e-12, -3], [1e-8, -1]],
+                             tauq_flag=[False, True])[0]
+    val, err = res['tauq_fit_val']
+    np.testing.assert_allclose(val[0], 1e-8, rtol=1e-12)
+    assert err[0] == 0
+    assert abs(val[1] + 2.0) < 3 * err[1] + 1e-3
+    np.testing.assert_array_equal(res['fit_val'][:, 0, 2], 1.0)
+    np.testing.assert_array_equal(res['fit_val'][:, 1, 2], 0)
+
+    # the exponent is fixed
+    res = fit_g2_global_data([data], bounds, tauq_bounds=tauq_bounds,
+                             tauq_flag=[True, False])[0]
+    val, err = res['tauq_fit_val']
+    assert val[1] == -1 and err[1] == 0 and err[0] > 0
+
+
+def test_xpcs_file(xpcs_files, monkeypatch):
+    monkeypatch.setattr(fitting, 'fit_cache', FitCache(None))
+    fname = xpcs_files[0]
+    xf = XpcsFile(os.path.basename(fname), os.path.dirname(fname))
+    res = xf.fit_g2_global(bounds=bounds, tauq_bounds=tauq_bounds)
+    assert xf.fit_summary is res
+    # the synthetic files have tau = 1e-8 * q ** -2
+    check_power_law(res, 1e-8, -2.0)
+    assert fitting.fit_cache.get_stats()['misses'] == 1
+    again = xf.fit_g2_global(bounds=bounds, tauq_bounds=tauq_bounds)
+    np.testing.assert_array_equal(again['fit_val'], res['fit_val'])
+
+    # the per q fitting with the same settings has its own key
+    key = xf.get_fit_key(None, None, bounds, None, 'single', 'global',
+                         tauq_bounds=tauq_bounds, tauq_flag=None,
+                         share=(False, False, False))
+    assert key != xf.get_fit_key(None, None, bounds, None, 'single')
+    assert xf.fit_g2(bounds=bounds)['fit_mode'] == 'independent'
+    res = xf.fit_g2_global(bounds=bounds, tauq_bounds=tauq_bounds)
+    assert res['fit_mode'] == 'global'
+    assert fitting.fit_cache.get_stats()['misses'] == 2
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+from xpcs_viewer import fit_worker
+from xpcs_viewer.fit_worker import FitWorker
+from xpcs_viewer.helper.fit_cache import FitCache
+from xpcs_viewer.helper.fitting import fit_g2_data
+from xpcs_viewer.xpcs_file import XpcsFile
+
+
+bounds = [[0.01, 1e-6, 0.5, 0.95], [1, 1e2, 1.5, 1.05]]
+fit_flag = [True, True, False, True]
+
+
+def test_fit_worker(qapp, xpcs_files, monkeypatch):
+    monkeypatch.setattr(fit_worker, 'fit_cache', FitCache(None))
+    xf_list = [XpcsFile(os.path.basename(x), os.path.dirname(x), lazy=True)
+               for x in xpcs_files]
+    data = [xf.get_g2_fit_data() for xf in xf_list]
+    expected = fit_g2_data(data, bounds, fit_flag)
+
+    worker = FitWorker(xf_list, None, None, bounds, fit_flag, max_workers=1,
+                       chunk_size=3)
+    assert len(worker.todo) == len(xf_list)
+
+    # the data is read when the worker is created, not in its thread
+    def get_g2_fit_data(*args, **kwargs):
+        raise RuntimeError('the file is read in the worker thread')
+
+    monkeypatch.setattr(XpcsFile, 'get_g2_fit_data', get_g2_fit_data)
+    fitted, finished = [], []
+    worker.signals.fitted.connect(fitted.append)
+    worker.signals.finished.connect(finished.append)
+    worker.run()
+    assert finished == [(4, 4, False)]
+    assert sorted([xf_list.index(x[0]) for x in fitted]) == [0, 1, 2, 3]
+    for xf, fit_summary in fitted:
+        np.testing.assert_allclose(fit_summary['fit_val'],
+                                   expected[xf_list.index(xf)]['fit_val'],
+                                   rtol=1e-6)
+
+    # the results are in fit_cache now
+    worker = FitWorker(xf_list, None, None, bounds, fit_flag, max_workers=1)
+    assert len(worker.cached) == 4 and worker.todo == []
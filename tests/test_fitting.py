@@ -0,0 +1,221 @@
+import numpy as np
+from scipy.optimize import curve_fit
+
+from xpcs_viewer.helper.fitting import (bootstrap_with_fixed_batch_raw,
+                                        fit_power_law_batch,
+                                        fit_with_fixed_batch_raw,
+                                        fit_with_fixed_multistart_raw,
+                                        single_exp_all, single_exp_all_jac,
+                                        double_exp_all, double_exp_all_jac)
+
+
+bounds = [[0.01, 1e-5, 0.5, 0.95], [1, 1e1, 1.5, 1.05]]
+
+
+def make_g2(num_q=8, seed=0, noise=0.003):
+    rng = np.random.default_rng(seed)
+    t_el = np.logspace(-5, 1, 60)
+    truth = np.stack([np.full(num_q, 0.2), 10 ** rng.uniform(-3, -1, num_q),
+                      rng.uniform(0.8, 1.2, num_q), np.ones(num_q)], axis=1)
+    sigma = np.full((t_el.size, num_q), noise)
+    g2 = single_exp_all(t_el[:, None], *truth.T) + \
+        sigma * rng.standard_normal(sigma.shape)
+    return t_el, g2, sigma, truth
+
+
+def numeric_jac(func, x, args, eps=1e-7):
+    ret = []
+    for n in range(len(args)):
+        lo, hi = list(args), list(args)
+        h = eps * max(abs(args[n]), 1e-3)
+        lo[n] -= h
+        hi[n] += h
+        ret.append((func(x, *hi) - func(x, *lo)) / (2 * h))
+    return ret
+
+
+def test_jacobians():
+    x = np.logspace(-5, 1, 40)
+    args = [0.2, 1e-2, 0.9, 1.0]
+    for a, b in zip(single_exp_all_jac(x, *args),
+                    numeric_jac(single_exp_all, x, args)):
+        np.testing.assert_allclose(a, b, rtol=1e-5,
+                                   atol=1e-6 * np.max(np.abs(b)))
+
+    args = [0.2, 1e-3, 0.9, 1.0, 1e-1, 1.2, 0.3]
+    for a, b in zip(double_exp_all_jac(x, *args),
+                    numeric_jac(double_exp_all, x, args)):
+        np.testing.assert_allclose(a, b, rtol=1e-5,
+                                   atol=1e-6 * np.max(np.abs(b)))
+
+
+def test_batch_vs_curve_fit():
+    t_el, g2, sigma, _ = make_g2()
+    fit_x = np.logspace(-5, 1, 32)
+    for jac in (single_exp_all_jac, None):
+        fit_line, fit_val = fit_with_fixed_batch_raw(
+            single_exp_all, t_el, g2, sigma, bounds, [True] * 4, fit_x,
+            jac=jac)
+        for n in range(g2.shape[1]):
+            assert fit_line[n]['success']
+            popt, pcov = curve_fit(single_exp_all, t_el, g2[:, n],
+                                   p0=np.mean(bounds, axis=0),
+                                   sigma=sigma[:, n], bounds=bounds)
+            np.testing.assert_allclose(fit_val[n, 0], popt, rtol=1e-3)
+            np.testing.assert_allclose(fit_val[n, 1], np.sqrt(np.diag(pcov)),
+                                       rtol=2e-2)
+            np.testing.assert_allclose(fit_line[n]['fit_y'],
+                                       single_exp_all(fit_x, *fit_val[n, 0]))
+
+
+def test_batch_fixed_and_invalid():
+    t_el, g2, sigma, truth = make_g2(num_q=4)
+    g2[5, 3] = np.nan
+    flag = [True, True, False, False]
+    fit_line, fit_val = fit_with_fixed_batch_raw(
+        single_exp_all, t_el, g2, sigma, bounds, flag, t_el, verbose=False)
+    # the fixed arguments take the upper bounds
+    np.testing.assert_array_equal(fit_val[:3, 0, 2:], [[1.5, 1.05]] * 3)
+    assert np.all(fit_val[:3, 1, 2:] == 0)
+    for n in range(3):
+        assert fit_line[n]['success']
+        popt, _ = curve_fit(lambda x, a, b: single_exp_all(x, a, b, 1.5, 1.05),
+                            t_el, g2[:, n], p0=[0.5, 5],
+                            sigma=sigma[:, n], bounds=[[0.01, 1e-5], [1, 10]])
+        np.testing.assert_allclose(fit_val[n, 0, :2], popt, rtol=1e-3)
+
+    assert not fit_line[3]['success'] and fit_line[3]['stop'] == 'invalid'
+    assert np.all(fit_val[3, 1] == -1)
+
+
+def make_tauq(num_sets=5, seed=0):
+    rng = np.random.default_rng(seed)
+    q = np.linspace(0.002, 0.02, 12)
+    a = 10 ** rng.uniform(-8, -6, num_sets)
+    sigma = 0.05 * a[:, None] * q ** -2
+    tau = a[:, None] * q ** -2 + sigma * rng.standard_normal(sigma.shape)
+    return np.broadcast_to(q, tau.shape), tau, sigma
+
+
+def test_power_law_vs_curve_fit():
+    x, y, sigma = make_tauq()
+    tauq_bounds = [[1e-10, -4], [1e-4, 0]]
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma, tauq_bounds,
+                                            [True, True], x[0])
+    for n in range(x.shape[0]):
+        assert fit_line[n]['success']
+        # the same weighted least squares in log-log space
+        popt, pcov = curve_fit(lambda lx, la, b: la + b * lx, np.log(x[n]),
+                               np.log(y[n]), sigma=sigma[n] / y[n])
+        np.testing.assert_allclose(fit_val[n, 0], [np.exp(popt[0]), popt[1]],
+                                   rtol=1e-8)
+        err = np.sqrt(np.diag(pcov)) * [np.exp(popt[0]), 1]
+        np.testing.assert_allclose(fit_val[n, 1], err, rtol=1e-6)
+
+
+def test_power_law_bounds_and_padding():
+    x, y, sigma = make_tauq(num_sets=2)
+    # the padding of a shorter dataset has zero sigma
+    sigma[1, 8:] = 0
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma,
+                                            [[1e-10, -4], [1e-4, 0]],
+                                            [True, True], x[0])
+    ref = fit_power_law_batch(x[1:, :8], y[1:, :8], sigma[1:, :8],
+                              [[1e-10, -4], [1e-4, 0]], [True, True], x[0])
+    np.testing.assert_allclose(fit_val[1], ref[1][0])
+
+    # the active bound of the exponent is kept
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma,
+                                            [[1e-10, -4], [1e-4, -2.2]],
+                                            [True, True], x[0])
+    assert all([v['success'] for v in fit_line])
+    np.testing.assert_allclose(fit_val[:, 0, 1], -2.2, rtol=1e-6)
+
+
+def test_power_law_fixed_and_dof():
+    x, y, sigma = make_tauq(num_sets=2)
+    tauq_bounds = [[1e-10, -4], [1e-4, -2]]
+    # nothing is fitted; the values are the upper bounds
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma, tauq_bounds,
+                                            [False, False], x[0])
+    assert all([v['success'] for v in fit_line])
+    np.testing.assert_array_equal(fit_val[:, 0], [[1e-4, -2]] * 2)
+    np.testing.assert_array_equal(fit_val[:, 1], 0)
+    np.testing.assert_allclose(fit_line[0]['fit_y'], 1e-4 * x[0] ** -2)
+
+    # only the exponent is fitted
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma,
+                                            [[1e-10, -4], [1e-6, 0]],
+                                            [False, True], x[0])
+    assert all([v['success'] for v in fit_line])
+    np.testing.assert_array_equal(fit_val[:, 0, 0], 1e-6)
+    assert np.all(fit_val[:, 1, 0] == 0) and np.all(fit_val[:, 1, 1] > 0)
+
+    # two points for two variables; the errors can't be estimated
+    fit_line, fit_val = fit_power_law_batch(x[:, :2], y[:, :2],
+                                            sigma[:, :2], [[1e-10, -4],
+                                                           [1e-4, 0]],
+                                            [True, True], x[0])
+    assert not any([v['success'] for v in fit_line])
+    np.testing.assert_array_equal(fit_val[:, 1], -1)
+
+
+def get_chi2(func, x, y, sigma, fit_val):
+    return np.array([np.sum(((func(x, *fit_val[n, 0]) - y[:, n]) /
+                             sigma[:, n]) ** 2) for n in range(y.shape[1])])
+
+
+def test_multistart():
+    rng = np.random.default_rng(1)
+    t_el = np.logspace(-6, 2, 80)
+    num_q = 6
+    truth = [0.2, 10 ** rng.uniform(-5, -4, num_q), 1.0, 1.0,
+             10 ** rng.uniform(-1, 0, num_q), 1.0, 0.4]
+    sigma = np.full((t_el.size, num_q), 0.002)
+    g2 = double_exp_all(t_el[:, None], *truth) + \
+        sigma * rng.standard_normal(sigma.shape)
+    double_bounds = [[0.01, 1e-7, 0.5, 0.95, 1e-7, 0.5, 0],
+                     [1, 1e2, 1.5, 1.05, 1e2, 1.5, 1]]
+    flag = [True] * 7
+    args = (double_exp_all, t_el, g2, sigma, double_bounds, flag, t_el)
+
+    line1, val1 = fit_with_fixed_batch_raw(*args, jac=double_exp_all_jac,
+                                           verbose=False)
+    line, val = fit_with_fixed_multistart_raw(*args, jac=double_exp_all_jac,
+                                              num_starts=8)
+    chi2 = get_chi2(double_exp_all, t_el, g2, sigma, val)
+    chi2_1 = get_chi2(double_exp_all, t_el, g2, sigma, val1)
+    ok1 = np.array([x['success'] for x in line1])
+    assert np.all(chi2[ok1] <= chi2_1[ok1] * (1 + 1e-6))
+    for n in range(num_q):
+        assert line[n]['success'] and line[n]['num_starts'] == 8
+        np.testing.assert_allclose(line[n]['chi2'], chi2[n], rtol=1e-6)
+        # near the expected chi2 of the noise
+        assert chi2[n] < 2 * t_el.size
+
+    # the starts are reproducible
+    _, val2 = fit_with_fixed_multistart_raw(*args, jac=double_exp_all_jac,
+                                            num_starts=8)
+    np.testing.assert_array_equal(val2, val)
+
+
+def test_bootstrap():
+    t_el, g2, sigma, truth = make_g2(num_q=60, noise=0.01)
+    flag = [True] * 4
+    _, fit_val = fit_with_fixed_batch_raw(single_exp_all, t_el, g2, sigma,
+                                          bounds, flag, t_el,
+                                          jac=single_exp_all_jac)
+    fit_val[0, 1] = -1
+    args = (single_exp_all, t_el, sigma, bounds, flag, fit_val)
+    ci, num_ok = bootstrap_with_fixed_batch_raw(*args, num_samples=100,
+                                                jac=single_exp_all_jac)
+    # the failed columns are skipped
+    assert np.all(np.isnan(ci[0])) and num_ok[0] == 0
+    assert np.all(num_ok[1:] >= 95)
+    # the 95% intervals of tau cover the truth for most columns
+    cover = (ci[1:, 0, 1] <= truth[1:, 1]) & (truth[1:, 1] <= ci[1:, 1, 1])
+    assert np.mean(cover) > 0.85
+
+    ci2, _ = bootstrap_with_fixed_batch_raw(*args, num_samples=100,
+                                            jac=single_exp_all_jac)
+    np.testing.assert_array_equal(ci2, ci)
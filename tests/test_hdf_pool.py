@@ -0,0 +1,114 @@
+import threading
+
+import h5py
+import numpy as np
+
+from xpcs_viewer.fileIO.hdf_reader import HDF5ConnectionPool
+
+
+def make_files(path, num=4):
+    flist = []
+    for n in range(num):
+        fname = str(path / ('f%d.hdf' % n))
+        with h5py.File(fname, 'w') as f:
+            f['data'] = np.arange(10) + n
+        flist.append(fname)
+    return flist
+
+
+def test_handles_are_reused(tmp_path):
+    flist = make_files(tmp_path, 1)
+    pool = HDF5ConnectionPool()
+    with pool.open(flist[0]) as f:
+        fid = f.id
+    with pool.open(flist[0]) as f:
+        assert f.id == fid and f['data'][1] == 1
+    assert len(pool) == 1
+
+    # a handle closed elsewhere is opened again
+    f.close()
+    with pool.open(flist[0]) as f:
+        assert f.id.valid and f['data'][1] == 1
+
+
+def test_max_open(tmp_path):
+    flist = make_files(tmp_path)
+    pool = HDF5ConnectionPool(max_open=2)
+    for fname in flist:
+        with pool.open(fname) as f:
+            f['data'][()]
+    assert len(pool) == 2
+    pool.close(flist[-1])
+    assert len(pool) == 1
+    pool.close_all()
+    assert len(pool) == 0
+
+
+def test_handles_in_use_are_kept(tmp_path):
+    flist = make_files(tmp_path)
+    pool = HDF5ConnectionPool(max_open=2)
+    with pool.open(flist[0]) as f0:
+        for fname in flist[1:]:
+            with pool.open(fname) as f:
+                assert f.id.valid
+        # f0 is the least recently used one but it's being read
+        assert f0.id.valid and f0['data'][0] == 0
+    assert len(pool) == 2
+    pool.close_all()
+    assert len(pool) == 0
+
+
+def test_reads_are_not_serialized(tmp_path):
+    flist = make_files(tmp_path, 2)
+    pool = HDF5ConnectionPool()
+    reading = threading.Event()
+    done = threading.Event()
+
+    def slow_read():
+        with pool.open(flist[0]):
+            reading.set()
+            done.wait(5)
+
+    def read():
+        with pool.open(flist[1]) as f:
+            result.append(f['data'][0])
+
+    result = []
+    slow = threading.Thread(target=slow_read)
+    slow.start()
+    reading.wait(5)
+    # another file can be read while the first one is open
+    fast = threading.Thread(target=read)
+    fast.start()
+    fast.join(2)
+    finished = not fast.is_alive()
+    done.set()
+    slow.join()
+    fast.join()
+    assert finished and result == [1]
+
+
+def test_write_waits_for_readers(tmp_path):
+    fname = make_files(tmp_path, 1)[0]
+    pool = HDF5ConnectionPool()
+    errors = []
+
+    def read():
+        try:
+            for _ in range(50):
+                with pool.open(fname) as f:
+                    f['data'][()]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for n in range(10):
+        with pool.write(fname), h5py.File(fname, 'a') as f:
+            f['data'][0] = n
+    for t in threads:
+        t.join()
+    assert errors == []
+    with pool.open(fname) as f:
+        assert f['data'][0] == 9
@@ -0,0 +1,128 @@
+import os
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+import pytest
+
+from xpcs_viewer.fileIO import hdf_reader
+from xpcs_viewer.fileIO.hdf_reader import (close_file, get, probe_type,
+                                           read_selection)
+from xpcs_viewer.xpcs_file import XpcsFile
+
+
+mask = np.arange(12) % 3 == 0
+selections = [
+    None,
+    3,
+    -1,
+    (2, -3),
+    slice(2, 9),
+    slice(None, None, -1),
+    (slice(8, 1, -2), slice(None, None, -3)),
+    (slice(1, 4), 5),
+    (-2, slice(None, None, 2)),
+    [5, 1, 1, 7],
+    np.array([-1, 0, 3]),
+    (slice(None), [4, 0, 4]),
+    ([0, 2, 2], [1, 5, 3]),
+    (np.array([[0, 1], [3, 2]]), slice(2, 5)),
+    (np.array([[0, 1], [3, 2]]), np.array([[1], [2]])),
+    (1, [3, 0, 2]),
+    mask[:10],
+    (slice(2, 6), mask),
+    np.arange(120).reshape(10, 12) % 7 == 0,
+    Ellipsis,
+    (Ellipsis, 3),
+    (2, Ellipsis),
+    (Ellipsis, [1, 0, 1]),
+    ([2, 3], Ellipsis, slice(None, None, -1)),
+    (np.array([], dtype=int), slice(None)),
+]
+
+
+@pytest.fixture
+def dset():
+    with h5py.File('mem.hdf', 'w', driver='core',
+                   backing_store=False) as f:
+        f['data'] = np.arange(120.0).reshape(10, 12)
+        yield f['data']
+
+
+@pytest.mark.parametrize('selection', selections)
+def test_read_selection(dset, selection):
+    ref = dset[()]
+    expected = ref[()] if selection is None else ref[selection]
+    ret = read_selection(dset, selection)
+    assert np.shape(ret) == np.shape(expected)
+    np.testing.assert_array_equal(ret, expected)
+
+
+def test_read_partial(xpcs_files):
+    fname = xpcs_files[0]
+    cwd, fn = os.path.dirname(fname), os.path.basename(fname)
+    full = XpcsFile(fn, cwd)
+    for sel in [(slice(2, 9), slice(1, 4)), (slice(-3, None), 2),
+                ([5, 1, 1, 7], slice(None)), (slice(None, None, 2), [4, 0])]:
+        # the lazy files read the selection from the disk
+        lazy = XpcsFile(fn, cwd, lazy=True)
+        for key in ['g2', 'g2_err', 'g2_err_mod']:
+            np.testing.assert_array_equal(lazy.read_partial(key, sel),
+                                          full.at(key)[sel])
+            assert key not in lazy.__dict__
+        np.testing.assert_array_equal(full.read_partial('g2', sel),
+                                      full.g2[sel])
+
+    ret = get(fname, ['g2'], 'alias', slices={'g2': (slice(0, 3), 1)})
+    np.testing.assert_array_equal(ret['g2'], full.g2[0:3, 1])
+
+
+def test_probe_type(xpcs_files, monkeypatch):
+    fname = xpcs_files[0]
+    probed = []
+
+    def probe_handle(f):
+        probed.append(f.filename)
+        return ret(f)
+
+    ret = hdf_reader.probe_handle
+    monkeypatch.setattr(hdf_reader, 'probe_handle', probe_handle)
+    assert probe_type(fname) == ('legacy', 'Multitau')
+    assert probe_type(fname) == ('legacy', 'Multitau')
+    assert len(probed) == 1
+
+    # a changed mtime invalidates the entry
+    st = os.stat(fname)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert probe_type(fname) == ('legacy', 'Multitau')
+    assert len(probed) == 2
+
+    # so does a changed size; the analysis type is written in place
+    close_file(fname)
+    with h5py.File(fname, 'a') as f:
+        key = hdf_reader.hdf_key['legacy']['type']
+        del f[key]
+        f[key] = np.bytes_(b'Twotime')
+        f['extra'] = np.zeros(1000)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert probe_type(fname) == ('legacy', 'Twotime')
+    assert len(probed) == 3
+
+
+def test_probe_type_cache_size(xpcs_files, monkeypatch):
+    monkeypatch.setattr(hdf_reader, 'type_cache', OrderedDict())
+    monkeypatch.setattr(hdf_reader, 'type_cache_size', 2)
+    probed = []
+    ret = hdf_reader.probe_handle
+    monkeypatch.setattr(hdf_reader, 'probe_handle',
+                        lambda f: probed.append(f.filename) or ret(f))
+    for fname in xpcs_files[0:2] + xpcs_files[0:1] + xpcs_files[2:3]:
+        probe_type(fname)
+    assert len(hdf_reader.type_cache) == 2 and len(probed) == 3
+    # the second file is the least recently used one
+    probe_type(xpcs_files[0])
+    assert len(probed) == 3
+    probe_type(xpcs_files[1])
+    assert probed[-1] == xpcs_files[1] and len(probed) == 4
+
+    assert probe_type(fname + '.missing') == (False, None)
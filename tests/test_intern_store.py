@@ -0,0 +1,35 @@
+import gc
+
+import numpy as np
+
+from xpcs_viewer.helper.intern_store import ArrayInternStore
+
+
+def test_intern_same_content():
+    store = ArrayInternStore(min_size=16)
+    a = np.arange(100, dtype=np.float64)
+    b = np.arange(100, dtype=np.float64)
+    shared = store.intern(a)
+    assert shared is a and not a.flags.writeable
+    assert store.intern(b) is a
+    assert store.get_stats() == {'arrays': 1, 'hits': 1, 'saved': 800}
+
+    # the dtype and the shape are part of the key
+    assert store.intern(b.astype(np.float32)) is not a
+    assert store.intern(b.reshape(10, 10)) is not a
+
+
+def test_intern_skips_small_and_object_arrays():
+    store = ArrayInternStore(min_size=256)
+    small = np.arange(4)
+    assert store.intern(small) is small and small.flags.writeable
+    obj = np.array([None] * 100, dtype=object)
+    assert store.intern(obj) is obj
+    assert store.intern([1, 2]) == [1, 2]
+
+
+def test_release_unused_arrays():
+    store = ArrayInternStore(min_size=16)
+    store.intern(np.arange(100))
+    gc.collect()
+    assert store.get_stats()['arrays'] == 0
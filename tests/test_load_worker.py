@@ -0,0 +1,44 @@
+import os
+import threading
+
+from xpcs_viewer import load_worker
+from xpcs_viewer.load_worker import Prefetcher
+
+from .conftest import wait_for
+
+
+def test_prefetcher(qapp, xpcs_files):
+    cwd = os.path.dirname(xpcs_files[0])
+    flist = [os.path.basename(x) for x in xpcs_files]
+    loaded = []
+    prefetcher = Prefetcher()
+    # the files are sent to the gui thread
+    prefetcher.signals.loaded.connect(loaded.append)
+    prefetcher.submit(flist, cwd)
+    assert wait_for(qapp, lambda: len(loaded) == len(flist))
+    assert [x[0] for x in loaded] == flist
+    # the prefetched files are read completely
+    for fn, xf_obj in loaded:
+        assert xf_obj.fname == fn and xf_obj._lazy_fields == set()
+
+
+def test_prefetcher_cancel(qapp, monkeypatch):
+    started, resume = threading.Event(), threading.Event()
+
+    def load_file(fname, cwd, lazy):
+        if fname == 'a':
+            started.set()
+            resume.wait(5)
+        return fname
+
+    monkeypatch.setattr(load_worker, 'load_file', load_file)
+    loaded = []
+    prefetcher = Prefetcher()
+    prefetcher.signals.loaded.connect(lambda x: loaded.append(x[0]))
+    prefetcher.submit(['a', 'b', 'c'], '.')
+    assert started.wait(5)
+    # a new request drops the previous one, including the file being read
+    prefetcher.submit(['d'], '.')
+    resume.set()
+    assert wait_for(qapp, lambda: 'd' in loaded)
+    assert loaded == ['d']
@@ -0,0 +1,66 @@
+import numpy as np
+
+from xpcs_viewer.helper.lru_cache import LRUCache
+
+
+class Entry(object):
+    def __init__(self, size):
+        self.data = np.zeros(size, dtype=np.uint8)
+
+    def release(self):
+        self.data = np.zeros(0, dtype=np.uint8)
+
+
+def make_cache(max_size, release=True):
+    return LRUCache(max_size, sizeof=lambda x: x.data.nbytes,
+                    release=(lambda x: x.release()) if release else None)
+
+
+def test_evict_least_recently_used():
+    cache = make_cache(300, release=False)
+    for key in 'abc':
+        cache.put(key, Entry(100))
+    cache.get('a')
+    cache.put('d', Entry(100))
+    assert cache.keys() == ['c', 'a', 'd']
+    assert cache.size == 300
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_release_before_evict():
+    cache = make_cache(300)
+    for key in 'abc':
+        cache.put(key, Entry(100))
+    cache.put('d', Entry(100))
+    # the oldest entry frees its memory but stays in the cache
+    assert cache.keys() == ['a', 'b', 'c', 'd']
+    assert cache.sizes['a'] == 0 and cache.size == 300
+    assert 'a' in cache
+
+
+def test_update_size():
+    cache = make_cache(400)
+    for key in 'ab':
+        cache.put(key, Entry(100))
+    # the values grow after they are returned, eg. lazy fields
+    cache.get('a').data = np.zeros(150, dtype=np.uint8)
+    cache.get('b').data = np.zeros(150, dtype=np.uint8)
+    assert cache.size == 200
+    cache.update_size(['a', 'b'])
+    assert cache.size == 300
+
+    cache.put('c', Entry(10))
+    cache.get('c').data = np.zeros(150, dtype=np.uint8)
+    cache.update_size(['b', 'c'])
+    # the measured keys are kept, the others are released
+    assert cache.sizes == {'a': 0, 'b': 150, 'c': 150}
+
+
+def test_set_max_size_and_pop():
+    cache = make_cache(1000, release=False)
+    for key in 'abcd':
+        cache.put(key, Entry(100))
+    cache.set_max_size(250)
+    assert cache.keys() == ['c', 'd']
+    assert cache.pop('c').data.nbytes == 100
+    assert cache.size == 100 and cache.pop('c') is None
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from xpcs_viewer.fileIO import metadata_index
+from xpcs_viewer.fileIO.metadata_index import MetadataIndex
+
+
+def check_info(info):
+    assert info['ftype'] == 'legacy' and info['type'] == 'Multitau'
+    assert info['shape']['g2'] == [16, 5]
+    assert info['t0'] == pytest.approx(1e-3)
+    assert info['num_frames'] == 100
+
+
+def test_scan_in_parallel(tmp_path_factory, xpcs_files):
+    path = os.path.dirname(xpcs_files[0])
+    with open(os.path.join(path, 'notes.txt'), 'w') as f:
+        f.write('not an hdf file')
+    # the worker processes are used for two files or more
+    db_fname = str(tmp_path_factory.mktemp('db') / 'index.sqlite')
+    index = MetadataIndex(db_fname, max_workers=2, min_parallel=2)
+    result = index.scan(path)
+    assert result['notes.txt']['ftype'] is None
+    for fname in xpcs_files:
+        check_info(result[os.path.basename(fname)])
+
+
+def test_signature(tmp_path_factory, xpcs_files, monkeypatch):
+    path = os.path.dirname(xpcs_files[0])
+    db_fname = str(tmp_path_factory.mktemp('db') / 'index.sqlite')
+    MetadataIndex(db_fname, max_workers=1).scan(path)
+
+    read = []
+
+    def read_metadata(fname):
+        read.append(fname)
+        return {'ftype': None, 'type': None}
+
+    monkeypatch.setattr(metadata_index, 'read_metadata', read_metadata)
+    # a new session reads the index from the disk
+    index = MetadataIndex(db_fname, max_workers=1)
+    check_info(index.get(xpcs_files[0]))
+    index.scan(path)
+    assert read == []
+
+    # the changed files are read again
+    st = os.stat(xpcs_files[1])
+    os.utime(xpcs_files[1], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    index.clear()
+    result = index.scan(path)
+    assert read == [os.path.abspath(xpcs_files[1])]
+    assert result[os.path.basename(xpcs_files[1])]['ftype'] is None
+    check_info(index.get(xpcs_files[2]))
+    assert index.get(os.path.join(path, 'missing.hdf'))['ftype'] is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+from xpcs_viewer.helper.pixel_index import (PixelSum, compact_frame,
+                                            expand_frame)
+
+
+def make_frame(shape=(16, 20), seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.random(shape)
+    mask = (rng.random(shape) > 0.2).astype(np.int64)
+    return frame, mask
+
+
+def test_compact_frame():
+    frame, mask = make_frame()
+    pixel_index, values = compact_frame(frame, mask)
+    assert pixel_index.dtype == np.int32
+    assert np.all(np.diff(pixel_index) > 0)
+    np.testing.assert_array_equal(expand_frame(pixel_index, values,
+                                               frame.shape), frame * mask)
+
+
+def test_pixel_sum_compact():
+    frame, mask = make_frame()
+    pixel_index, values = compact_frame(frame, mask)
+    acc = PixelSum()
+    for _ in range(3):
+        assert acc.add(pixel_index, values, frame.shape)
+    # the sum stays compact while the pixels are the same
+    assert acc.pixel_index is pixel_index
+    np.testing.assert_allclose(acc.get(), 3 * frame * mask)
+
+
+def test_pixel_sum_mixed():
+    frame, mask = make_frame()
+    other, mask2 = make_frame(seed=1)
+    acc = PixelSum()
+    assert acc.add(*compact_frame(frame, mask), frame.shape)
+    assert acc.add(*compact_frame(other, mask2), frame.shape)
+    assert acc.add(None, frame.ravel(), frame.shape)
+    assert acc.pixel_index is None
+    np.testing.assert_allclose(acc.get(), frame * mask + other * mask2 +
+                               frame)
+    # a frame of another shape is rejected
+    assert not acc.add(None, np.ones(4), (2, 2))
+    assert PixelSum().get() is None
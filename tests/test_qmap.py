@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+from xpcs_viewer.helper.qmap import QMapCache, compute_qmap
+from xpcs_viewer.xpcs_file import XpcsFile
+
+
+geometry = ((64, 80), 40.0, 30.0, 4000.0, 10.0, 0.075, 0.075)
+
+
+def test_compute_qmap():
+    qmap = compute_qmap(*geometry)
+    assert qmap['q'].shape == (64, 80)
+    assert qmap['q'][30, 40] == 0 and qmap['r_pixel'][30, 40] == 0
+    np.testing.assert_allclose(qmap['r_pixel'][30, 50], 10)
+    # small angles; q = 4 * pi / wavelength * sin(theta / 2)
+    k0 = 2 * np.pi / (12.398 / 10.0)
+    np.testing.assert_allclose(qmap['q'][30, 50],
+                               2 * k0 * np.sin(np.arctan(0.75 / 4000) / 2))
+    assert qmap['phi'].min() >= 0 and qmap['phi'].max() <= 360
+
+
+def test_cache_hits_and_eviction():
+    cache = QMapCache(max_entries=2)
+    qmap = cache.get(*geometry)
+    assert cache.get(*geometry) is qmap
+    assert cache.hits == 1 and cache.misses == 1
+    # the maps are shared, so they can't be changed
+    with pytest.raises(ValueError):
+        qmap['q'][0, 0] = 1
+
+    cache.get((64, 80), 41.0, *geometry[2:])
+    cache.get((64, 80), 42.0, *geometry[2:])
+    assert len(cache.data) == 2
+    assert cache.get(*geometry) is not qmap
+    assert cache.misses == 4
+
+
+def test_float32():
+    cache = QMapCache()
+    ref = cache.get(*geometry)
+    cache.set_dtype(np.float32)
+    qmap = cache.get(*geometry)
+    assert qmap['q'].dtype == np.float32 and len(cache.data) == 1
+    np.testing.assert_allclose(qmap['q'], ref['q'], rtol=1e-6)
+
+
+def test_files_share_qmaps(xpcs_files):
+    xf_list = [XpcsFile(os.path.basename(x), os.path.dirname(x), lazy=True)
+               for x in xpcs_files[0:2]]
+    assert xf_list[0].compute_qmap() is xf_list[1].compute_qmap()
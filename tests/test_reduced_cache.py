@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from xpcs_viewer.fileIO.reduced_cache import ReducedDataCache
+
+
+def test_write_and_read(tmp_path):
+    cache = ReducedDataCache(str(tmp_path), enabled=True)
+    values = {'saxs_2d': np.arange(1000.0).reshape(20, 50),
+              'ql_sta': np.arange(10.0), 'label': 'a',
+              'saxs_1d': {'q': np.arange(500.0), 'num_lines': 1}}
+    cache.write('k', values)
+    ret = cache.read('k', list(values.keys()))
+    np.testing.assert_array_equal(ret['saxs_2d'], values['saxs_2d'])
+    assert isinstance(ret['saxs_2d'], np.memmap)
+    np.testing.assert_array_equal(ret['ql_sta'], values['ql_sta'])
+    np.testing.assert_array_equal(ret['saxs_1d']['q'], values['saxs_1d']['q'])
+    assert ret['label'] == 'a' and ret['saxs_1d']['num_lines'] == 1
+    assert cache.read('k', ['missing']) is None
+
+
+def test_overwrite_size(tmp_path):
+    cache = ReducedDataCache(str(tmp_path), enabled=True)
+    cache.evict()
+    for _ in range(5):
+        cache.write('k', {'saxs_2d': np.zeros(100000)})
+    size = sum([x.stat().st_size for x in os.scandir(str(tmp_path / 'k'))])
+    # the estimate doesn't count the overwritten arrays
+    assert abs(cache.size - size) < 1024
@@ -0,0 +1,174 @@
+import numpy as np
+
+from xpcs_viewer.helper.pixel_index import compact_frame
+from xpcs_viewer.helper.roi_operator import (build_pie_operator,
+                                             build_ring_operator,
+                                             build_cake_operator,
+                                             build_pie_bins, build_ring_bins,
+                                             get_q_edges, get_pie_ranges,
+                                             get_ring_profile)
+
+
+def make_geometry(shape=(64, 80), center=(30.5, 41.5), seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.indices(shape, dtype=np.float64)
+    dy, dx = yy - center[0], xx - center[1]
+    rmap = np.hypot(dx, dy)
+    pmap = np.rad2deg(np.arctan2(dy, dx)) % 360.0
+    qmap = rmap * 1e-4
+    mask = (rng.random(shape) > 0.1).astype(np.int64)
+    saxs_2d = rng.random(shape) * 10
+    return qmap, pmap, rmap, mask, saxs_2d
+
+
+def bincount_pie(qmap, pmap, mask, saxs_2d, sqspan, angle_range):
+    # the roi average before the operators were added
+    pmin, pmax = angle_range
+    pmap = pmap.copy()
+    if pmax < pmin:
+        pmax += 360.0
+        pmap[pmap < pmin] += 360.0
+    proi = np.logical_and(pmap >= pmin, pmap < pmax)
+    proi = np.logical_and(proi, (mask > 0))
+    qmap_idx = np.zeros_like(qmap, dtype=np.uint32)
+    qsize = len(sqspan) - 1
+    for n in range(qsize):
+        q0, q1 = sqspan[n: n + 2]
+        select = (qmap >= q0) * (qmap < q1)
+        qmap_idx[select] = n + 1
+    qmap_idx = (qmap_idx * proi).ravel()
+    saxs_roi = np.bincount(qmap_idx, saxs_2d.ravel(), minlength=qsize + 1)
+    saxs_nor = np.bincount(qmap_idx, minlength=qsize + 1)
+    saxs_nor[saxs_nor == 0] = 1.0
+    return (saxs_roi * 1.0 / saxs_nor)[1:]
+
+
+def bincount_ring(rmap, pmap, mask, saxs_2d, radius, phi_num):
+    rmin, rmax = radius
+    rroi = np.logical_and(rmap >= rmin, rmap < rmax)
+    rroi = np.logical_and(rroi, (mask > 0))
+    phi_min, phi_max = np.min(pmap[rroi]), np.max(pmap[rroi])
+    x = np.linspace(phi_min, phi_max, phi_num)
+    delta = (phi_max - phi_min) / phi_num
+    index = ((pmap - phi_min) / delta).astype(np.int64)
+    index[index == phi_num] = phi_num - 1
+    index += 1
+    index = (index * rroi).ravel()
+    saxs_roi = np.bincount(index, saxs_2d.ravel(), minlength=phi_num + 1)
+    saxs_nor = np.bincount(index, minlength=phi_num + 1)
+    saxs_nor[saxs_nor == 0] = 1.0
+    return x, (saxs_roi * 1.0 / saxs_nor)[1:]
+
+
+def test_pie_operator():
+    qmap, pmap, _, mask, saxs_2d = make_geometry()
+    sqspan = np.linspace(0, 0.005, 21)
+    for angle_range in [(10, 80), (300, 30), (0, 360)]:
+        op = build_pie_operator(qmap, pmap, mask, sqspan, angle_range)
+        ref = bincount_pie(qmap, pmap, mask, saxs_2d, sqspan, angle_range)
+        np.testing.assert_allclose(op.apply(saxs_2d), ref, rtol=1e-12)
+
+
+def test_ring_operator():
+    qmap, pmap, rmap, mask, saxs_2d = make_geometry()
+    for radius in [(5, 15), (20, 12)]:
+        op = build_ring_operator(rmap, pmap, mask, radius, phi_num=90)
+        x, ref = bincount_ring(rmap, pmap, mask, saxs_2d, sorted(radius), 90)
+        np.testing.assert_allclose(op.x, x)
+        np.testing.assert_allclose(op.apply(saxs_2d), ref, rtol=1e-12)
+
+
+def test_operator_on_frames_and_compact_pixels():
+    qmap, pmap, _, mask, saxs_2d = make_geometry()
+    sqspan = np.linspace(0, 0.005, 11)
+    op = build_pie_operator(qmap, pmap, mask, sqspan, (0, 180))
+    frames = np.stack([saxs_2d.ravel(), 2 * saxs_2d.ravel()], axis=1)
+    ret = op.apply(frames)
+    assert ret.shape == (10, 2)
+    np.testing.assert_allclose(ret[:, 1], 2 * op.apply(saxs_2d))
+
+    # the compact frames keep the pixels of the mask, times the mask
+    pixel_index, values = compact_frame(saxs_2d, mask)
+    np.testing.assert_allclose(op.apply(values, pixel_index),
+                               op.apply(saxs_2d))
+
+
+def test_sorted_pie_bins():
+    qmap, pmap, _, mask, saxs_2d = make_geometry()
+    sqspan = np.linspace(0, 0.005, 21)
+    bins = build_pie_bins(qmap, pmap, mask, sqspan)
+    cum = bins.prefix(saxs_2d)
+    for angle_range in [(10, 80), (300, 30), (0, 360)]:
+        ref = bincount_pie(qmap, pmap, mask, saxs_2d, sqspan, angle_range)
+        ret = bins.average(cum, get_pie_ranges(angle_range))
+        np.testing.assert_allclose(ret, ref, rtol=1e-9)
+
+    pixel_index, values = compact_frame(saxs_2d, mask)
+    np.testing.assert_allclose(bins.prefix(values, pixel_index), cum)
+
+
+def test_sorted_ring_bins():
+    _, pmap, rmap, mask, saxs_2d = make_geometry()
+    bins = build_ring_bins(rmap, pmap, mask, num_fine=720)
+    cum = bins.prefix(saxs_2d)
+    radius = (5, 15)
+    total, count = bins.query(cum, *radius)
+    roi = (rmap >= radius[0]) & (rmap < radius[1]) & (mask > 0)
+    assert np.sum(count) == np.sum(roi)
+    np.testing.assert_allclose(np.sum(total), np.sum(saxs_2d[roi]))
+
+    # the profile matches the exact one up to the size of one fine bin
+    x, y = get_ring_profile(bins, cum, radius, phi_num=90)
+    op = build_ring_operator(rmap, pmap, mask, radius, phi_num=90)
+    assert np.max(np.abs(x - op.x)) <= 360.0 / 720
+    weight = op.count / np.sum(op.count)
+    ref = op.apply(saxs_2d)
+    np.testing.assert_allclose(np.sum(y * weight), np.sum(ref * weight),
+                               rtol=0.05)
+
+
+def loop_cake(qmap, pmap, mask, saxs_2d, q_edges, phi_num):
+    q_num = len(q_edges) - 1
+    cake = np.zeros((phi_num, q_num))
+    for i in range(phi_num):
+        psel = (pmap >= 360.0 * i / phi_num) & \
+            (pmap < 360.0 * (i + 1) / phi_num)
+        for j in range(q_num):
+            qsel = (qmap >= q_edges[j]) & (qmap < q_edges[j + 1])
+            if j == q_num - 1:
+                qsel |= qmap == q_edges[-1]
+            sel = psel & qsel & (mask > 0)
+            if np.any(sel):
+                cake[i, j] = np.mean(saxs_2d[sel])
+    return cake
+
+
+def test_cake_operator():
+    qmap, pmap, _, mask, saxs_2d = make_geometry()
+    q_edges = get_q_edges(qmap, mask, 16)
+    op = build_cake_operator(qmap, pmap, mask, q_edges, phi_num=12)
+    cake = op.apply(saxs_2d).reshape(12, 16)
+    ref = loop_cake(qmap, pmap, mask, saxs_2d, q_edges, 12)
+    np.testing.assert_allclose(cake, ref, rtol=1e-12)
+    # all the valid pixels are used once
+    assert np.sum(op.count) == np.sum(mask > 0)
+
+
+def test_log_partition():
+    qmap, pmap, _, mask, saxs_2d = make_geometry()
+    q_edges = get_q_edges(qmap, mask, 10, q_scale='log')
+    assert q_edges[0] > 0
+    np.testing.assert_allclose(np.diff(np.log(q_edges)),
+                               np.log(q_edges[1] / q_edges[0]))
+    op = build_cake_operator(qmap, pmap, mask, q_edges, phi_num=1,
+                             q_scale='log')
+    ref = loop_cake(qmap, pmap, mask, saxs_2d, q_edges, 1)[0]
+    np.testing.assert_allclose(op.apply(saxs_2d), ref, rtol=1e-12)
+    np.testing.assert_allclose(op.x[0], np.sqrt(q_edges[1:] * q_edges[:-1]))
+
+    # the pixel-weighted average of the sectors is the full average
+    sectors = build_cake_operator(qmap, pmap, mask, q_edges, phi_num=6,
+                                  q_scale='log')
+    count = sectors.count.reshape(6, 10)
+    total = np.sum(sectors.apply(saxs_2d).reshape(6, 10) * count, axis=0)
+    np.testing.assert_allclose(total / np.sum(count, axis=0), ref)
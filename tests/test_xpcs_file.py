@@ -0,0 +1,54 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+
+from xpcs_viewer.xpcs_file import XpcsFile
+
+
+def open_file(fname, **kwargs):
+    return XpcsFile(os.path.basename(fname), os.path.dirname(fname),
+                    **kwargs)
+
+
+def assert_same(a, b):
+    if isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            assert_same(a[key], b[key])
+    elif isinstance(a, np.ndarray):
+        np.testing.assert_array_equal(a, b)
+    else:
+        assert a == b
+
+
+def test_lazy_fields(xpcs_files):
+    eager = open_file(xpcs_files[0])
+    lazy = open_file(xpcs_files[0], lazy=True)
+    assert set(lazy.keys) == set(eager.keys)
+    assert eager._lazy_fields == set()
+    # only the metadata is read when the file is opened
+    for key in ['saxs_2d', 'g2', 'g2_err_mod', 'Int_t', 'dqmap']:
+        assert key in lazy._lazy_fields and key not in lazy.__dict__
+    assert lazy.t0 == eager.t0 and lazy.snoq == eager.snoq
+
+    # a field is read with the other fields of its group
+    assert_same(lazy.g2, eager.g2)
+    assert 'g2_err_mod' in lazy.__dict__
+    assert 'g2' not in lazy._lazy_fields
+    assert 'saxs_2d' not in lazy.__dict__
+
+    for key in eager.keys:
+        assert_same(lazy.at(key), eager.at(key))
+    assert lazy._lazy_fields == set()
+
+
+def test_lazy_copy_and_missing(xpcs_files):
+    lazy = open_file(xpcs_files[0], lazy=True)
+    with pytest.raises(KeyError):
+        lazy.not_a_field
+    # the special methods aren't looked up as fields
+    assert not hasattr(lazy, '__not_a_method__')
+    other = copy.deepcopy(lazy)
+    np.testing.assert_array_equal(other.saxs_2d, lazy.saxs_2d)
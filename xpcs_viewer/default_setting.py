@@ -1,4 +1,13 @@
 setting = {
   "window_size_w": 1024,
-  "window_size_h": 800
+  "window_size_h": 800,
+  "cache_size_gb": 2,
+  "qmap_float32": False,
+  "reduced_cache": False,
+  "reduced_cache_size_gb": 8,
+  "compact_saxs2d": False,
+  "fit_cache_size_mb": 64,
+  "fit_cache_disk_size_mb": 256,
+  "g2_bootstrap_samples": 0,
+  "g2_bootstrap_level": 0.95
 }
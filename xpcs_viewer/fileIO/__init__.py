@@ -1,5 +1,5 @@
 from .hdf_to_str import get_hdf_info
-from .hdf_reader import get, put, get_type
+from .hdf_reader import get, put, get_type, probe_type, close_file
 
-__all__ = [get_hdf_info, get, put, get_type]
+__all__ = [get_hdf_info, get, put, get_type, probe_type, close_file]
 
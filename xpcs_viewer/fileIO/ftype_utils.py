@@ -4,21 +4,28 @@ import sys
 import os
 
 
-def isNeXusFile(fname):
+def _has_key(fname, key):
+    # fname can either be a file name or an opened h5py.File handle
+    if isinstance(fname, h5py.File):
+        return key in fname
     with h5py.File(fname, "r") as f:
-        if "/entry/instrument/bluesky/metadata/" in f:
-            return True
+        return key in f
+
+
+def isNeXusFile(fname):
+    if _has_key(fname, "/entry/instrument/bluesky/metadata/"):
+        return True
     return False
 
 
 def isLegacyFile(fname):
-    with h5py.File(fname, "r") as f:
-        if "/xpcs/Version" in f:
-            return True
+    if _has_key(fname, "/xpcs/Version"):
+        return True
 
 
-def get_ftype(fname: str):
-    if not os.path.isfile(fname):
+def get_ftype(fname):
+    # an opened handle is known to exist
+    if not isinstance(fname, h5py.File) and not os.path.isfile(fname):
         return False
 
     if isLegacyFile(fname):
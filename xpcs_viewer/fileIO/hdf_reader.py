@@ -3,7 +3,10 @@ import os
 import numpy as np
 import json
 import logging
-from .ftype_utils import get_ftype
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from .ftype_utils import get_ftype as _get_ftype
 
 
 logger = logging.getLogger(__name__)
@@ -37,8 +40,137 @@ colors = ['r', 'g', 'b', 'c', 'm', 'y', 'k']
 symbols = ['o', 's', 't', 'd', '+']
 
 
+class HDF5ConnectionPool(object):
+    """
+    a LRU pool of read-only h5py.File handles; opening a file on network
+    file systems (GPFS/NFS) is expensive, so the handles are kept open and
+    shared by all the readers in this module;
+    """
+    def __init__(self, max_open=32):
+        self.max_open = max_open
+        # abspath: [handle, number of readers using it]
+        self.pool = OrderedDict()
+        # the lock only protects the pool, not the reading; h5py serializes
+        # the access to hdf5 itself. a handle that is closed while being read
+        # is closed by its last reader
+        self.lock = threading.RLock()
+        self.released = threading.Condition(self.lock)
+        # the files being written; they can't be opened until it's done
+        self.writing = set()
+
+    @contextmanager
+    def open(self, fname):
+        """
+        yield an opened h5py.File handle for fname; the handle must not be
+        closed by the caller;
+        """
+        key = os.path.abspath(fname)
+        with self.lock:
+            while key in self.writing:
+                self.released.wait()
+            entry = self.pool.get(key, None)
+            # the handle may be closed by others, eg. h5py.File.close()
+            if entry is not None and not entry[0].id.valid:
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                entry = [h5py.File(key, 'r'), 1]
+                self.pool[key] = entry
+                self._shrink()
+            else:
+                self.pool.move_to_end(key)
+                entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0 and self.pool.get(key, None) is not entry:
+                    self._close_handle(entry[0])
+                self.released.notify_all()
+
+    @contextmanager
+    def write(self, fname):
+        """
+        close the handle of fname and keep the file from being opened, so it
+        can be written by the caller
+        """
+        key = os.path.abspath(fname)
+        with self.lock:
+            while key in self.writing:
+                self.released.wait()
+            self.writing.add(key)
+            self._drop(key, wait=True)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.writing.discard(key)
+                self.released.notify_all()
+
+    def _drop(self, key, wait=False):
+        # remove the handle from the pool; it's closed now if it's not in
+        # use, or else by its last reader
+        entry = self.pool.pop(key, None)
+        if entry is None:
+            return
+        if entry[1] == 0:
+            self._close_handle(entry[0])
+        # eg. before writing to the file
+        while wait and entry[1] > 0:
+            self.released.wait()
+
+    def _shrink(self):
+        # the handles in use are kept, so a file has one handle at most
+        idle = [k for k, v in self.pool.items() if v[1] == 0]
+        for key in idle[:max(0, len(self.pool) - self.max_open)]:
+            self._drop(key)
+
+    @staticmethod
+    def _close_handle(hdl):
+        try:
+            hdl.close()
+        except Exception as e:
+            logger.info('failed to close hdf handle: %s', e)
+
+    def set_max_open(self, max_open):
+        with self.lock:
+            self.max_open = max(1, int(max_open))
+            self._shrink()
+
+    def close(self, fname):
+        """
+        close the handle of fname; it waits for the readers of the file
+        """
+        with self.lock:
+            self._drop(os.path.abspath(fname), wait=True)
+
+    def close_all(self):
+        with self.lock:
+            for key in list(self.pool.keys()):
+                self._drop(key, wait=True)
+
+    def __len__(self):
+        return len(self.pool)
+
+
+hdf_pool = HDF5ConnectionPool()
+
+
+def close_file(fname=None):
+    """
+    release the pooled handle for fname; release all handles if fname is None
+    """
+    if fname is None:
+        hdf_pool.close_all()
+    else:
+        hdf_pool.close(fname)
+
+
 def put(save_path, result, ftype='legacy', mode='raw'):
-    with h5py.File(save_path, 'a') as f:
+    # a read-only handle in the pool would block writing to the same file
+    with hdf_pool.write(save_path), h5py.File(save_path, 'a') as f:
         for key, val in result.items():
             if mode == 'alias':
                 key = hdf_key[ftype][key]
@@ -52,14 +184,92 @@ def put(save_path, result, ftype='legacy', mode='raw'):
 
 def get_abs_cs_scale(fname, ftype='legacy'):
     key = hdf_key[ftype]['abs_cross_section_scale']
-    with h5py.File(fname, 'r') as f:
+    with hdf_pool.open(fname) as f:
         if key not in f:
             return None
         else:
             return float(f[key][()])
 
 
-def get(fname, fields, mode='raw', ret_type='dict', ftype='legacy'):
+def read_selection(dset, selection=None):
+    """
+    read a part of a h5py dataset; only the selected elements are read from
+    the disk;
+    :param dset: h5py dataset
+    :param selection: an index, a slice, an index array, a boolean mask,
+        Ellipsis or a tuple of them, applied as on a numpy.ndarray;
+    :return: numpy.ndarray or scalar
+    """
+    if selection is None:
+        return dset[()]
+
+    if not isinstance(selection, tuple):
+        selection = (selection, )
+
+    # a boolean mask selects its nonzero indices on the axes it covers
+    sel = []
+    for x in selection:
+        if isinstance(x, (list, np.ndarray)) and np.asarray(x).dtype == bool:
+            sel.extend(np.nonzero(x))
+        else:
+            sel.append(x)
+
+    is_ellipsis = [x is Ellipsis for x in sel]
+    if sum(is_ellipsis) > 1:
+        raise IndexError('an index can only have a single ellipsis')
+    elif sum(is_ellipsis) == 1:
+        pos = is_ellipsis.index(True)
+        fill = [slice(None)] * (len(dset.shape) - len(sel) + 1)
+        sel = sel[:pos] + fill + sel[pos + 1:]
+
+    # h5py only accepts increasing slices and one increasing index list; an
+    # index array is read as sorted unique indices, or as a bounding slice
+    # if there are other index arrays or integers; the result is then
+    # re-arranged with numpy indexing
+    num_array = sum([not isinstance(x, (int, np.integer, slice))
+                     for x in sel])
+    num_int = sum([isinstance(x, (int, np.integer)) for x in sel])
+    use_unique = num_array == 1 and num_int == 0
+
+    disk_sel, post_sel = [], []
+    for axis, x in enumerate(sel):
+        if isinstance(x, (int, np.integer)):
+            x = x + dset.shape[axis] if x < 0 else x
+            disk_sel.append(slice(x, x + 1))
+            post_sel.append(0)
+        elif isinstance(x, slice):
+            start, stop, step = x.indices(dset.shape[axis])
+            if step > 0:
+                disk_sel.append(slice(start, stop, step))
+                post_sel.append(slice(None))
+                continue
+            # read a negative step slice in increasing order and reverse it
+            idx = range(start, stop, step)
+            if len(idx) == 0:
+                disk_sel.append(slice(0, 0))
+            else:
+                disk_sel.append(slice(idx[-1], idx[0] + 1, -step))
+            post_sel.append(slice(None, None, -1))
+        else:
+            x = np.asarray(x)
+            x = np.where(x < 0, x + dset.shape[axis], x).astype(np.int64)
+            if x.size == 0:
+                disk_sel.append(slice(0, 0))
+                post_sel.append(x)
+            elif use_unique:
+                uniq, inverse = np.unique(x, return_inverse=True)
+                disk_sel.append(uniq)
+                post_sel.append(inverse.reshape(x.shape))
+            else:
+                x_min = int(np.min(x))
+                disk_sel.append(slice(x_min, int(np.max(x)) + 1))
+                post_sel.append(x - x_min)
+
+    return dset[tuple(disk_sel)][tuple(post_sel)]
+
+
+def get(fname, fields, mode='raw', ret_type='dict', ftype='legacy',
+        slices=None):
     """
     get the values for the various keys listed in fields for a single
     file;
@@ -68,11 +278,16 @@ def get(fname, fields, mode='raw', ret_type='dict', ftype='legacy'):
     :param mode: ['raw' | 'alias']; alias is defined in .hdf_key
                  otherwise the raw hdf key will be used
     :param ret_type: return dictonary if 'dict', list if it is 'list'
+    :param slices: dictionary of {key: selection}; the selection is applied
+        to the dataset as it is saved in the file, before squeezing, so only
+        the selected part is read from the disk. see read_selection;
     :return: dictionary or dictionary;
     """
     ret = {}
+    if slices is None:
+        slices = {}
 
-    with h5py.File(fname, 'r') as HDF_Result:
+    with hdf_pool.open(fname) as HDF_Result:
         for key in fields:
             if mode == 'alias':
                 key2 = hdf_key[ftype][key]
@@ -84,11 +299,13 @@ def get(fname, fields, mode='raw', ret_type='dict', ftype='legacy'):
             if key2 not in HDF_Result:
                 logger.error('key not found: %s', key2)
                 raise ValueError('key not found: %s', key2)
-            elif 'C2T_all' in key2:
+
+            dset = HDF_Result.get(key2)
+            if 'C2T_all' in key2 and not isinstance(dset, h5py.Dataset):
                 # C2T_allxxx has to be converted by numpy.array
-                val = np.array(HDF_Result.get(key2))
+                val = np.array(dset)
             else:
-                val = HDF_Result.get(key2)[()]
+                val = read_selection(dset, slices.get(key, None))
 
             if type(val) == np.ndarray:
                 # get rid of length=1 axies;
@@ -113,16 +330,87 @@ def get(fname, fields, mode='raw', ret_type='dict', ftype='legacy'):
         raise TypeError('ret_type not support')
 
 
-def get_type(fname):
-    ftype = get_ftype(fname)
+def probe_handle(f):
+    """
+    detect the file format and the analysis type from an opened hdf handle
+    :param f: h5py.File handle
+    :return: tuple of (ftype, analysis type); ftype is False if the format
+        is not supported; analysis type is None if it can't be decided.
+    """
+    ftype = _get_ftype(f)
+    atype = None
+    if ftype == 'nexus':
+        atype = 'Multitau'
+    elif ftype:
+        key = hdf_key[ftype]['type']
+        if key in f and isinstance(f[key], h5py.Dataset):
+            val = f[key][()]
+            if isinstance(val, np.ndarray) and val.size > 0:
+                val = val.ravel()[0]
+            if isinstance(val, (np.bytes_, bytes)):
+                val = val.decode()
+            if isinstance(val, str):
+                atype = val.capitalize()
+    return ftype, atype
+
+
+# cache of probe_type; (device, inode, mtime, size) -> (ftype, type); the
+# least recently used entries are dropped when it has type_cache_size entries
+type_cache = OrderedDict()
+type_cache_size = 16384
+type_cache_lock = threading.Lock()
+
+
+def probe_type(fname):
+    """
+    get the file format and the analysis type with a single open; the results
+    are cached until the file is changed.
+    :param fname: path to the hdf file
+    :return: tuple of (ftype, analysis type), see probe_handle
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return False, None
+    if not os.path.isfile(fname):
+        return False, None
+
+    sig = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    with type_cache_lock:
+        if sig in type_cache:
+            type_cache.move_to_end(sig)
+            return type_cache[sig]
+
     try:
-        ret = get(fname, ['type'], mode='alias', ftype=ftype)['type']
-        ret = ret.capitalize()
-    except:
-        ret = None
+        with hdf_pool.open(fname) as f:
+            ret = probe_handle(f)
+    except Exception as e:
+        logger.info('failed to get the type of %s: %s', fname, e)
+        ret = (False, None)
+
+    with type_cache_lock:
+        type_cache[sig] = ret
+        while len(type_cache) > type_cache_size:
+            type_cache.popitem(last=False)
     return ret
 
 
+def get_ftype(fname):
+    return probe_type(fname)[0]
+
+
+def get_keys(fname, path='/'):
+    """
+    get the list of member names of a group in the hdf file
+    """
+    with hdf_pool.open(fname) as f:
+        return list(f[path].keys())
+
+
+def get_type(fname):
+    return probe_type(fname)[1]
+
+
 def create_id(fname):
     x = os.path.basename(fname)
     idx_1 = x.find('_')
@@ -3,6 +3,7 @@ import numpy as np
 from scipy.stats import describe
 import os
 import warnings
+from .hdf_reader import hdf_pool
 # warnings.filterwarnings("error")
 
 np.set_printoptions(precision=3, suppress=True)
@@ -98,7 +99,7 @@ def read_h5py(hdl, path, level, guide_str0):
 
 
 def get_hdf_info(path, fname):
-    with h5py.File(os.path.join(path, fname), 'r') as hdl:
+    with hdf_pool.open(os.path.join(path, fname)) as hdl:
         res = read_h5py(hdl, '.', 0, '')
     return res
 
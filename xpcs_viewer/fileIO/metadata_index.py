@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import h5py
+import numpy as np
+from .hdf_reader import hdf_key, home_dir, probe_handle
+
+
+logger = logging.getLogger(__name__)
+
+index_fname = os.path.join(home_dir, 'metadata_index.sqlite')
+
+# scalar metadata saved in the index
+scalar_fields = ['bcx', 'bcy', 'det_dist', 'X_energy', 'pix_dim_x',
+                 'pix_dim_y', 't0', 'avg_frames', 'stride_frames']
+# only the shapes of these datasets are saved
+shape_fields = ['ql_sta', 'ql_dyn', 'saxs_2d', 'Int_t', 'g2']
+
+
+def get_signature(fname):
+    """
+    the signature to tell whether a file has changed since it was indexed
+    """
+    st = os.stat(fname)
+    return st.st_mtime, st.st_size
+
+
+def read_metadata(fname):
+    """
+    read the metadata of one xpcs file; the file is opened once. this function
+    runs in the worker processes, so it doesn't use the shared handle pool;
+    :param fname: full path of the file
+    :return: a json-serializable dictionary
+    """
+    ret = {'ftype': None, 'type': None}
+    try:
+        with h5py.File(fname, 'r') as f:
+            ftype, atype = probe_handle(f)
+            if ftype is False:
+                return ret
+            ret['ftype'] = ftype
+            ret['type'] = atype
+            key = hdf_key[ftype]
+
+            for x in scalar_fields:
+                if key[x] in f:
+                    ret[x] = float(np.ravel(f[key[x]][()])[0])
+
+            shape = {}
+            for x in shape_fields:
+                if key[x] in f and isinstance(f[key[x]], h5py.Dataset):
+                    shape[x] = list(f[key[x]].shape)
+            ret['shape'] = shape
+    except Exception as e:
+        logger.info('failed to read metadata from %s: %s', fname, e)
+        return ret
+
+    if 't0' in ret:
+        # same as XpcsFile.t0; in seconds
+        ret['t0'] = ret['t0'] * ret.get('avg_frames', 1) * \
+            ret.get('stride_frames', 1)
+    if 'Int_t' in ret['shape']:
+        ret['num_frames'] = ret['shape']['Int_t'][-1]
+
+    return ret
+
+
+class MetadataIndex(object):
+    """
+    an on-disk index of the xpcs file metadata, keyed by the full path; an
+    entry is valid as long as the file's mtime and size are unchanged.
+    """
+    def __init__(self, db_fname=None, max_workers=None, min_parallel=512):
+        if db_fname is None:
+            db_fname = index_fname
+        self.db_fname = db_fname
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1) - 1)
+        self.max_workers = max_workers
+        # starting the worker processes takes a few seconds; use them only
+        # when there are many files to read
+        self.min_parallel = min_parallel
+        # records in memory: full_path -> (mtime, size, info)
+        self.records = {}
+        self.lock = threading.Lock()
+        self.scan_thread = None
+        self._init_db()
+
+    def _connect(self):
+        # sqlite connections can't be shared between threads
+        return sqlite3.connect(self.db_fname, timeout=30)
+
+    def _init_db(self):
+        try:
+            with self._connect() as con:
+                con.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                            'path TEXT PRIMARY KEY, dir TEXT, mtime REAL, '
+                            'size INTEGER, info TEXT)')
+                con.execute('CREATE INDEX IF NOT EXISTS idx_dir '
+                            'ON metadata (dir)')
+        except sqlite3.Error as e:
+            logger.error('failed to create the metadata index: %s', e)
+
+    def _load_dir(self, path):
+        records = {}
+        try:
+            with self._connect() as con:
+                cur = con.execute('SELECT path, mtime, size, info FROM '
+                                  'metadata WHERE dir = ?', (path, ))
+                for fname, mtime, size, info in cur:
+                    records[fname] = (mtime, size, json.loads(info))
+        except (sqlite3.Error, ValueError) as e:
+            logger.error('failed to read the metadata index: %s', e)
+        return records
+
+    def _load_one(self, fname):
+        try:
+            with self._connect() as con:
+                row = con.execute('SELECT mtime, size, info FROM metadata '
+                                  'WHERE path = ?', (fname, )).fetchone()
+        except sqlite3.Error as e:
+            logger.error('failed to read the metadata index: %s', e)
+            return None
+        if row is None:
+            return None
+        return (row[0], row[1], json.loads(row[2]))
+
+    def _save(self, records):
+        rows = [(fname, os.path.dirname(fname), mtime, size, json.dumps(info))
+                for fname, (mtime, size, info) in records.items()]
+        try:
+            with self._connect() as con:
+                con.executemany('INSERT OR REPLACE INTO metadata VALUES '
+                                '(?, ?, ?, ?, ?)', rows)
+        except sqlite3.Error as e:
+            logger.error('failed to update the metadata index: %s', e)
+
+    def _read_many(self, flist):
+        if len(flist) < self.min_parallel or self.max_workers <= 1:
+            return [read_metadata(x) for x in flist]
+        # spawn the workers; forking a process with opened hdf5 files and
+        # running threads is not safe
+        ctx = multiprocessing.get_context('spawn')
+        chunksize = max(1, len(flist) // (self.max_workers * 8))
+        try:
+            with ProcessPoolExecutor(self.max_workers,
+                                     mp_context=ctx) as pool:
+                return list(pool.map(read_metadata, flist,
+                                     chunksize=chunksize))
+        except Exception as e:
+            logger.error('parallel indexing failed, fall back to serial '
+                         'reading: %s', e)
+            return [read_metadata(x) for x in flist]
+
+    def scan(self, path, flist=None):
+        """
+        make sure the files in a directory are indexed; the files that are
+        new or changed are read in parallel;
+        :param path: the directory
+        :param flist: list of filenames in the directory; if None, all the
+            files in the directory are scanned
+        :return: dictionary of {filename: metadata}
+        """
+        t0 = time.perf_counter()
+        path = os.path.abspath(path)
+        if flist is None:
+            flist = [x for x in os.listdir(path) if not x.startswith('.')]
+
+        known = self._load_dir(path)
+        result, stale, signature = {}, [], {}
+        for x in flist:
+            fname = os.path.join(path, x)
+            try:
+                sig = get_signature(fname)
+            except OSError:
+                continue
+            record = known.get(fname, None)
+            if record is not None and tuple(record[0:2]) == sig:
+                result[fname] = record
+            else:
+                stale.append(fname)
+                signature[fname] = sig
+
+        new_records = {}
+        for fname, info in zip(stale, self._read_many(stale)):
+            new_records[fname] = (*signature[fname], info)
+        if len(new_records) > 0:
+            self._save(new_records)
+        result.update(new_records)
+
+        with self.lock:
+            self.records.update(result)
+
+        logger.info('indexed %d files (%d updated) in %.2f s', len(result),
+                    len(stale), time.perf_counter() - t0)
+        return {os.path.basename(k): v[2] for k, v in result.items()}
+
+    def scan_async(self, path, flist=None):
+        """
+        index the directory in a background thread
+        """
+        self.scan_thread = threading.Thread(target=self.scan,
+                                            args=(path, flist),
+                                            daemon=True)
+        self.scan_thread.start()
+
+    def get(self, fname):
+        """
+        get the metadata for one file; the file is read if it isn't indexed
+        or has been changed since the last scan.
+        """
+        fname = os.path.abspath(fname)
+        with self.lock:
+            record = self.records.get(fname, None)
+        if record is not None:
+            return record[2]
+
+        try:
+            sig = get_signature(fname)
+        except OSError:
+            return {'ftype': None, 'type': None}
+
+        record = self._load_one(fname)
+        if record is None or tuple(record[0:2]) != sig:
+            record = (*sig, read_metadata(fname))
+            self._save({fname: record})
+
+        with self.lock:
+            self.records[fname] = record
+        return record[2]
+
+    def clear(self):
+        """
+        clear the records in memory so the signatures are checked again
+        """
+        with self.lock:
+            self.records.clear()
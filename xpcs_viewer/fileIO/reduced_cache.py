@@ -0,0 +1,222 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import numpy as np
+from .hdf_reader import home_dir
+
+
+logger = logging.getLogger(__name__)
+
+# change the version if the post-processing in XpcsFile changes
+cache_version = '1'
+# arrays smaller than this (in bytes) are saved in the manifest
+inline_size = 1024
+
+
+class ReducedDataCache(object):
+    """
+    an on-disk cache of the post-processed XpcsFile fields; each source file
+    has one entry directory, in which the arrays are saved as .npy files so
+    they can be memory-mapped, and the other values are saved in a json file.
+    the entries are evicted in the least-recently-used order once the total
+    size is over max_size.
+    """
+    def __init__(self, cache_dir=None, max_size=1024 ** 3 * 8,
+                 enabled=False):
+        if cache_dir is None:
+            cache_dir = os.path.join(home_dir, 'cache')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.enabled = enabled
+        # estimated size of the cache directory; None if unknown
+        self.size = None
+        self.lock = threading.RLock()
+
+    def set_config(self, enabled=None, max_size=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if max_size is not None:
+            self.max_size = int(max_size)
+        if self.enabled:
+            self.evict()
+
+    def get_key(self, fname):
+        """
+        the content signature of a source file; None if the cache is disabled
+        or the file can't be accessed.
+        """
+        if not self.enabled:
+            return None
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+        sig = '|'.join([cache_version, os.path.abspath(fname),
+                        str(st.st_size), str(st.st_mtime_ns)])
+        return hashlib.sha1(sig.encode()).hexdigest()
+
+    def _read_manifest(self, key):
+        fname = os.path.join(self.cache_dir, key, 'manifest.json')
+        try:
+            with open(fname, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def read(self, key, fields):
+        """
+        read the fields from a cache entry; the arrays are memory-mapped in
+        the copy-on-write mode;
+        :param key: the entry key from get_key
+        :param fields: list of field names
+        :return: dictionary of the fields, or None if any field is missing
+        """
+        if key is None:
+            return None
+        entry = os.path.join(self.cache_dir, key)
+        with self.lock:
+            manifest = self._read_manifest(key)
+        if not all([x in manifest for x in fields]):
+            return None
+
+        def decode(name, desc):
+            if desc['kind'] == 'array':
+                fname = os.path.join(entry, name + '.npy')
+                return np.load(fname, mmap_mode='c', allow_pickle=False)
+            elif desc['kind'] == 'small':
+                val = np.array(desc['value'], dtype=desc['dtype'])
+                return val.reshape(desc['shape'])
+            elif desc['kind'] == 'dict':
+                return {k: decode(name + '.' + k, v)
+                        for k, v in desc['items'].items()}
+            else:
+                return desc['value']
+
+        try:
+            ret = {x: decode(x, manifest[x]) for x in fields}
+        except (OSError, ValueError) as e:
+            logger.info('cache entry %s is damaged: %s', key, e)
+            return None
+
+        # the manifest's mtime is used for the LRU eviction
+        try:
+            os.utime(os.path.join(entry, 'manifest.json'))
+        except OSError:
+            pass
+        return ret
+
+    def write(self, key, values):
+        """
+        add the fields to a cache entry; values that can't be saved are
+        skipped;
+        :param key: the entry key from get_key
+        :param values: dictionary of the fields
+        """
+        if key is None:
+            return
+        entry = os.path.join(self.cache_dir, key)
+        new_size = 0
+
+        def encode(name, val):
+            nonlocal new_size
+            if isinstance(val, np.ndarray) and val.dtype.kind in 'biuf' \
+                    and val.nbytes <= inline_size:
+                return {'kind': 'small', 'value': val.ravel().tolist(),
+                        'dtype': val.dtype.str, 'shape': list(val.shape)}
+            elif isinstance(val, np.ndarray) and val.dtype != object:
+                fname = os.path.join(entry, name + '.npy')
+                tmp_fname = fname + '.%d.tmp' % threading.get_ident()
+                np.save(tmp_fname, np.ascontiguousarray(val))
+                # an overwritten field is counted only once
+                if os.path.isfile(fname):
+                    new_size -= os.path.getsize(fname)
+                # np.save appends the suffix
+                os.replace(tmp_fname + '.npy', fname)
+                new_size += os.path.getsize(fname)
+                return {'kind': 'array'}
+            elif isinstance(val, dict):
+                return {'kind': 'dict',
+                        'items': {k: encode(name + '.' + k, v)
+                                  for k, v in val.items()}}
+            elif isinstance(val, np.generic):
+                return {'kind': 'value', 'value': val.item()}
+            elif val is None or isinstance(val, (bool, int, float, str)):
+                return {'kind': 'value', 'value': val}
+            elif isinstance(val, (list, tuple)):
+                # list of labels etc.
+                json.dumps(val)
+                return {'kind': 'value', 'value': list(val)}
+            raise TypeError('type not supported: %s' % type(val))
+
+        with self.lock:
+            try:
+                os.makedirs(entry, exist_ok=True)
+                manifest = self._read_manifest(key)
+                for name, val in values.items():
+                    try:
+                        manifest[name] = encode(name, val)
+                    except TypeError as e:
+                        logger.info('skip caching %s: %s', name, e)
+                fname = os.path.join(entry, 'manifest.json')
+                with open(fname + '.tmp', 'w') as f:
+                    json.dump(manifest, f)
+                os.replace(fname + '.tmp', fname)
+            except OSError as e:
+                logger.info('failed to write cache entry %s: %s', key, e)
+                return
+
+            if self.size is not None:
+                self.size += new_size
+            if self.size is None or self.size > self.max_size:
+                self.evict()
+
+    def _list_entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for x in os.scandir(self.cache_dir):
+            if not x.is_dir():
+                continue
+            size = 0
+            for y in os.scandir(x.path):
+                size += y.stat().st_size
+            try:
+                atime = os.path.getmtime(os.path.join(x.path,
+                                                      'manifest.json'))
+            except OSError:
+                atime = 0
+            entries.append((atime, size, x.path))
+        return entries
+
+    def evict(self):
+        """
+        remove the least recently used entries until the cache size is below
+        90% of max_size.
+        """
+        with self.lock:
+            entries = self._list_entries()
+            self.size = sum([x[1] for x in entries])
+            if self.size <= self.max_size:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if self.size <= self.max_size * 0.9:
+                    break
+                # memory-mapped files can't be removed on windows
+                shutil.rmtree(path, ignore_errors=True)
+                if not os.path.isdir(path):
+                    self.size -= size
+            logger.info('reduced data cache evicted to %.1f MB',
+                        self.size / 1024 ** 2)
+
+    def clear(self):
+        with self.lock:
+            for _, _, path in self._list_entries():
+                shutil.rmtree(path, ignore_errors=True)
+            self.size = None
+
+
+reduced_cache = ReducedDataCache()
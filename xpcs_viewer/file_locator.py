@@ -1,10 +1,14 @@
 # import marisa_trie
 import os
 from os.path import commonprefix
-from .fileIO.hdf_reader import get_type
+from .fileIO.hdf_reader import close_file
+from .fileIO.metadata_index import MetadataIndex
 from .xpcs_file import XpcsFile as xf
+from .load_worker import LoadWorker, Prefetcher
 import logging
 from .helper.listmodel import ListDataModel
+from .helper.lru_cache import LRUCache
+from .helper.intern_store import array_store
 import traceback
 
 
@@ -96,11 +100,43 @@ class FileLocator(object):
         self.target = ListDataModel()
         self.id_list = None
         self.type = None
-        self.cache = {}
         if max_cache_size is None:
             # 2G
-            self.max_cache_size = 1024 ** 3 * 2
-    
+            max_cache_size = 1024 ** 3 * 2
+        # the least recently used files release their large arrays when the
+        # cache is over budget; the arrays are read again when accessed
+        self.cache = LRUCache(max_cache_size, sizeof=lambda x: x.nbytes,
+                              release=lambda x: x.release())
+        # analysis type, geometry and shapes of the files in cwd
+        self.meta_index = MetadataIndex()
+        # read the large datasets in xpcs files only when they are used
+        self.lazy_load = True
+        # number of files to prefetch on each side of the current one
+        self.prefetch_num = 4
+        # the prefetched files are kept in cache even if they're not targets
+        self.prefetched = set()
+        # the files returned by the last get_xf_list
+        self.returned = []
+        self.prefetcher = Prefetcher()
+        self.prefetcher.signals.loaded.connect(self.add_prefetched)
+
+    @property
+    def max_cache_size(self):
+        return self.cache.max_size
+
+    def set_max_cache_size(self, max_cache_size):
+        """
+        change the budget of the xpcs file cache in bytes
+        """
+        self.cache.set_max_size(max_cache_size)
+        logger.info('cache stats: %s', self.get_cache_stats())
+
+    def get_cache_stats(self):
+        stats = self.cache.get_stats()
+        # the arrays shared by the files, eg. dqmap and mask
+        stats['shared'] = array_store.get_stats()
+        return stats
+
     def set_path(self, path):
         self.path = path
     
@@ -109,7 +145,14 @@ class FileLocator(object):
         self.source_search.clear()
 
     def get_type(self, fname):
-        return get_type(pjoin(self.cwd, fname))
+        return self.meta_index.get(pjoin(self.cwd, fname))['type']
+
+    def get_metadata(self, fname):
+        """
+        get the indexed metadata, eg. ftype, type, geometry and the shapes of
+        the q-lists, without opening the file if it has been indexed;
+        """
+        return self.meta_index.get(pjoin(self.cwd, fname))
 
     # def get(self, fname, fields_raw, **kwargs):
     #     return get(pjoin(self.cwd, fname), fields_raw, **kwargs)
@@ -147,42 +190,126 @@ class FileLocator(object):
 
         ret = []
         for n in selected:
-            fn = self.target[n]
-            ret.append(self.cache[fn])
-
+            # evicted or not loaded yet files are read again
+            xf_obj = self.get_xf(self.target[n])
+            if xf_obj is not None:
+                ret.append(xf_obj)
+
+        # the plots read the lazy fields of the files after they're returned;
+        # only those files have grown since the last call
+        self.cache.update_size(self.returned)
+        self.returned = [self.target[n] for n in selected]
         return ret
 
-    def load(self, file_list=None, max_number=1024, progress_bar=None,
-             flag_del=True):
+    def get_xf(self, fn):
+        """
+        get the cached xpcs_file; it's read again if it has been evicted;
+        :return: the XpcsFile object or None if it fails
+        """
+        xf_obj = self.cache.get(fn)
+        if xf_obj is None:
+            xf_obj = self.load_one(fn)
+        return xf_obj
 
+    def load_one(self, fn):
+        """
+        read one xpcs file and add it to the cache
+        :return: the XpcsFile object or None if it fails
+        """
+        try:
+            xf_obj = xf(fn, self.cwd, lazy=self.lazy_load)
+        except Exception as e:
+            logger.info("failed to load file: %s", fn)
+            logger.info("%s", str(e))
+            print(traceback.format_exc())
+            return None
+        self.cache.put(fn, xf_obj)
+        return xf_obj
+
+    def _get_load_list(self, file_list=None, max_number=1024, flag_del=True):
         if file_list in [None, []]:
             file_list = self.target
 
-        total_num = min(max_number, len(file_list))
-        existing_keys = list(self.cache.keys())
+        file_list = list(file_list)[0:max_number]
+        if flag_del:
+            self.prefetched.intersection_update(self.cache.keys())
+            keep = set(file_list) | self.prefetched
+            for key in self.cache.keys():
+                if key not in keep:
+                    self.cache.pop(key, None)
+
+        return [fn for fn in file_list if fn not in self.cache]
 
-        for n in range(total_num):
-            fn = self.target[n]
+    def load(self, file_list=None, max_number=1024, progress_bar=None,
+             flag_del=True):
+        load_list = self._get_load_list(file_list, max_number, flag_del)
+        total_num = len(load_list)
+
+        for n, fn in enumerate(load_list):
             if progress_bar is not None:
                 progress_bar.setValue(int((n + 1) / total_num * 100))
+            # read from file and output as a dictionary
+            self.load_one(fn)
 
-            if fn in existing_keys:
-                # already exist
-                existing_keys.remove(fn)
-            else:
-                # read from file and output as a dictionary
-                try:
-                    self.cache[fn] = xf(fn, self.cwd)
-                except Exception as e:
-                    logger.info("failed to load file: %s", fn)
-                    logger.info("%s", str(e))
-                    print(traceback.format_exc())
+        logger.info('cache stats: %s', self.get_cache_stats())
+        return
 
-        if flag_del:
-            for key in existing_keys:
-                self.cache.pop(key, None)
+    def get_load_worker(self, file_list=None, max_number=1024,
+                        flag_del=True, max_workers=None):
+        """
+        create a LoadWorker to read the files that are not cached in a
+        thread pool; connect its loaded signal to add_loaded;
+        :return: the worker or None if all files are cached already
+        """
+        load_list = self._get_load_list(file_list, max_number, flag_del)
+        if len(load_list) == 0:
+            return None
+        return LoadWorker(load_list, self.cwd, lazy=self.lazy_load,
+                          max_workers=max_workers)
 
-        return
+    def add_loaded(self, result):
+        """
+        add a file read by LoadWorker to the cache;
+        :param result: tuple of (fname, XpcsFile)
+        """
+        fn, xf_obj = result
+        # the target may have been changed during the loading
+        if xf_obj.cwd == self.cwd and fn in self.target:
+            self.cache.put(fn, xf_obj)
+
+    def prefetch(self, flist, index, num=None):
+        """
+        read the files around flist[index] in background; the previous
+        prefetching is canceled;
+        :param flist: the list that the user is browsing, eg. the target or
+            the source list, in its display (sort) order
+        :param index: index of the current file in flist
+        :param num: number of files on each side; default is prefetch_num
+        """
+        if num is None:
+            num = self.prefetch_num
+        if num <= 0 or index is None or not 0 <= index < len(flist):
+            return
+
+        # the next file first, then the previous one, and so on
+        order = []
+        for n in range(1, num + 1):
+            order.extend([index + n, index - n])
+        order = [x for x in order if 0 <= x < len(flist)]
+        fetch_list = [flist[x] for x in order if flist[x] not in self.cache]
+        if len(fetch_list) > 0:
+            self.prefetcher.submit(fetch_list, self.cwd)
+
+    def add_prefetched(self, result):
+        """
+        add a file read by the prefetcher to the cache;
+        :param result: tuple of (fname, XpcsFile)
+        """
+        fn, xf_obj = result
+        if xf_obj.cwd != self.cwd or fn in self.cache:
+            return
+        self.prefetched.add(fn)
+        self.cache.put(fn, xf_obj)
 
     def get_hdf_info(self, fname, fstr=None):
         """
@@ -199,32 +326,33 @@ class FileLocator(object):
     def add_target(self, alist, threshold=64):
         if alist in [[], None]:
             return
+
+        # index the new files in parallel if many files are added
+        if len(alist) > threshold:
+            self.meta_index.scan(self.cwd, list(alist))
+
         if self.type is None:
             self.type = self.get_type(alist[0])
 
         single_flag = True
-
-        if len(alist) <= threshold:
-            for x in alist:
-                if x not in self.target:
-                    t = self.get_type(x)
-                    if t not in ['Multitau', 'Twotime']:
-                        logger.info('Failed to get type for %s', x)
-                        continue
-                    if self.type is None:
-                        self.type = t
-                    elif t != self.type:
-                        logger.info('Mixed analysis type for %s. Discard', x)
-                        single_flag = False
-                        continue
-                    self.target.append(x)
-
-            self.id_list = create_id(self.target)
-        else:
-            # if many files are added; then ignore the type check;
-            logger.info('type check is disabled. too many files added')
-            self.target.extend(alist)
-            self.id_list = alist.copy()
+        existing = set(self.target)
+        for x in alist:
+            if x in existing:
+                continue
+            t = self.get_type(x)
+            if t not in ['Multitau', 'Twotime']:
+                logger.info('Failed to get type for %s', x)
+                continue
+            if self.type is None:
+                self.type = t
+            elif t != self.type:
+                logger.info('Mixed analysis type for %s. Discard', x)
+                single_flag = False
+                continue
+            self.target.append(x)
+            existing.add(x)
+
+        self.id_list = create_id(self.target)
 
         logger.info('length of target = %d' % len(self.target))
         return single_flag
@@ -280,6 +408,12 @@ class FileLocator(object):
         else:
             return
 
+        self.prefetcher.cancel()
+        self.prefetched.clear()
+        # the files may have been changed on disk; drop the stale handles
+        close_file()
+        self.meta_index.clear()
+
         flist = [x for x in flist if get_suffix(x) in filter_list]
 
         # filter configure files
@@ -310,6 +444,8 @@ class FileLocator(object):
             flist.reverse()
 
         self.source.replace(flist)
+        # index the files in background so adding targets is fast
+        self.meta_index.scan_async(self.cwd, flist)
 
         return True
 
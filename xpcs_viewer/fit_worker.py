@@ -0,0 +1,177 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from PyQt5 import QtCore
+from PyQt5.QtCore import QObject, pyqtSlot
+from .helper.fitting import fit_g2_data
+from .helper.fit_cache import fit_cache
+
+
+logger = logging.getLogger(__name__)
+
+# the process pools of the fittings, by the number of processes; starting
+# the processes takes a few seconds, so the pools are kept between fittings
+fit_pools = {}
+fit_pools_lock = threading.Lock()
+
+
+def get_fit_pool(max_workers):
+    """
+    get the process pool with max_workers processes; the processes are
+    spawned, not forked, because the gui process runs threads and holds
+    opened hdf5 handles
+    """
+    with fit_pools_lock:
+        pool = fit_pools.get(max_workers, None)
+        if pool is None:
+            ctx = multiprocessing.get_context('spawn')
+            pool = ProcessPoolExecutor(max_workers, mp_context=ctx)
+            fit_pools[max_workers] = pool
+        return pool
+
+
+def drop_fit_pool(max_workers, pool):
+    # a broken pool can't take new jobs; the next fitting starts a new one
+    with fit_pools_lock:
+        if fit_pools.get(max_workers, None) is pool:
+            fit_pools.pop(max_workers)
+    pool.shutdown(wait=False)
+
+
+class FitSignal(QObject):
+    # (number of files done, total number)
+    progress = QtCore.pyqtSignal(tuple)
+    # (XpcsFile, fit_summary)
+    fitted = QtCore.pyqtSignal(tuple)
+    # (number of files fitted, total number, canceled)
+    finished = QtCore.pyqtSignal(tuple)
+
+
+class FitWorker(QtCore.QRunnable):
+    """
+    fit the g2 of a list of files with a process pool; the files are sent to
+    the processes in small chunks and each fit_summary is sent back with the
+    fitted signal as soon as its chunk is done. the data to fit is read when
+    the worker is created, in the gui thread, so the worker thread doesn't
+    touch the XpcsFiles, which the gui thread may release or modify.
+    :param chunk_size: number of files in one job; None to split the files
+        evenly over the processes, with a few jobs per process
+    :param use_cache: if False, the files are fitted again even if their
+        results are in fit_cache
+    :param warm_start: if True, start from the files' current fit_summary
+        and keep the q columns that don't change; see match_prev_fit
+    :param num_starts: number of starts of each q; None to use the default
+        of the fitting function
+    :param bootstrap: number of bootstrap samples of each q; 0 to skip the
+        bootstrap intervals
+    :param level: the confidence level of the bootstrap intervals
+    """
+    def __init__(self, xf_list, q_range, t_range, bounds, fit_flag,
+                 fit_func='single', max_workers=None, chunk_size=None,
+                 use_cache=True, warm_start=True, num_starts=None,
+                 bootstrap=0, level=0.95):
+        super().__init__()
+        self.xf_list = list(xf_list)
+        self.q_range = q_range
+        self.t_range = t_range
+        self.bounds = bounds
+        self.fit_flag = fit_flag
+        self.fit_func = fit_func
+        if max_workers is None:
+            max_workers = min(8, os.cpu_count() or 1)
+        self.max_workers = max_workers
+        if chunk_size is None:
+            chunk_size = max(1, len(self.xf_list) // (4 * max_workers))
+        self.chunk_size = chunk_size
+        self.use_cache = use_cache
+        self.warm_start = warm_start
+        self.num_starts = num_starts
+        self.bootstrap = bootstrap
+        self.level = level
+        self.signals = FitSignal()
+        self.is_killed = False
+
+        # the cached results, [(XpcsFile, fit_summary)]
+        self.cached = []
+        # the files to fit, [(XpcsFile, key, data, previous fit_summary)]
+        self.todo = []
+        for xf in self.xf_list:
+            key = xf.get_fit_key(q_range, t_range, bounds, fit_flag,
+                                 fit_func, num_starts=num_starts,
+                                 bootstrap=bootstrap, level=level)
+            fit_summary = fit_cache.get(key) if use_cache else None
+            if fit_summary is not None:
+                self.cached.append((xf, fit_summary))
+                continue
+            prev = xf.fit_summary if warm_start else None
+            if prev is not None:
+                # the gui thread may add the tauq fields to fit_summary
+                prev = dict(prev)
+            self.todo.append((xf, key, xf.get_g2_fit_data(q_range, t_range),
+                              prev))
+
+    def kill(self):
+        self.is_killed = True
+
+    @pyqtSlot()
+    def run(self):
+        t0 = time.perf_counter()
+        total = len(self.xf_list)
+        done, fitted = 0, 0
+
+        # the cached results are sent back at once
+        for xf, fit_summary in self.cached:
+            done += 1
+            fitted += 1
+            self.signals.fitted.emit((xf, fit_summary))
+        if done > 0:
+            self.signals.progress.emit((done, total))
+
+        pool = get_fit_pool(self.max_workers) if self.todo else None
+        futures = {}
+        try:
+            # only the arrays go to the pool
+            for beg in range(0, len(self.todo), self.chunk_size):
+                if self.is_killed:
+                    break
+                chunk = self.todo[beg:beg + self.chunk_size]
+                future = pool.submit(fit_g2_data, [x[2] for x in chunk],
+                                     self.bounds, self.fit_flag,
+                                     self.fit_func, [x[3] for x in chunk],
+                                     self.num_starts, self.bootstrap,
+                                     self.level)
+                futures[future] = chunk
+
+            for future in as_completed(futures):
+                if self.is_killed:
+                    break
+                chunk = futures[future]
+                done += len(chunk)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    logger.error('the fitting processes stopped: %s', e)
+                    drop_fit_pool(self.max_workers, pool)
+                    break
+                except Exception as e:
+                    logger.info('failed to fit g2: %s', str(e))
+                else:
+                    for (xf, key, _, _), fit_summary in zip(chunk, result):
+                        fitted += 1
+                        fit_cache.put(key, fit_summary)
+                        self.signals.fitted.emit((xf, fit_summary))
+                self.signals.progress.emit((done, total))
+        finally:
+            # the jobs being fitted will finish; the pending ones are dropped
+            for future in futures:
+                future.cancel()
+
+        logger.info('fitted g2 of %d/%d files in %.2f s%s', fitted, total,
+                    time.perf_counter() - t0,
+                    ' (canceled)' if self.is_killed else '')
+        logger.info('fit cache stats: %s', fit_cache.get_stats())
+        self.signals.finished.emit((fitted, total, self.is_killed))
@@ -0,0 +1,209 @@
+import os
+import pickle
+import hashlib
+import logging
+import threading
+import numpy as np
+from .lru_cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+# change the version if the fitting changes so the old results are not used
+fit_version = '2'
+
+
+def file_signature(fname):
+    """
+    the content signature of a file from its path, size and mtime; None if
+    the file can't be accessed.
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return '|'.join([os.path.abspath(fname), str(st.st_size),
+                     str(st.st_mtime_ns)])
+
+
+def sizeof_result(val):
+    """
+    the approximate size of a fitting result in bytes
+    """
+    if isinstance(val, np.ndarray):
+        return val.nbytes
+    elif isinstance(val, dict):
+        return sum([sizeof_result(x) for x in val.values()]) + 64
+    elif isinstance(val, (list, tuple)):
+        return sum([sizeof_result(x) for x in val]) + 64
+    return 64
+
+
+class FitCache(object):
+    """
+    the fitting results keyed by the file signature and the fitting settings;
+    the recent results are kept in memory and all of them are saved to disk,
+    where the least recently used ones are removed once the total size is
+    over max_disk_size. only the small settings are hashed, never the data.
+    :param cache_dir: the directory for the disk tier; None to disable it
+    :param max_size: the budget of the memory tier in bytes
+    :param max_disk_size: the budget of the disk tier in bytes
+    """
+    def __init__(self, cache_dir=None, max_size=1024 ** 2 * 64,
+                 max_disk_size=1024 ** 2 * 256):
+        self.cache_dir = cache_dir
+        self.max_disk_size = max_disk_size
+        self.memory = LRUCache(max_size, sizeof_result)
+        # estimated size of the cache directory; None if unknown
+        self.disk_size = None
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def get_key(self, signature, **settings):
+        """
+        the key of a fitting result; the settings are given by name, so the
+        fittings with different settings can't have the same key
+        :param signature: the content signature of the file, see
+            file_signature; None means the result can't be cached
+        :param settings: the fitting settings, eg. function, ranges, bounds
+        :return: the key or None
+        """
+        if signature is None:
+            return None
+        settings = [(k, np.asarray(v).tolist() if isinstance(
+            v, (np.ndarray, tuple)) else v) for k, v in sorted(
+            settings.items())]
+        sig = repr((fit_version, signature, settings))
+        return hashlib.sha1(sig.encode()).hexdigest()
+
+    def _get_fname(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key):
+        """
+        get a fitting result from memory or disk; the result is a shallow
+        copy, so the caller can add or replace its keys;
+        :return: the result or None if it's not cached
+        """
+        if key is None:
+            return None
+        val = self.memory.get(key)
+        if val is not None:
+            return dict(val)
+        if self.cache_dir is None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        fname = self._get_fname(key)
+        try:
+            with open(fname, 'rb') as f:
+                val = pickle.load(f)
+            # the mtime is used for the LRU eviction
+            os.utime(fname)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.info('fit cache entry %s is damaged: %s', key, e)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+        self.memory.put(key, val)
+        return dict(val)
+
+    def put(self, key, val):
+        """
+        add a fitting result to memory and disk; a shallow copy is kept, so
+        the caller can still change the keys of val
+        """
+        if key is None or val is None:
+            return
+        self.memory.put(key, dict(val))
+        if self.cache_dir is None:
+            return
+
+        fname = self._get_fname(key)
+        tmp_fname = fname + '.%d.tmp' % threading.get_ident()
+        with self.lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(tmp_fname, 'wb') as f:
+                    pickle.dump(val, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_fname, fname)
+                new_size = os.path.getsize(fname)
+            except OSError as e:
+                logger.info('failed to write fit cache entry %s: %s', key, e)
+                return
+
+            if self.disk_size is not None:
+                self.disk_size += new_size
+            if self.disk_size is None or self.disk_size > self.max_disk_size:
+                self.evict()
+
+    def _list_entries(self):
+        entries = []
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return entries
+        for x in os.scandir(self.cache_dir):
+            if x.is_file() and x.name.endswith('.pkl'):
+                st = x.stat()
+                entries.append((st.st_mtime, st.st_size, x.path))
+        return entries
+
+    def evict(self):
+        """
+        remove the least recently used files until the disk tier is below
+        90% of max_disk_size.
+        """
+        with self.lock:
+            entries = self._list_entries()
+            self.disk_size = sum([x[1] for x in entries])
+            if self.disk_size <= self.max_disk_size:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if self.disk_size <= self.max_disk_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self.disk_size -= size
+                except OSError:
+                    pass
+            logger.info('fit cache evicted to %.1f MB',
+                        self.disk_size / 1024 ** 2)
+
+    def set_config(self, max_size=None, max_disk_size=None):
+        if max_size is not None:
+            self.memory.set_max_size(int(max_size))
+        if max_disk_size is not None:
+            self.max_disk_size = int(max_disk_size)
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            for _, _, path in self._list_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.disk_size = None
+
+    def get_stats(self):
+        stats = self.memory.get_stats()
+        with self.lock:
+            # the memory misses include the ones found on disk
+            stats.update({'disk_hits': self.disk_hits,
+                          'misses': self.misses,
+                          'disk_size': self.disk_size,
+                          'max_disk_size': self.max_disk_size})
+        total = stats['hits'] + self.disk_hits + self.misses
+        stats['hit_rate'] = (stats['hits'] + self.disk_hits) / max(1, total)
+        return stats
+
+
+fit_cache = FitCache(os.path.join(os.path.expanduser('~'), '.xpcs_viewer',
+                                  'fit_cache'))
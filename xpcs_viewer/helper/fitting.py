@@ -1,36 +1,143 @@
+import ast
 import numpy as np
-from scipy.optimize import curve_fit
-import traceback
-from sklearn import linear_model
-import os
+from scipy import sparse
+from scipy.optimize import curve_fit, least_squares
 import traceback
 import logging
-from joblib import Memory
+import time
+import warnings
+from .fit_cache import fit_cache
+from ..module.g2mod import create_slice
 
 
 logger = logging.getLogger(__name__)
-cache_dir = os.path.join(os.path.expanduser('~'), '.xpcs_viewer')
-
-memory = Memory(cache_dir, verbose=0)
-@memory.cache
-def fit_with_fixed(*args, **kwargs):
-    # wrap the fitting function in memory so avoid re-run
-    return fit_with_fixed_raw(*args, **kwargs)
 
 
 def single_exp(x, tau, bkg, cts):
     return cts * np.exp( -2 * x / tau) + bkg
 
 
-def fit_tau(qd, tau, tau_err):
-    x = np.log(qd).reshape(-1, 1)
-    y = np.log(tau).reshape(-1, 1)
-    dy = tau / tau_err
-    reg = linear_model.LinearRegression()
-    reg.fit(x, y, sample_weight=dy)
-    x2 = np.linspace(np.min(x) - 0.1, np.max(x) + 0.1, 128)
-    y2 = reg.predict(x2.reshape(-1, 1))
-    return reg.coef_, reg.intercept_, np.exp(x2).ravel(), np.exp(y2).ravel()
+def fit_power_law_batch(x, y, sigma, bounds, fit_flag, fit_x, p0=None):
+    """
+    fit many datasets with the power law y = a * x ** b at once; the power
+    law is linear in log-log space, so it's solved in closed form with
+    weighted least squares, the weights being (y / sigma) ** 2. the errors
+    are scaled by chi2 / dof like curve_fit does. the datasets whose result
+    is out of bounds are refined with fit_with_fixed_raw.
+    :param x: the inputs, (num_sets, num_points); the points with
+        non-positive x, y or sigma, or nan, are not used, so datasets of
+        different lengths can be padded
+    :param y: the outputs, same shape as x
+    :param sigma: the errors of y, same shape as x
+    :param bounds: bounds of (a, b); the upper bound is used as the fixed
+        value if the fit_flag is False
+    :param fit_flag: tuple of two bools, True/False for fit and fixed
+    :param fit_x: the fitting line for x, (num_points, ) or one line for
+        each dataset, (num_sets, num_points)
+    :param p0: the values reported for the failed fittings; if None, the
+        mean of the bounds is used
+    :return: a tuple of (fit_line, fit_val), same as fit_with_fixed_raw
+    """
+    fit_flag = np.array(fit_flag, dtype=bool)
+    bounds = np.array(bounds, dtype=np.float64)
+    x, y, sigma = [np.atleast_2d(np.asarray(v, dtype=np.float64))
+                   for v in (x, y, sigma)]
+    fit_x = np.broadcast_to(fit_x, (x.shape[0], np.shape(fit_x)[-1]))
+    if p0 is None:
+        p0 = np.mean(bounds, axis=0)
+    p0 = np.array(p0, dtype=np.float64)
+
+    if not np.any(fit_flag):
+        # nothing to fit; both variables are fixed at their upper bounds
+        fit_val = np.zeros((x.shape[0], 2, 2))
+        fit_val[:, 0] = bounds[1]
+        fit_line = [{'fit_x': fit_x[n],
+                     'fit_y': bounds[1, 0] * fit_x[n] ** bounds[1, 1],
+                     'success': True, 'msg': 'FittingSuccess'}
+                    for n in range(x.shape[0])]
+        return fit_line, fit_val
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = (x > 0) & (y > 0) & (sigma > 0) & np.isfinite(sigma)
+        lx = np.where(valid, np.log(x), 0)
+        ly = np.where(valid, np.log(y), 0)
+        # the error of log(y) is sigma / y; the weights are normalized so
+        # tiny errors don't overflow, which doesn't change the results
+        lw = np.where(valid, 2 * (np.log(y) - np.log(sigma)), -np.inf)
+        lw_max = np.max(lw, axis=1, keepdims=True)
+        w = np.exp(lw - np.where(np.isfinite(lw_max), lw_max, 0))
+
+    num = np.sum(valid, axis=1)
+    dof = num - np.sum(fit_flag)
+    s0 = np.sum(w, axis=1)
+    sx = np.sum(w * lx, axis=1)
+    sxx = np.sum(w * lx * lx, axis=1)
+
+    # fitted in log space; la = log(a)
+    la = np.full(x.shape[0], np.log(bounds[1, 0]) if bounds[1, 0] > 0
+                 else np.nan)
+    b = np.full(x.shape[0], bounds[1, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if np.all(fit_flag):
+            # centered on the weighted means to avoid the cancellation
+            xm = sx / s0
+            ym = np.sum(w * ly, axis=1) / s0
+            dx = np.where(valid, lx - xm[:, None], 0)
+            sdd = np.sum(w * dx * dx, axis=1)
+            b = np.sum(w * dx * (ly - ym[:, None]), axis=1) / sdd
+            la = ym - b * xm
+            var = np.stack([1 / s0 + xm ** 2 / sdd, 1 / sdd], axis=1)
+        elif fit_flag[0]:
+            la = np.sum(w * (ly - b[:, None] * lx), axis=1) / s0
+            var = np.stack([1 / s0, np.zeros_like(s0)], axis=1)
+        else:
+            # only the exponent is fitted
+            b = np.sum(w * lx * (ly - la[:, None]), axis=1) / sxx
+            var = np.stack([np.zeros_like(s0), 1 / sxx], axis=1)
+
+        res = ly - la[:, None] - b[:, None] * lx
+        chi2 = np.sum(w * res ** 2, axis=1)
+        scale = np.where(dof > 0, chi2 / dof, np.inf)
+        err = np.sqrt(var * scale[:, None])
+    a = np.exp(la)
+    # the error of a is propagated from the error of log(a)
+    err[:, 0] *= a
+
+    fit_val = np.zeros((x.shape[0], 2, 2))
+    fit_line = []
+    for n in range(x.shape[0]):
+        val = np.array([a[n], b[n]])
+        # without degrees of freedom the errors can't be estimated
+        success = dof[n] > 0 and np.all(np.isfinite(val))
+        in_bounds = np.all((val >= bounds[0]) & (val <= bounds[1]))
+        if success and not in_bounds:
+            # the bounds are active; solve the constrained problem instead
+            p_init = np.clip(val, bounds[0], bounds[1])
+            line, v = fit_with_fixed_raw(
+                lambda x1, a1, b1: a1 * x1 ** b1, x[n, valid[n]],
+                y[n, valid[n]].reshape(-1, 1),
+                sigma[n, valid[n]].reshape(-1, 1), bounds, fit_flag,
+                fit_x[n], p0=p_init)
+            fit_val[n] = v[0]
+            fit_line.append(line[0])
+            continue
+
+        if success:
+            fit_val[n, 0] = val
+            fit_val[n, 1] = np.where(fit_flag, err[n], 0)
+            fit_y = a[n] * fit_x[n] ** b[n]
+            msg = 'FittingSuccess'
+        else:
+            fit_val[n, 0] = np.where(fit_flag, p0, bounds[1])
+            fit_val[n, 1] = -1
+            fit_y = None
+            msg = 'Fitting failed: %d valid points for %d variables' % (
+                num[n], np.sum(fit_flag))
+            logger.info(msg)
+        fit_line.append({'fit_x': fit_x[n], 'fit_y': fit_y,
+                         'success': bool(success), 'msg': msg})
+
+    return fit_line, fit_val
 
 
 def fit_xpcs(tel, qd, g2, g2_err, b):
@@ -162,3 +269,1097 @@ def fit_with_fixed_raw(base_func, x, y, sigma, bounds, fit_flag, fit_x,
                              'msg': msg})
 
     return fit_line, fit_val
+
+
+def _eval_batch(base_func, x, params):
+    """
+    evaluate base_func for all the parameter sets at once;
+    :param params: (num_sets, num_args)
+    :return: (x.size, num_sets)
+    """
+    return base_func(x[:, None], *params.T)
+
+
+def _jac_batch(base_func, jac, x, params, fit_flag):
+    """
+    the jacobian of base_func with respect to the fitted parameters;
+    :return: (num_sets, x.size, num_fit)
+    """
+    shape = (x.size, params.shape[0])
+    if jac is not None:
+        cols = jac(x[:, None], *params.T)
+        cols = [np.broadcast_to(cols[k], shape)
+                for k in np.nonzero(fit_flag)[0]]
+    else:
+        # forward difference
+        f0 = _eval_batch(base_func, x, params)
+        cols = []
+        for k in np.nonzero(fit_flag)[0]:
+            step = np.sqrt(np.finfo(float).eps) * \
+                np.maximum(np.abs(params[:, k]), 1e-12)
+            p1 = params.copy()
+            p1[:, k] += step
+            cols.append((_eval_batch(base_func, x, p1) - f0) / step)
+    return np.stack(cols, axis=-1).transpose(1, 0, 2)
+
+
+def _solve_batch(a, b):
+    try:
+        return np.linalg.solve(a, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.einsum('kij,kj->ki', np.linalg.pinv(a), b)
+
+
+def fit_with_fixed_batch_raw(base_func, x, y, sigma, bounds, fit_flag, fit_x,
+                             p0=None, jac=None, max_iter=1000, ftol=1e-8,
+                             verbose=True):
+    """
+    fit all the columns of y at once with a vectorized, bounded
+    Levenberg-Marquardt solver; it follows the same conventions as
+    fit_with_fixed_raw. base_func (and jac) must accept arrays of parameters
+    and broadcast them with x.
+    :param p0: the initial values, (num_args, ) for all the columns or
+        (num_columns, num_args) for each column; if None, the mean of the
+        bounds is used
+    :param jac: function with the same arguments as base_func that returns
+        the derivatives with respect to all the arguments; if None, the
+        jacobian is computed with finite difference
+    :param max_iter: maximal number of iterations
+    :param ftol: relative change of the cost to stop at
+    :param verbose: if False, the failed columns are not logged
+    :return: a tuple of (fit_line, fit_val); each fit_line also has the
+        number of iterations (nit), of cost evaluations (nfev), the wall time
+        in seconds shared by the columns fitted together (time) and why the
+        solver stopped (stop)
+    """
+    fit_flag = np.array(fit_flag, dtype=bool)
+    fix_flag = np.logical_not(fit_flag)
+    bounds = np.array(bounds, dtype=np.float64)
+    num_args = len(fit_flag)
+    num_fit = int(np.sum(fit_flag))
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+    num_sets = y.shape[1]
+
+    lb, ub = bounds[0, fit_flag], bounds[1, fit_flag]
+    if p0 is None:
+        p0 = np.mean(bounds[:, fit_flag], axis=0)
+    else:
+        p0 = np.array(p0, dtype=np.float64)[..., fit_flag]
+    p0 = np.broadcast_to(np.clip(p0, lb, ub), (num_sets, num_fit))
+
+    params = np.zeros((num_sets, num_args))
+    params[:, fix_flag] = bounds[1, fix_flag]
+    params[:, fit_flag] = p0
+
+    # the columns with invalid data fail like curve_fit does
+    valid = np.all(np.isfinite(y), axis=0) & \
+        np.all(np.isfinite(sigma), axis=0) & np.all(sigma > 0, axis=0)
+    sigma = np.where(sigma > 0, sigma, 1.0)
+    y = np.where(np.isfinite(y), y, 0)
+
+    def get_cost(p, idx):
+        res = (_eval_batch(base_func, x, p) - y[:, idx]) / sigma[:, idx]
+        return res, np.sum(res ** 2, axis=0)
+
+    # the positive variables that span decades (eg. the relaxation times)
+    # are solved in log scale; it makes the cost much closer to quadratic
+    logvar = (lb > 0) & (ub > 100 * lb)
+    zlb = np.where(logvar, np.log(np.where(logvar, lb, 1)), lb)
+    zub = np.where(logvar, np.log(np.where(logvar, ub, 1)), ub)
+
+    def to_params(z, idx):
+        p = params[idx].copy()
+        p[:, fit_flag] = np.where(logvar, np.exp(z), z)
+        return p
+
+    zval = np.where(logvar, np.log(np.where(logvar, p0, 1)), p0)
+    t0 = time.perf_counter()
+    res, cost = get_cost(params, slice(None))
+    lam = np.full(num_sets, 1e-3)
+    active = valid & np.isfinite(cost)
+    converged = np.zeros(num_sets, dtype=bool)
+    nit = np.zeros(num_sets, dtype=int)
+    nfev = np.ones(num_sets, dtype=int)
+    wall = np.full(num_sets, (time.perf_counter() - t0) / num_sets)
+    stop = np.array(['max_iter'] * num_sets, dtype=object)
+    stop[~valid] = 'invalid'
+    stop[valid & ~np.isfinite(cost)] = 'nonfinite'
+    num_iter = 0
+    while np.any(active) and num_iter < max_iter and num_fit > 0:
+        t0 = time.perf_counter()
+        num_iter += 1
+        idx = np.nonzero(active)[0]
+        nit[idx] += 1
+        nfev[idx] += 1
+        zfit = zval[idx]
+        jmat = _jac_batch(base_func, jac, x, params[idx], fit_flag) / \
+            sigma[:, idx].T[:, :, None]
+        jmat = jmat * np.where(logvar, params[idx][:, fit_flag], 1)[:, None]
+        grad = np.einsum('kti,tk->ki', jmat, res[:, idx])
+        # the variables sitting on a bound and pushed outwards are frozen
+        keep = ~(((zfit <= zlb) & (grad > 0)) | ((zfit >= zub) & (grad < 0)))
+        jmat = jmat * keep[:, None, :]
+        grad = grad * keep
+        jtj = np.einsum('kti,ktj->kij', jmat, jmat)
+        diag = np.diagonal(jtj, axis1=1, axis2=2)
+        damp = lam[idx, None] * np.maximum(diag, 1e-12) + ~keep
+        step = _solve_batch(jtj + damp[:, :, None] * np.eye(num_fit),
+                            -grad) * keep
+
+        ztrial = np.clip(zfit + step, zlb, zub)
+        trial = to_params(ztrial, idx)
+        res_t, cost_t = get_cost(trial, idx)
+        better = np.isfinite(cost_t) & (cost_t < cost[idx])
+
+        # the relative decrease of the cost and the size of the step
+        change = (cost[idx] - cost_t) / np.maximum(cost[idx], 1e-300)
+        small = np.all(np.abs(ztrial - zfit) <= 1e-10 * (np.abs(zfit) + 1e-10),
+                       axis=1)
+
+        acc = idx[better]
+        zval[acc] = ztrial[better]
+        params[acc] = trial[better]
+        res[:, acc] = res_t[:, better]
+        cost[acc] = cost_t[better]
+        lam[acc] = np.maximum(lam[acc] / 10.0, 1e-12)
+        lam[idx[~better]] *= 10.0
+
+        stop[idx[lam[idx] >= 1e12]] = 'lambda'
+        stop[idx[small]] = 'xtol'
+        stop[idx[better & (change <= ftol)]] = 'ftol'
+        done = (better & (change <= ftol)) | small | (lam[idx] >= 1e12)
+        converged[idx[done]] = True
+        active[idx[done]] = False
+        wall[idx] += (time.perf_counter() - t0) / idx.size
+
+    t0 = time.perf_counter()
+    fit_val = np.zeros((num_sets, 2, num_args))
+    fit_val[:, 0] = params
+    # covariance from the jacobian at the optimum scaled by chi2 / dof, the
+    # same as curve_fit
+    dof = x.size - num_fit
+    if num_fit > 0:
+        jmat = _jac_batch(base_func, jac, x, params, fit_flag) / \
+            sigma.T[:, :, None]
+        _, sv, vt = np.linalg.svd(jmat, full_matrices=False)
+        tol = np.finfo(float).eps * max(jmat.shape[1:]) * sv[:, :1]
+        with np.errstate(over='ignore', divide='ignore'):
+            inv_sv2 = np.where(sv > tol, 1.0 / np.maximum(sv, 1e-300) ** 2,
+                               0)
+        pcov = np.einsum('kji,kj,kjl->kil', vt, inv_sv2, vt)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scale = cost / dof if dof > 0 else np.inf
+        pcov = pcov * np.reshape(scale, (-1, 1, 1))
+        fit_val[:, 1, fit_flag] = np.sqrt(np.abs(
+            np.diagonal(pcov, axis1=1, axis2=2)))
+
+    success = valid & converged & np.isfinite(cost)
+    if num_fit == 0:
+        success = valid
+        stop[valid] = 'fixed'
+    fit_y = _eval_batch(base_func, np.asarray(fit_x, dtype=np.float64),
+                        params)
+    wall += (time.perf_counter() - t0) / num_sets
+
+    fit_line = []
+    for n in range(num_sets):
+        stats = {'nit': int(nit[n]), 'nfev': int(nfev[n]),
+                 'time': float(wall[n]), 'stop': stop[n]}
+        if success[n]:
+            fit_line.append({'fit_x': fit_x, 'fit_y': fit_y[:, n],
+                             'success': True, 'msg': 'FittingSuccess',
+                             **stats})
+        else:
+            if not valid[n]:
+                msg = 'Fitting failed: column %d has invalid values' % n
+            elif stop[n] == 'nonfinite':
+                msg = 'Fitting failed: column %d has non-finite cost' % n
+            else:
+                msg = 'Fitting failed: column %d does not converge in ' \
+                      '%d iterations' % (n, max_iter)
+            if verbose:
+                logger.info(msg)
+            fit_val[n, 0, fit_flag] = p0[n]
+            fit_val[n, 1, :] = -1
+            fit_line.append({'fit_x': fit_x, 'fit_y': None,
+                             'success': False, 'msg': msg, **stats})
+    return fit_line, fit_val
+
+
+def fit_with_fixed_multistart_raw(base_func, x, y, sigma, bounds, fit_flag,
+                                  fit_x, p0=None, jac=None, num_starts=8,
+                                  random_state=0, **kwargs):
+    """
+    fit all the columns of y from several starts and keep the best one by
+    the weighted chi-square; the starts of all the columns are solved in
+    one call of fit_with_fixed_batch_raw. the first start is p0, half of the
+    others are p0 perturbed by up to a decade (or a quarter of the bounds)
+    and the rest are drawn from the bounds; the variables spanning decades
+    are drawn in log scale.
+    :param p0: the initial values, (num_args, ) or (num_columns, num_args)
+    :param num_starts: number of starts for each column
+    :param random_state: seed of the random starts, so the results are
+        reproducible
+    :param kwargs: passed to fit_with_fixed_batch_raw
+    :return: a tuple of (fit_line, fit_val); each fit_line also has the
+        number of starts (num_starts) and of the converged ones
+        (num_converged), the best chi2 (chi2), the range of chi2 of the
+        converged starts (chi2_range), the number of starts within 1 of the
+        best chi2 (num_best) and the standard deviation of their values
+        (param_spread). nit, nfev and time are summed over the starts.
+    """
+    fit_flag = np.array(fit_flag, dtype=bool)
+    bounds = np.array(bounds, dtype=np.float64)
+    num_args = len(fit_flag)
+    y = np.asarray(y, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+    num_sets = y.shape[1]
+    if p0 is None:
+        p0 = np.mean(bounds, axis=0)
+    p0 = np.broadcast_to(np.asarray(p0, dtype=np.float64),
+                         (num_sets, num_args))
+
+    lb, ub = bounds
+    logvar = (lb > 0) & (ub > 100 * lb)
+    rng = np.random.default_rng(random_state)
+    shape = (num_starts, num_sets, num_args)
+    starts = np.empty(shape)
+    starts[:] = p0
+    num_near = num_starts // 2
+    # perturbed around p0
+    u = rng.uniform(-1, 1, shape)
+    near = np.where(logvar, p0 * 10.0 ** u, p0 + u * (ub - lb) / 4)
+    # anywhere in the bounds
+    u = rng.uniform(0, 1, shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        far = np.where(logvar, lb * (ub / lb) ** u, lb + u * (ub - lb))
+    starts[1:num_near + 1] = near[1:num_near + 1]
+    starts[num_near + 1:] = far[num_near + 1:]
+    starts = np.clip(starts, lb, ub)
+
+    line, val = fit_with_fixed_batch_raw(
+        base_func, x, np.tile(y, num_starts), np.tile(sigma, num_starts),
+        bounds, fit_flag, fit_x, p0=starts.reshape(-1, num_args), jac=jac,
+        verbose=False, **kwargs)
+
+    ok = np.array([v['success'] for v in line]).reshape(num_starts, -1)
+    model = _eval_batch(base_func, np.asarray(x, dtype=np.float64),
+                        val[:, 0])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        chi2 = np.sum(((model - np.tile(y, num_starts)) /
+                       np.tile(sigma, num_starts)) ** 2, axis=0)
+    chi2 = np.where(ok.ravel() & np.isfinite(chi2), chi2, np.inf)
+    chi2 = chi2.reshape(num_starts, -1)
+    val = val.reshape(num_starts, num_sets, 2, num_args)
+    best = np.argmin(chi2, axis=0)
+
+    fit_line = []
+    fit_val = np.zeros((num_sets, 2, num_args))
+    for n in range(num_sets):
+        k = best[n]
+        fit_val[n] = val[k, n]
+        lines = [line[m * num_sets + n] for m in range(num_starts)]
+        if not lines[k]['success']:
+            logger.info('%s in all %d starts', lines[k]['msg'], num_starts)
+        conv = np.isfinite(chi2[:, n])
+        near_best = chi2[:, n] <= chi2[k, n] + 1
+        spread = np.zeros(num_args)
+        if np.sum(near_best) > 1:
+            spread = np.std(val[near_best, n, 0], axis=0)
+        fit_line.append(dict(
+            lines[k],
+            nit=sum([v.get('nit', 0) for v in lines]),
+            nfev=sum([v.get('nfev', 0) for v in lines]),
+            time=sum([v.get('time', 0) for v in lines]),
+            num_starts=num_starts,
+            num_converged=int(np.sum(conv)),
+            chi2=float(chi2[k, n]),
+            chi2_range=(float(np.min(chi2[conv, n])),
+                        float(np.max(chi2[conv, n]))) if np.any(conv)
+            else (np.inf, np.inf),
+            num_best=int(np.sum(near_best & conv)),
+            param_spread=spread))
+    return fit_line, fit_val
+
+
+def bootstrap_with_fixed_batch_raw(base_func, x, sigma, bounds, fit_flag,
+                                   fit_val, num_samples=100, level=0.95,
+                                   jac=None, random_state=0,
+                                   max_columns=20000, **kwargs):
+    """
+    parametric bootstrap of fitting results: each sample is the fitted
+    model plus N(0, sigma) noise at every x, i.e. the g2 points are not
+    resampled; sigma only sets the noise level. the samples are fitted
+    again with fit_with_fixed_batch_raw starting from the fitted values,
+    many samples of all the columns in one call.
+    :param sigma: the errors of the data (g2_err_mod for g2),
+        (x.size, num_columns)
+    :param fit_val: the fitting results, see fit_with_fixed_batch_raw; the
+        failed columns (negative errors) are skipped
+    :param num_samples: number of samples of each column
+    :param level: the confidence level of the percentile intervals
+    :param random_state: seed of the noise, so the results are reproducible
+    :param max_columns: the maximal number of columns in one call of the
+        solver, to limit the memory
+    :param kwargs: passed to fit_with_fixed_batch_raw
+    :return: a tuple of (the intervals, (num_columns, 2, num_args), nan for
+        the skipped columns; the number of samples fitted successfully of
+        each column)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+    num_sets, _, num_args = fit_val.shape
+    ci = np.full((num_sets, 2, num_args), np.nan)
+    num_ok = np.zeros(num_sets, dtype=int)
+
+    idx = np.nonzero(np.all(fit_val[:, 1] >= 0, axis=1))[0]
+    if idx.size == 0 or num_samples < 1:
+        return ci, num_ok
+    best = fit_val[idx, 0]
+    model = _eval_batch(base_func, x, best)
+    sig = np.where(sigma[:, idx] > 0, sigma[:, idx], 0)
+
+    rng = np.random.default_rng(random_state)
+    samples = np.full((num_samples, idx.size, num_args), np.nan)
+    step = max(1, max_columns // idx.size)
+    for beg in range(0, num_samples, step):
+        num = min(step, num_samples - beg)
+        y = np.tile(model, num) + np.tile(sig, num) * \
+            rng.standard_normal((x.size, num * idx.size))
+        line, val = fit_with_fixed_batch_raw(
+            base_func, x, y, np.tile(sigma[:, idx], num), bounds, fit_flag,
+            x[:1], p0=np.tile(best, (num, 1)), jac=jac, verbose=False,
+            **kwargs)
+        ok = np.array([v['success'] for v in line])
+        val = np.where(ok[:, None], val[:, 0], np.nan)
+        samples[beg:beg + num] = val.reshape(num, idx.size, num_args)
+
+    alpha = (1 - level) / 2 * 100
+    with warnings.catch_warnings():
+        # the columns without any successful sample are nan
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ci[idx] = np.nanpercentile(samples, [alpha, 100 - alpha],
+                                   axis=0).transpose(1, 0, 2)
+    num_ok[idx] = np.sum(np.all(np.isfinite(samples), axis=2), axis=0)
+    return ci, num_ok
+
+
+def single_exp_all(x, a, b, c, d):
+    """
+    single exponential fitting for xpcs-multitau analysis
+    :param x: delay in seconds
+    :param a: contrast
+    :param b: tau
+    :param c: restriction factor
+    :param d: baseline
+    :return:
+    """
+    return a * np.exp(-2 * (x / b) ** c) + d
+
+
+def double_exp_all(x, a, b1, c1, d, b2, c2, f):
+    """
+    double exponential fitting for xpcs-multitau analysis
+    Args:
+        x: delay in seconds, float or 1d-numpy.ndarray
+        a: contrast
+        f: fraction for the 1st exp function; the 2nd has (1-f) weight
+        b1: tau for 1st exp function
+        c1: restriction factor for the 1st exp function
+        b2: tau for 2nd exp function
+        c2: restriction factor for the 2nd exp function
+        d: baseline
+    Return:
+        function value
+    """
+    t1 = np.exp(-1 * (x / b1) ** c1) * f
+    t2 = np.exp(-1 * (x / b2) ** c2) * (1 - f)
+    return a * (t1 + t2) ** 2 + d
+
+
+def single_exp_all_jac(x, a, b, c, d):
+    """
+    derivatives of single_exp_all with respect to a, b, c and d
+    """
+    u = (x / b) ** c
+    e = np.exp(-2 * u)
+    return [e, 2 * a * e * c * u / b, -2 * a * e * u * np.log(x / b),
+            np.ones_like(e)]
+
+
+def double_exp_all_jac(x, a, b1, c1, d, b2, c2, f):
+    """
+    derivatives of double_exp_all with respect to all the arguments, in
+    the same order
+    """
+    u1 = (x / b1) ** c1
+    u2 = (x / b2) ** c2
+    e1 = np.exp(-1 * u1)
+    e2 = np.exp(-1 * u2)
+    s = e1 * f + e2 * (1 - f)
+    k = 2 * a * s
+    return [s ** 2,
+            k * f * e1 * c1 * u1 / b1,
+            -k * f * e1 * u1 * np.log(x / b1),
+            np.ones_like(s),
+            k * (1 - f) * e2 * c2 * u2 / b2,
+            -k * (1 - f) * e2 * u2 * np.log(x / b2),
+            k * (e1 - e2)]
+
+
+def power_law(x, a, b):
+    """
+    power law for fitting the diffusion factor
+    :param x: tau
+    :param a:
+    :param b:
+    :return:
+    """
+    return a * x ** b
+
+
+def seed_g2(t_el, g2, bounds, fit_func='single'):
+    """
+    estimate the initial values of the g2 fitting of each q from the data.
+    the baseline is the mean of the tail and the contrast is the head above
+    it; on the decaying part, log(-log(y) / 2) = c * log(t) - c * log(tau)
+    with y the normalized g2, so the stretch and tau come from a linear
+    regression in log scale, done for all q at once.
+    :param g2: (t_el.size, num_q)
+    :return: a tuple of (the initial values, (num_q, num_args); True for the
+        q whose tau is estimated from the data, False if it's a guess)
+    """
+    bounds = np.array(bounds, dtype=np.float64)
+    num_q = g2.shape[1]
+    num = max(1, t_el.size // 10)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        d = np.nanmean(g2[-num:], axis=0)
+        a = np.nanmean(g2[:3], axis=0) - d
+    d = np.clip(np.nan_to_num(d, nan=np.mean(bounds[:, 3])),
+                bounds[0, 3], bounds[1, 3])
+    a = np.clip(np.nan_to_num(a, nan=np.mean(bounds[:, 0])),
+                max(bounds[0, 0], 1e-6), bounds[1, 0])
+
+    y = (g2 - d) / a
+    # only the decay before it first reaches the noisy tail is used
+    low = np.nan_to_num(y, nan=1.0) < 0.15
+    first_low = np.where(np.any(low, axis=0), np.argmax(low, axis=0),
+                         t_el.size)
+    mask = np.isfinite(y) & (y < 0.9) & \
+        (np.arange(t_el.size)[:, None] < first_low)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lx = np.where(mask, np.log(t_el)[:, None], 0)
+        ly = np.where(mask, np.log(-0.5 * np.log(np.where(mask, y, 0.5))), 0)
+        n = np.sum(mask, axis=0)
+        sx, sy = np.sum(lx, axis=0), np.sum(ly, axis=0)
+        sxx, sxy = np.sum(lx * lx, axis=0), np.sum(lx * ly, axis=0)
+        c = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+        log_tau = (c * sx - sy) / (c * n)
+
+    c_mid = np.mean(bounds[:, 2])
+    found = (n >= 2) & np.isfinite(c) & (c > 0) & np.isfinite(log_tau)
+    c = np.where(found, c, c_mid)
+    # one point on the decay gives tau for the default stretch
+    one = (n == 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_tau1 = (sx - sy / c_mid)
+    log_tau = np.where(found, log_tau, np.where(one, log_tau1, np.nan))
+    found = found | (one & np.isfinite(log_tau))
+    log_tau = np.where(found, log_tau,
+                       0.5 * np.log(bounds[0, 1] * bounds[1, 1]))
+
+    tau = np.clip(np.exp(log_tau), bounds[0, 1], bounds[1, 1])
+    c = np.clip(c, bounds[0, 2], bounds[1, 2])
+    # a tiny contrast stalls the solver; without a decay it's a guess anyway
+    a = np.where(found, a, np.mean(bounds[:, 0]))
+    if fit_func == 'single':
+        p0 = np.stack([a, tau, c, d], axis=1)
+    else:
+        # the two decays start on each side of the single one
+        tau1 = np.clip(tau / 3, bounds[0, 1], bounds[1, 1])
+        tau2 = np.clip(tau * 3, bounds[0, 4], bounds[1, 4])
+        c2 = np.clip(c, bounds[0, 5], bounds[1, 5])
+        f = np.full(num_q, np.mean(bounds[:, 6]))
+        p0 = np.stack([a, tau1, c, d, tau2, c2, f], axis=1)
+    return p0, found
+
+
+def same_fit_flag(saved, fit_flag):
+    """
+    check if the fit_flag saved in a fit_summary, which is a str, is the
+    same as fit_flag; lists, tuples and arrays of the same bools are equal
+    """
+    try:
+        saved = ast.literal_eval(saved)
+    except (ValueError, SyntaxError):
+        return saved == str(fit_flag)
+    if saved is None or fit_flag is None:
+        return saved is None and fit_flag is None
+    return tuple(map(bool, saved)) == tuple(map(bool, fit_flag))
+
+
+def match_prev_fit(prev, t_el, q, bounds, fit_flag, fit_func, p0,
+                   num_starts=1, bootstrap=0, level=0.95):
+    """
+    compare a previous fit_summary of a file with a new fitting of the same
+    file; its results are used as the initial values where they are inside
+    the new bounds, and the q columns whose data, constraints and fitting
+    settings haven't changed are not fitted again.
+    :param prev: the previous fit_summary, or None
+    :param p0: the default initial values, (num_args, ) or (q.size, num_args)
+    :param num_starts: number of starts of the new fitting
+    :param bootstrap: number of bootstrap samples of the new fitting
+    :param level: the confidence level of the bootstrap intervals
+    :return: a tuple of (p0 of each column, (q.size, num_args); the index of
+        the column in prev, or -1 if it can't be reused)
+    """
+    p0 = np.array(np.broadcast_to(p0, (q.size, np.shape(p0)[-1])))
+    reuse = np.full(q.size, -1)
+    if prev is None or prev['fit_func'] != fit_func or \
+            not np.array_equal(prev['t_el'], t_el):
+        return p0, reuse
+    # a global fit isn't the optimum of each q; it's only a good start
+    independent = prev.get('fit_mode', 'independent') == 'independent'
+    prev_boot = prev.get('bootstrap', None)
+    if prev_boot is None:
+        prev_boot = (0, None)
+    else:
+        prev_boot = (prev_boot['num_samples'], prev_boot['level'])
+    same_settings = independent and \
+        prev.get('num_starts', None) == num_starts and \
+        prev_boot == ((bootstrap, level) if bootstrap > 0 else (0, None))
+
+    new_b = np.array(bounds, dtype=np.float64)
+    old_b = np.array(prev['bounds'], dtype=np.float64)
+    flag = np.array(fit_flag, dtype=bool)
+    changed = np.any(old_b != new_b, axis=0)
+    # the same problem if the fixed values are the same and the variables
+    # whose bounds changed weren't stopped by the old bounds
+    same_problem = same_fit_flag(prev['fit_flag'], fit_flag) and \
+        not np.any(changed[~flag])
+
+    for n in range(q.size):
+        idx = np.nonzero(np.isclose(prev['q_val'], q[n], rtol=1e-9,
+                                    atol=0))[0]
+        if idx.size == 0 or not prev['fit_line'][idx[0]].get('success'):
+            continue
+        k = idx[0]
+        val = prev['fit_val'][k, 0]
+        inside = (val >= new_b[0]) & (val <= new_b[1])
+        p0[n] = np.where(inside & flag, val, p0[n])
+        interior = (val > old_b[0]) & (val < old_b[1]) & \
+            (val > new_b[0]) & (val < new_b[1])
+        if same_settings and same_problem and \
+                np.all(interior[flag & changed]):
+            reuse[n] = k
+    return p0, reuse
+
+
+# the double exp has many local minima, so it's fitted from several starts
+default_num_starts = {'single': 1, 'double': 8}
+
+
+def fit_g2_data(data, bounds, fit_flag=None, fit_func='single', prev=None,
+                num_starts=None, bootstrap=0, level=0.95):
+    """
+    fit the g2 data of many files; the files with the same delay times are
+    fitted together with one vectorized solver. it only works on arrays so
+    it can run in other processes.
+    :param data: list of the output of XpcsFile.get_g2_fit_data
+    :param prev: list of the previous fit_summary of each file (or None);
+        see match_prev_fit
+    :param num_starts: number of starts of each q, see
+        fit_with_fixed_multistart_raw; None to use default_num_starts
+    :param bootstrap: number of bootstrap samples of each q; if positive,
+        the percentile intervals are added to fit_summary as fit_ci, see
+        bootstrap_with_fixed_batch_raw
+    :param level: the confidence level of the bootstrap intervals
+    :return: list of the fit_summary of each file
+    """
+    assert len(bounds) == 2
+    if fit_func == 'single':
+        assert len(bounds[0]) == 4, \
+            "for single exp, the shape of bounds must be (2, 4)"
+        if fit_flag is None:
+            fit_flag = [True for _ in range(4)]
+        func, jac = single_exp_all, single_exp_all_jac
+    else:
+        assert len(bounds[0]) == 7, \
+            "for double exp, the shape of bounds must be (2, 7)"
+        if fit_flag is None:
+            fit_flag = [True for _ in range(7)]
+        func, jac = double_exp_all, double_exp_all_jac
+
+    if num_starts is None:
+        num_starts = default_num_starts[fit_func]
+
+    groups = {}
+    for n, (t_el, q, g2, sigma, _, _) in enumerate(data):
+        key = (t_el.size, t_el.tobytes())
+        groups.setdefault(key, []).append(n)
+
+    if prev is None:
+        prev = [None] * len(data)
+
+    result = [None] * len(data)
+    for index in groups.values():
+        t_el = data[index[0]][0]
+        fit_x = np.logspace(np.log10(np.min(t_el)) - 0.5,
+                            np.log10(np.max(t_el)) + 0.5, 128)
+        g2 = np.hstack([data[n][2] for n in index])
+        sigma = np.hstack([data[n][3] for n in index])
+
+        # the seeds from the data; the previous results come first
+        t0 = time.perf_counter()
+        p0, _ = seed_g2(t_el, g2, bounds, fit_func)
+        seed_time = time.perf_counter() - t0
+        match, beg = [], 0
+        for n in index:
+            end = beg + data[n][1].size
+            match.append(match_prev_fit(prev[n], t_el, data[n][1], bounds,
+                                        fit_flag, fit_func, p0[beg:end],
+                                        num_starts, bootstrap, level))
+            beg = end
+        reuse = np.hstack([x[1] for x in match])
+        todo = reuse < 0
+
+        fit_line = [None] * reuse.size
+        fit_val = np.zeros((reuse.size, 2, len(fit_flag)))
+        if np.any(todo):
+            p0_todo = np.vstack([x[0] for x in match])[todo]
+            if num_starts > 1:
+                line, val = fit_with_fixed_multistart_raw(
+                    func, t_el, g2[:, todo], sigma[:, todo], bounds,
+                    fit_flag, fit_x, p0=p0_todo, jac=jac,
+                    num_starts=num_starts)
+            else:
+                line, val = fit_with_fixed_batch_raw(
+                    func, t_el, g2[:, todo], sigma[:, todo], bounds,
+                    fit_flag, fit_x, p0=p0_todo, jac=jac)
+            fit_val[todo] = val
+            for m, k in enumerate(np.nonzero(todo)[0]):
+                fit_line[k] = line[m]
+
+        beg = 0
+        for n in index:
+            end = beg + data[n][1].size
+            for k in range(beg, end):
+                if reuse[k] >= 0:
+                    fit_val[k] = prev[n]['fit_val'][reuse[k]]
+                    # nothing is computed for the reused columns
+                    fit_line[k] = dict(prev[n]['fit_line'][reuse[k]],
+                                       nit=0, nfev=0, time=0.0,
+                                       stop='reused')
+            beg = end
+
+        if bootstrap > 0:
+            t0 = time.perf_counter()
+            # the samples start from the fitted values, including the
+            # reused ones
+            fit_ci, num_ok = bootstrap_with_fixed_batch_raw(
+                func, t_el, sigma, bounds, fit_flag, fit_val, bootstrap,
+                level, jac=jac)
+            bootstrap_time = time.perf_counter() - t0
+
+        beg = 0
+        for n in index:
+            t_el, q, _, _, q_range, t_range = data[n]
+            end = beg + q.size
+            lines = fit_line[beg:end]
+            fit_stats = {
+                'seed_time': seed_time * q.size / reuse.size,
+                'solve_time': sum([x.get('time', 0) for x in lines]),
+                'nit': sum([x.get('nit', 0) for x in lines]),
+                'nfev': sum([x.get('nfev', 0) for x in lines]),
+                'num_reused': int(np.sum(reuse[beg:end] >= 0)),
+                'num_failed': sum([not x['success'] for x in lines]),
+            }
+            result[n] = {
+                'fit_func': fit_func,
+                'fit_mode': 'independent',
+                'fit_val': fit_val[beg:end],
+                't_el': t_el,
+                'q_val': q,
+                'q_range': str(q_range),
+                't_range': str(t_range),
+                'bounds': bounds,
+                'fit_flag': str(fit_flag),
+                'fit_line': fit_line[beg:end],
+                'fit_stats': fit_stats,
+                'num_starts': num_starts
+            }
+            if bootstrap > 0:
+                result[n]['fit_ci'] = fit_ci[beg:end]
+                result[n]['bootstrap'] = {
+                    'num_samples': bootstrap,
+                    'level': level,
+                    'num_ok': num_ok[beg:end],
+                    'time': bootstrap_time * q.size / reuse.size
+                }
+            beg = end
+    return result
+
+
+def fit_g2_batch(xf_list, q_range=None, t_range=None, bounds=None,
+                 fit_flag=None, fit_func='single', use_cache=True,
+                 warm_start=True, num_starts=None, bootstrap=0, level=0.95):
+    """
+    fit the g2 of many files and set their fit_summary; see
+    XpcsFile.fit_g2 for the parameters.
+    :param use_cache: if False, the files are fitted again even if their
+        results are in fit_cache
+    :param warm_start: if True, start from the files' current fit_summary
+        and keep the q columns that don't change; see match_prev_fit
+    :return: list of the fit_summary of each file
+    """
+    keys = [xf.get_fit_key(q_range, t_range, bounds, fit_flag, fit_func,
+                           num_starts=num_starts, bootstrap=bootstrap,
+                           level=level) for xf in xf_list]
+    result = [fit_cache.get(key) if use_cache else None for key in keys]
+    todo = [n for n in range(len(xf_list)) if result[n] is None]
+
+    data = [xf_list[n].get_g2_fit_data(q_range, t_range) for n in todo]
+    prev = [xf_list[n].fit_summary if warm_start else None for n in todo]
+    if len(data) > 0:
+        for n, fit_summary in zip(todo, fit_g2_data(data, bounds, fit_flag,
+                                                    fit_func, prev,
+                                                    num_starts, bootstrap,
+                                                    level)):
+            fit_cache.put(keys[n], fit_summary)
+            result[n] = fit_summary
+
+    for xf, fit_summary in zip(xf_list, result):
+        xf.fit_summary = fit_summary
+    return result
+
+
+def fit_tauq_batch(xf_list, q_range, bounds, fit_flag):
+    """
+    fit the tau(q) of many files with the power law at once and add the
+    results to their fit_summary; the files without fit_summary are skipped.
+    :param q_range: a tuple of q lower bound and upper bound
+    :param bounds: bounds of the power law's (a, b)
+    :param fit_flag: tuple of two bools; True to fit and False to fix
+    """
+    xf_list = [xf for xf in xf_list if xf.fit_summary is not None]
+    if len(xf_list) == 0:
+        return
+
+    data = []
+    for xf in xf_list:
+        x = xf.fit_summary['q_val']
+        q_slice = create_slice(x, q_range)
+        y = xf.fit_summary['fit_val'][q_slice, 0, 1]
+        sigma = xf.fit_summary['fit_val'][q_slice, 1, 1]
+        # filter out those invalid fittings; failed g2 fitting has -1 err
+        valid_idx = sigma > 0
+        data.append((x[q_slice][valid_idx], y[valid_idx],
+                     sigma[valid_idx]))
+
+    # pad the files to the same length; the padding has zero sigma
+    size = max([1] + [v[0].size for v in data])
+    x, y, sigma = np.ones((3, len(data), size))
+    sigma[:] = 0
+    fit_x = np.ones((len(data), 128))
+    for n, (x1, y1, s1) in enumerate(data):
+        x[n, :x1.size], y[n, :x1.size], sigma[n, :x1.size] = x1, y1, s1
+        if x1.size > 0:
+            fit_x[n] = np.logspace(np.log10(np.min(x1) / 1.1),
+                                   np.log10(np.max(x1) * 1.1), 128)
+
+    # the initial value for typical gel systems
+    p0 = [1.0e-7, -2.0]
+    fit_line, fit_val = fit_power_law_batch(x, y, sigma, bounds, fit_flag,
+                                            fit_x, p0=p0)
+
+    for n, xf in enumerate(xf_list):
+        x1, y1, s1 = data[n]
+        xf.fit_summary['tauq_success'] = x1.size > 0 and \
+            fit_line[n]['success']
+        xf.fit_summary['tauq_q'] = x1
+        xf.fit_summary['tauq_tau'] = y1
+        xf.fit_summary['tauq_tau_err'] = s1
+        xf.fit_summary['tauq_fit_line'] = fit_line[n]
+        xf.fit_summary['tauq_fit_val'] = fit_val[n]
+
+
+def seed_g2_global(t_el, q, g2, bounds, tauq_bounds):
+    """
+    the initial values for fit_g2_global_one; the power law is fitted to
+    the tau seeded at each q, see seed_g2.
+    :return: a tuple of (contrast, stretch and baseline of each q, (3, q.size);
+        (a, b) of the power law)
+    """
+    p0, found = seed_g2(t_el, g2, bounds, 'single')
+
+    tauq_bounds = np.array(tauq_bounds, dtype=np.float64)
+    p = np.mean(tauq_bounds, axis=0)
+    if tauq_bounds[0, 0] > 0:
+        p[0] = np.sqrt(tauq_bounds[0, 0] * tauq_bounds[1, 0])
+    # the power law is only fitted if it has a degree of freedom
+    if np.sum(found) > 2:
+        tau = p0[found, 1]
+        _, val = fit_power_law_batch(q[found], tau, tau * 0.1, tauq_bounds,
+                                     (True, True), q)
+        p = val[0, 0]
+    p = np.clip(p, tauq_bounds[0], tauq_bounds[1])
+    return p0[:, [0, 2, 3]].T, p
+
+
+def fit_g2_global_one(t_el, q, g2, sigma, bounds, fit_flag, tauq_bounds,
+                      tauq_flag, share, fit_x):
+    """
+    fit the single exp g2 of all q of one file together, with tau tied to
+    q by the power law tau = a_t * q ** b_t; it's one least squares problem
+    whose Jacobian is block sparse, as the per q variables only change
+    their own q.
+    :param bounds: bounds of the single exp; the ones of tau are not used
+    :param fit_flag: the fit flags of the single exp; the one of tau is
+        not used
+    :param tauq_bounds: bounds of (a_t, b_t)
+    :param tauq_flag: fit flags of (a_t, b_t)
+    :param share: tuple of three bools for contrast, stretch and baseline;
+        True to use one value for all q, False to fit each q
+    :return: a tuple of (fit_line, fit_val, tauq_fit_val, info)
+    """
+    num_t, num_q = g2.shape
+    bounds = np.array(bounds, dtype=np.float64)
+    tauq_bounds = np.array(tauq_bounds, dtype=np.float64)
+    fit_flag = np.array(fit_flag, dtype=bool)
+    tauq_flag = np.array(tauq_flag, dtype=bool)
+
+    valid = np.isfinite(g2) & np.isfinite(sigma) & (sigma > 0)
+    w = np.where(valid, 1.0 / np.where(valid, sigma, 1), 0)
+    g2 = np.where(valid, g2, 0)
+
+    seed, p_t = seed_g2_global(t_el, q, g2, bounds, tauq_bounds)
+    # the power law is fitted with log(a_t)
+    with np.errstate(divide='ignore'):
+        lb_t = np.array([np.log(tauq_bounds[0, 0]), tauq_bounds[0, 1]])
+    ub_t = np.array([np.log(tauq_bounds[1, 0]), tauq_bounds[1, 1]])
+    p_t = np.array([np.log(p_t[0]), p_t[1]])
+
+    # the column of each variable in x, -1 if it's fixed; contrast, stretch
+    # and baseline have one column for each q
+    x0, lb, ub = [], [], []
+    idx_t = np.full(2, -1)
+    for m in range(2):
+        if tauq_flag[m]:
+            idx_t[m] = len(x0)
+            x0.append(p_t[m])
+            lb.append(lb_t[m])
+            ub.append(ub_t[m])
+    fixed = np.zeros((3, num_q))
+    idx = np.full((3, num_q), -1)
+    for m, k in enumerate((0, 2, 3)):
+        fixed[m] = bounds[1, k]
+        if not fit_flag[k]:
+            continue
+        if share[m]:
+            idx[m] = len(x0)
+            x0.append(np.mean(seed[m]))
+            lb.append(bounds[0, k])
+            ub.append(bounds[1, k])
+        else:
+            idx[m] = np.arange(len(x0), len(x0) + num_q)
+            x0.extend(seed[m])
+            lb.extend([bounds[0, k]] * num_q)
+            ub.extend([bounds[1, k]] * num_q)
+    x0 = np.clip(x0, lb, ub)
+    num_x = x0.size
+    log_q = np.log(q)
+
+    def unpack(x):
+        val = np.where(idx >= 0, x[idx], fixed)
+        la = x[idx_t[0]] if idx_t[0] >= 0 else ub_t[0]
+        lb_ = x[idx_t[1]] if idx_t[1] >= 0 else ub_t[1]
+        tau = np.exp(la + lb_ * log_q)
+        return val[0], tau, val[1], val[2]
+
+    # the sparsity pattern; residual n * num_t + t is delay t of q n
+    rows_q = np.arange(num_q * num_t).reshape(num_q, num_t)
+    rows, cols = [], []
+    for m in range(3):
+        for n in range(num_q):
+            if idx[m, n] >= 0:
+                rows.append(rows_q[n])
+                cols.append(np.full(num_t, idx[m, n]))
+    for m in range(2):
+        if idx_t[m] >= 0:
+            rows.append(rows_q.ravel())
+            cols.append(np.full(num_q * num_t, idx_t[m]))
+    rows = np.hstack(rows) if rows else np.zeros(0, dtype=int)
+    cols = np.hstack(cols) if cols else np.zeros(0, dtype=int)
+
+    def fun(x):
+        a, tau, c, d = unpack(x)
+        y = single_exp_all(t_el[:, None], a, tau, c, d)
+        return ((y - g2) * w).T.ravel()
+
+    def jac(x):
+        a, tau, c, d = unpack(x)
+        jx = single_exp_all_jac(t_el[:, None], a, tau, c, d)
+        # (num_q, num_t) blocks, weighted
+        jx = [(v * w).T for v in jx]
+        data = []
+        for m, k in enumerate((0, 2, 3)):
+            for n in range(num_q):
+                if idx[m, n] >= 0:
+                    data.append(jx[k][n])
+        # chain rule; d(tau)/d(log a_t) = tau, d(tau)/d(b_t) = tau * log(q)
+        dtau = jx[1] * tau[:, None]
+        if idx_t[0] >= 0:
+            data.append(dtau.ravel())
+        if idx_t[1] >= 0:
+            data.append((dtau * log_q[:, None]).ravel())
+        data = np.hstack(data) if data else np.zeros(0)
+        j = sparse.csr_matrix((data, (rows, cols)),
+                              shape=(num_q * num_t, num_x))
+        return j.toarray() if dense else j
+
+    # lsmr converges slowly on these problems, so the exact trust region
+    # solver is used unless the dense jacobian is too large
+    dense = num_q * num_t * num_x <= 4 * 1024 ** 2
+
+    info = {'success': False, 'nfev': 0, 'chi2_red': np.nan, 'msg': ''}
+    fit_val = np.zeros((num_q, 2, 4))
+    tauq_fit_val = np.zeros((2, 2))
+    try:
+        res = least_squares(fun, x0, jac=jac, bounds=(lb, ub),
+                            method='trf', x_scale='jac', max_nfev=1000,
+                            tr_solver='exact' if dense else 'lsmr')
+    except (ValueError, np.linalg.LinAlgError) as err:
+        info['msg'] = 'Fitting failed: %s' % err
+        res = None
+    else:
+        info['nfev'] = res.nfev
+        info['msg'] = res.message
+        info['success'] = res.status > 0
+
+    if not info['success']:
+        logger.info('global g2 fitting failed: %s', info['msg'])
+        a, tau, c, d = unpack(x0)
+        fit_val[:, 0] = np.stack([a, tau, c, d], axis=1)
+        fit_val[:, 1] = -1
+        tauq_fit_val[0] = [np.exp(p_t[0]), p_t[1]]
+        tauq_fit_val[1] = -1
+        fit_line = [{'fit_x': fit_x, 'fit_y': None, 'success': False,
+                     'msg': info['msg']} for _ in range(num_q)]
+        return fit_line, fit_val, tauq_fit_val, info
+
+    # the covariance scaled by chi2 / dof; j.T @ j keeps the sparsity
+    dof = np.sum(valid) - num_x
+    chi2 = np.sum(res.fun ** 2)
+    info['chi2_red'] = chi2 / dof if dof > 0 else np.inf
+    jtj = res.jac.T @ res.jac
+    jtj = jtj.toarray() if sparse.issparse(jtj) else jtj
+    cov = np.linalg.pinv(jtj, hermitian=True) * info['chi2_red']
+    var = np.diag(cov)
+
+    a, tau, c, d = unpack(res.x)
+    fit_val[:, 0] = np.stack([a, tau, c, d], axis=1)
+    err = np.where(idx >= 0, np.sqrt(var[idx]), 0)
+    fit_val[:, 1, 0], fit_val[:, 1, 2], fit_val[:, 1, 3] = err
+    # the error of log(tau) of each q from the two power law variables
+    g = np.zeros((num_q, num_x))
+    if idx_t[0] >= 0:
+        g[:, idx_t[0]] = 1
+    if idx_t[1] >= 0:
+        g[:, idx_t[1]] = log_q
+    fit_val[:, 1, 1] = tau * np.sqrt(np.einsum('ij,jk,ik->i', g, cov, g))
+
+    la = res.x[idx_t[0]] if idx_t[0] >= 0 else ub_t[0]
+    tauq_fit_val[0] = [np.exp(la), res.x[idx_t[1]] if idx_t[1] >= 0
+                       else ub_t[1]]
+    for m in range(2):
+        if idx_t[m] >= 0:
+            tauq_fit_val[1, m] = np.sqrt(var[idx_t[m]])
+    tauq_fit_val[1, 0] *= tauq_fit_val[0, 0]
+
+    fit_y = single_exp_all(fit_x[:, None], a, tau, c, d)
+    fit_line = [{'fit_x': fit_x, 'fit_y': fit_y[:, n], 'success': True,
+                 'msg': 'FittingSuccess'} for n in range(num_q)]
+    return fit_line, fit_val, tauq_fit_val, info
+
+
+def fit_g2_global_data(data, bounds, fit_flag=None, tauq_bounds=None,
+                       tauq_flag=None, share=(False, False, False)):
+    """
+    fit the single exp g2 of many files with tau tied across q by a power
+    law; see fit_g2_global_one. it only works on arrays so it can run in
+    other processes.
+    :param data: list of the output of XpcsFile.get_g2_fit_data
+    :return: list of the fit_summary of each file, with the power law in
+        the tauq fields
+    """
+    assert len(bounds) == 2 and len(bounds[0]) == 4, \
+        "global fitting uses single exp, the shape of bounds must be (2, 4)"
+    if fit_flag is None:
+        fit_flag = [True for _ in range(4)]
+    if tauq_bounds is None:
+        tauq_bounds = [[1.0e-12, -2.5], [1.0e-3, -0.5]]
+    if tauq_flag is None:
+        tauq_flag = [True, True]
+
+    result = []
+    for t_el, q, g2, sigma, q_range, t_range in data:
+        fit_x = np.logspace(np.log10(np.min(t_el)) - 0.5,
+                            np.log10(np.max(t_el)) + 0.5, 128)
+        fit_line, fit_val, tauq_fit_val, info = fit_g2_global_one(
+            t_el, q, g2, sigma, bounds, fit_flag, tauq_bounds, tauq_flag,
+            share, fit_x)
+        fit_x_q = np.logspace(np.log10(np.min(q) / 1.1),
+                              np.log10(np.max(q) * 1.1), 128)
+        result.append({
+            'fit_func': 'single',
+            'fit_mode': 'global',
+            'fit_val': fit_val,
+            't_el': t_el,
+            'q_val': q,
+            'q_range': str(q_range),
+            't_range': str(t_range),
+            'bounds': bounds,
+            'fit_flag': str(fit_flag),
+            'fit_line': fit_line,
+            'global_share': str(tuple(share)),
+            'global_info': info,
+            'tauq_success': info['success'],
+            'tauq_q': q,
+            'tauq_tau': fit_val[:, 0, 1],
+            'tauq_tau_err': fit_val[:, 1, 1],
+            'tauq_fit_line': {
+                'fit_x': fit_x_q,
+                'fit_y': tauq_fit_val[0, 0] * fit_x_q ** tauq_fit_val[0, 1],
+                'success': info['success'], 'msg': info['msg']},
+            'tauq_fit_val': tauq_fit_val,
+        })
+    return result
+
+
+def fit_g2_global_batch(xf_list, q_range=None, t_range=None, bounds=None,
+                        fit_flag=None, tauq_bounds=None, tauq_flag=None,
+                        share=(False, False, False), use_cache=True):
+    """
+    fit the g2 of many files with the global mode and set their
+    fit_summary; see fit_g2_global_data for the parameters.
+    :return: list of the fit_summary of each file
+    """
+    keys = [xf.get_fit_key(q_range, t_range, bounds, fit_flag, 'single',
+                           'global', tauq_bounds=tauq_bounds,
+                           tauq_flag=tauq_flag, share=share)
+            for xf in xf_list]
+    result = [fit_cache.get(key) if use_cache else None for key in keys]
+    todo = [n for n in range(len(xf_list)) if result[n] is None]
+
+    data = [xf_list[n].get_g2_fit_data(q_range, t_range) for n in todo]
+    if len(data) > 0:
+        for n, fit_summary in zip(todo, fit_g2_global_data(
+                data, bounds, fit_flag, tauq_bounds, tauq_flag, share)):
+            fit_cache.put(keys[n], fit_summary)
+            result[n] = fit_summary
+
+    for xf, fit_summary in zip(xf_list, result):
+        xf.fit_summary = fit_summary
+    return result
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import threading
+import weakref
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class ArrayInternStore(object):
+    """
+    keep one read-only copy of the arrays that have the same content, eg. the
+    qmaps and masks of the files in a series; an array stays in the store as
+    long as some XpcsFile uses it.
+    :param min_size: arrays smaller than min_size bytes are not interned
+    """
+    def __init__(self, min_size=256):
+        self.min_size = min_size
+        self.store = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.saved = 0
+
+    def intern(self, arr):
+        """
+        return the shared copy of arr; arr itself is shared and made
+        read-only if its content hasn't been seen.
+        """
+        if not isinstance(arr, np.ndarray) or arr.dtype == object or \
+                arr.nbytes < self.min_size:
+            return arr
+
+        arr = np.ascontiguousarray(arr)
+        digest = hashlib.blake2b(arr.data, digest_size=20).hexdigest()
+        key = (arr.dtype.str, arr.shape, digest)
+        with self.lock:
+            shared = self.store.get(key, None)
+            if shared is not None:
+                self.hits += 1
+                self.saved += arr.nbytes
+                return shared
+            arr.flags.writeable = False
+            self.store[key] = arr
+        return arr
+
+    def get_stats(self):
+        with self.lock:
+            return {'arrays': len(self.store), 'hits': self.hits,
+                    'saved': self.saved}
+
+
+array_store = ArrayInternStore()
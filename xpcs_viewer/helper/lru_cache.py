@@ -0,0 +1,138 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """
+    a least-recently-used cache with a budget in bytes;
+    :param max_size: the budget in bytes
+    :param sizeof: function to get the size of a value in bytes; it's called
+        again whenever the value is accessed because the size may change,
+        eg. lazily loaded fields
+    :param release: optional function to free the memory of a value without
+        removing it from the cache; when the cache is over budget, the least
+        recently used values are released first and removed only if that is
+        not enough
+    """
+    def __init__(self, max_size, sizeof, release=None):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.release = release
+        self.data = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        val = self.get(key)
+        if val is None:
+            raise KeyError(key)
+        return val
+
+    def __setitem__(self, key, val):
+        self.put(key, val)
+
+    def keys(self):
+        return list(self.data.keys())
+
+    def _update_size(self, key):
+        new_size = self.sizeof(self.data[key])
+        self.size += new_size - self.sizes.get(key, 0)
+        self.sizes[key] = new_size
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.data.move_to_end(key)
+            val = self.data[key]
+            self._update_size(key)
+            self._shrink(keep=(key, ))
+            return val
+
+    def put(self, key, val):
+        with self.lock:
+            self.data[key] = val
+            self.data.move_to_end(key)
+            self._update_size(key)
+            self._shrink(keep=(key, ))
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.size -= self.sizes.pop(key)
+            return self.data.pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.sizes.clear()
+            self.size = 0
+
+    def update_size(self, keys=None):
+        """
+        measure the size of some values (all values if keys is None) again
+        and evict the least recently used ones if needed; the measured
+        values are kept
+        :param keys: a list of keys, or None
+        """
+        with self.lock:
+            keep = () if keys is None else tuple(keys)
+            if keys is None:
+                keys = self.keys()
+            for k in keys:
+                if k in self.data:
+                    self._update_size(k)
+            self._shrink(keep=keep)
+
+    def set_max_size(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            self._shrink()
+
+    def _shrink(self, keep=()):
+        if self.size <= self.max_size:
+            return
+
+        victims = [k for k in self.data.keys() if k not in keep]
+        if self.release is not None:
+            for k in victims:
+                if self.size <= self.max_size:
+                    return
+                if self.sizes[k] > 0:
+                    self.release(self.data[k])
+                    self._update_size(k)
+                    self.evictions += 1
+
+        for k in victims:
+            if self.size <= self.max_size:
+                return
+            self.pop(k)
+            self.evictions += 1
+
+        if self.size > self.max_size:
+            logger.warning('the cache budget (%.1f MB) is smaller than a '
+                           'single entry (%.1f MB)', self.max_size / 1024 ** 2,
+                           self.size / 1024 ** 2)
+
+    def get_stats(self):
+        with self.lock:
+            return {'size': self.size, 'max_size': self.max_size,
+                    'entries': len(self.data), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
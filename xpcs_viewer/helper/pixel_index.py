@@ -0,0 +1,76 @@
+import numpy as np
+
+
+def compact_frame(frame, mask):
+    """
+    keep the pixels of a frame that are not masked;
+    :param frame: 2d detector image
+    :param mask: 2d mask; the pixels with zero mask are dropped and the
+        other pixels are multiplied by the mask
+    :return: (pixel_index, values); pixel_index is the sorted flat index of
+        the valid pixels
+    """
+    mask = mask.ravel()
+    pixel_index = np.flatnonzero(mask)
+    if mask.size < 2 ** 31:
+        pixel_index = pixel_index.astype(np.int32)
+    values = frame.ravel()[pixel_index] * mask[pixel_index]
+    return pixel_index, values
+
+
+def expand_frame(pixel_index, values, shape):
+    """
+    the dense frame of compact values; the masked pixels are zero
+    """
+    frame = np.zeros(int(np.prod(shape)), dtype=values.dtype)
+    frame[pixel_index] = values
+    return frame.reshape(shape)
+
+
+def same_pixels(index_a, index_b):
+    if index_a is None or index_b is None:
+        return index_a is index_b
+    return index_a is index_b or np.array_equal(index_a, index_b)
+
+
+class PixelSum(object):
+    """
+    the sum of many saxs_2d frames; the compact values are added directly
+    as long as the frames have the same valid pixels, otherwise the sum
+    continues with the dense frames.
+    """
+    def __init__(self):
+        self.pixel_index = None
+        self.shape = None
+        self.value = None
+
+    def add(self, pixel_index, values, shape):
+        """
+        :param pixel_index: the valid pixels; None if values is dense
+        :param values: 1d array of the pixel values
+        :param shape: shape of the dense frame
+        :return: False if the frame doesn't fit the sum
+        """
+        if self.value is None:
+            self.pixel_index, self.shape = pixel_index, tuple(shape)
+            self.value = np.array(values, copy=True)
+            return True
+        if tuple(shape) != self.shape:
+            return False
+        if not same_pixels(pixel_index, self.pixel_index):
+            self.value = self.get().ravel()
+            self.pixel_index = None
+            if pixel_index is not None:
+                values = expand_frame(pixel_index, values, shape).ravel()
+        self.value += values
+        return True
+
+    def get(self):
+        """
+        the dense sum; None if nothing is added
+        """
+        if self.value is None:
+            return None
+        if self.pixel_index is None:
+            return self.value.reshape(self.shape)
+        return expand_frame(self.pixel_index, self.value, self.shape)
@@ -0,0 +1,109 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def compute_qmap(shape, bcx, bcy, det_dist, X_energy, pix_dim_x, pix_dim_y,
+                 dtype=np.float64):
+    """
+    compute the q, phi and radius (in pixels) maps of a detector;
+    :param shape: shape of the detector, (rows, columns)
+    :param bcx: beam center, column
+    :param bcy: beam center, row
+    :param det_dist: detector distance
+    :param X_energy: x-ray energy in keV
+    :param pix_dim_x: pixel size, column
+    :param pix_dim_y: pixel size, row
+    :param dtype: dtype of the maps
+    :return: dictionary with the phi, q and r_pixel maps
+    """
+    k0 = 2 * np.pi / (12.398 / X_energy)
+    v = np.arange(shape[0], dtype=np.uint32) - bcy
+    h = np.arange(shape[1], dtype=np.uint32) - bcx
+    vg, hg = np.meshgrid(v, h, indexing='ij')
+
+    r = np.hypot(vg * pix_dim_y, hg * pix_dim_x)
+    r_pixel = np.hypot(vg, hg)
+    # phi = np.arctan2(vg, hg)
+    # to be compatible with matlab xpcs-gui; phi = 0 starts at 6 clock
+    # and it goes clockwise;
+    phi = np.arctan2(hg, vg)
+    phi[phi < 0] = phi[phi < 0] + np.pi * 2.0
+    phi = np.max(phi) - phi     # make it clockwise
+
+    alpha = np.arctan(r / det_dist)
+    qr = 2 * np.sin(alpha / 2) * k0
+    # qx = qr * np.cos(phi)
+    # qy = qr * np.sin(phi)
+    phi = np.rad2deg(phi)
+
+    # the maps are computed in float64 and converted at the end
+    qmap = {
+        'phi': phi.astype(dtype, copy=False),
+        'q': qr.astype(dtype, copy=False),
+        'r_pixel': r_pixel.astype(dtype, copy=False)
+    }
+    return qmap
+
+
+class QMapCache(object):
+    """
+    the qmaps for the recently used geometries; the files in a series share
+    the same geometry, so a qmap is computed once and the read-only arrays
+    are used by all of them.
+    :param max_entries: number of geometries to keep
+    :param dtype: dtype of the maps; float32 halves the memory
+    """
+    def __init__(self, max_entries=4, dtype=np.float64):
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def set_dtype(self, dtype):
+        with self.lock:
+            if np.dtype(dtype) != self.dtype:
+                self.dtype = np.dtype(dtype)
+                self.data.clear()
+
+    def get_key(self, shape, *geometry):
+        return (tuple(shape), ) + tuple([float(x) for x in geometry]) + \
+            (self.dtype.str, )
+
+    def get(self, shape, bcx, bcy, det_dist, X_energy, pix_dim_x,
+            pix_dim_y):
+        """
+        get the qmap of a geometry; see compute_qmap for the parameters
+        """
+        geometry = (bcx, bcy, det_dist, X_energy, pix_dim_x, pix_dim_y)
+        with self.lock:
+            key = self.get_key(shape, *geometry)
+            if key in self.data:
+                self.hits += 1
+                self.data.move_to_end(key)
+                return self.data[key]
+            self.misses += 1
+            dtype = self.dtype
+
+        qmap = compute_qmap(shape, *geometry, dtype=dtype)
+        for val in qmap.values():
+            val.flags.writeable = False
+
+        with self.lock:
+            self.data[key] = qmap
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+        return qmap
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+qmap_cache = QMapCache()
@@ -0,0 +1,395 @@
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+
+
+logger = logging.getLogger(__name__)
+
+
+# id(array) -> (weakref to the array, digest)
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def get_digest(arr):
+    """
+    content digest of an array; it's memorized for the read-only (shared)
+    arrays since they can't change.
+    """
+    arr_id = id(arr)
+    with _digest_lock:
+        record = _digest_memo.get(arr_id, None)
+        if record is not None and record[0]() is arr:
+            return record[1]
+
+    digest = hashlib.blake2b(np.ascontiguousarray(arr).data,
+                             digest_size=20).hexdigest()
+    digest = (arr.dtype.str, arr.shape, digest)
+    if not arr.flags.writeable:
+        with _digest_lock:
+            # drop the records of the arrays that have been released
+            for k in [k for k, v in _digest_memo.items() if v[0]() is None]:
+                _digest_memo.pop(k)
+            _digest_memo[arr_id] = (weakref.ref(arr), digest)
+    return digest
+
+
+def get_roi_key(roi_parameter, phi_num=180):
+    """
+    the part of a roi that decides which pixels go to which bin
+    """
+    if roi_parameter['sl_type'] == 'Pie':
+        return ('Pie', tuple([float(x) for x in
+                              roi_parameter['angle_range']]))
+    elif roi_parameter['sl_type'] == 'Ring':
+        return ('Ring', tuple([float(x) for x in roi_parameter['radius']]),
+                int(phi_num))
+    elif roi_parameter['sl_type'] == 'Cake':
+        qmin, qmax = roi_parameter.get('qmin'), roi_parameter.get('qmax')
+        return ('Cake', int(roi_parameter['q_num']),
+                int(roi_parameter['phi_num']),
+                roi_parameter.get('q_scale', 'linear'),
+                None if qmin is None else float(qmin),
+                None if qmax is None else float(qmax))
+    raise ValueError('roi type not supported: %s' % roi_parameter['sl_type'])
+
+
+class RoiOperator(object):
+    """
+    a sparse (num_bins, num_pixels) matrix that averages the pixels in each
+    bin of a roi; the data of a roi is matrix @ saxs_2d.ravel()
+    """
+    def __init__(self, index, num_bins, x=None):
+        """
+        :param index: 1d array of the bin index (1-based) of each pixel;
+            0 means the pixel is not used
+        :param num_bins: number of bins
+        :param x: the x-axis of the roi data, eg. phi for the ring roi
+        """
+        cols = np.nonzero(index)[0]
+        rows = index[cols] - 1
+        count = np.bincount(rows, minlength=num_bins)
+        weight = 1.0 / np.maximum(count, 1)
+        self.matrix = sparse.csr_matrix((weight[rows], (rows, cols)),
+                                        shape=(num_bins, index.size))
+        self.count = count
+        self.x = x
+        # (digest of pixel_index, matrix on the compact pixels)
+        self._compact = None
+
+    def get_matrix(self, pixel_index=None):
+        """
+        :param pixel_index: the flat index of the pixels that the data has,
+            see XpcsFile.get_pixel_data; None for the full frames
+        """
+        if pixel_index is None:
+            return self.matrix
+        digest = get_digest(pixel_index)
+        compact = self._compact
+        if compact is None or compact[0] != digest:
+            compact = (digest, self.matrix[:, pixel_index].tocsr())
+            self._compact = compact
+        return compact[1]
+
+    def apply(self, data, pixel_index=None):
+        """
+        :param data: one frame, or a (num_pixels, num_frames) block
+        :param pixel_index: the pixels that data has; None for full frames
+        :return: (num_bins, ) or (num_bins, num_frames) array
+        """
+        matrix = self.get_matrix(pixel_index)
+        if not (data.ndim == 2 and data.shape[0] == matrix.shape[1]):
+            data = data.ravel()
+        return matrix @ data
+
+
+def build_pie_operator(qmap, pmap, mask, sqspan, angle_range):
+    pmin, pmax = angle_range
+    if pmax < pmin:
+        pmax += 360.0
+        pmap = np.where(pmap < pmin, pmap + 360.0, pmap)
+    proi = np.logical_and(pmap >= pmin, pmap < pmax)
+    proi = np.logical_and(proi, (mask > 0)).ravel()
+
+    # q bin n (1-based) covers [sqspan[n - 1], sqspan[n])
+    qsize = len(sqspan) - 1
+    index = np.searchsorted(sqspan, qmap.ravel(), side='right')
+    index[index > qsize] = 0
+    index[~proi] = 0
+    return RoiOperator(index, qsize)
+
+
+def build_ring_operator(rmap, pmap, mask, radius, phi_num=180):
+    rmin, rmax = radius
+    if rmin > rmax:
+        rmin, rmax = rmax, rmin
+    rroi = np.logical_and(rmap >= rmin, rmap < rmax)
+    rroi = np.logical_and(rroi, (mask > 0)).ravel()
+    pmap = pmap.ravel()
+
+    phi_min, phi_max = np.min(pmap[rroi]), np.max(pmap[rroi])
+    x = np.linspace(phi_min, phi_max, phi_num)
+    delta = (phi_max - phi_min) / phi_num
+    index = np.zeros(pmap.size, dtype=np.int64)
+    sel = ((pmap[rroi] - phi_min) / delta).astype(np.int64)
+    sel[sel == phi_num] = phi_num - 1
+    index[rroi] = sel + 1
+    return RoiOperator(index, phi_num, x=x)
+
+
+def get_q_edges(qmap, mask, q_num, q_scale='linear', qmin=None,
+                qmax=None):
+    """
+    the edges of q bins; qmin and qmax default to the range of the valid
+    pixels
+    """
+    valid = mask > 0
+    if q_scale == 'log':
+        # log bins can't start at the beam center
+        valid = np.logical_and(valid, qmap > 0)
+    if not np.any(valid):
+        raise ValueError('no valid pixels in the mask')
+    if qmin is None:
+        qmin = np.min(qmap[valid])
+    if qmax is None:
+        qmax = np.max(qmap[valid])
+    if q_scale == 'log':
+        return np.logspace(np.log10(qmin), np.log10(qmax), q_num + 1)
+    elif q_scale == 'linear':
+        return np.linspace(qmin, qmax, q_num + 1)
+    raise ValueError('q_scale must be linear or log: %s' % q_scale)
+
+
+def build_cake_operator(qmap, pmap, mask, q_edges, phi_num=360,
+                        q_scale='linear'):
+    """
+    the q-phi remap (or re-partition) of saxs_2d; bin (phi_index, q_index)
+    is stored at row phi_index * q_num + q_index, so the result reshapes to
+    (phi_num, q_num). the phi axis covers [0, 360); the pixels outside of
+    q_edges are not used.
+    """
+    q_num = len(q_edges) - 1
+    qmap = qmap.ravel()
+    # the last edge is included
+    qsel = np.searchsorted(q_edges, qmap, side='right') - 1
+    qsel[qmap == q_edges[-1]] = q_num - 1
+    valid = np.logical_and(mask.ravel() > 0,
+                           np.logical_and(qsel >= 0, qsel < q_num))
+    psel = (pmap.ravel() / 360.0 * phi_num).astype(np.int64)
+    psel = np.clip(psel, 0, phi_num - 1)
+
+    index = psel * q_num + qsel + 1
+    index[~valid] = 0
+    if q_scale == 'log':
+        q = np.sqrt(q_edges[1:] * q_edges[:-1])
+    else:
+        q = (q_edges[1:] + q_edges[:-1]) / 2.0
+    phi_edges = np.linspace(0, 360.0, phi_num + 1)
+    x = (q, (phi_edges[1:] + phi_edges[:-1]) / 2.0)
+    return RoiOperator(index, q_num * phi_num, x=x)
+
+
+class SortedBins(object):
+    """
+    the pixels sorted by (bin, key) for the live roi profiles; with the
+    cumulative sum of a frame in this order, the sum and the number of the
+    pixels with lo <= key < hi in every bin take two searchsorted lookups
+    per bin, so a roi can be updated while it's being dragged.
+    """
+    def __init__(self, index, key, num_bins, x=None):
+        """
+        :param index: 1d array of the bin index (1-based) of each pixel;
+            0 means the pixel is not used
+        :param key: 1d array of the sorting key of each pixel, eg. phi
+        :param num_bins: number of bins
+        :param x: the x-axis of the roi data
+        """
+        valid = np.nonzero(index)[0]
+        key = key[valid]
+        self.span = float(np.max(key) - np.min(key)) + 1.0 if \
+            valid.size > 0 else 1.0
+        self.kmin = float(np.min(key)) if valid.size > 0 else 0.0
+        # bins are separated by span so one sorted array holds all of them
+        skey = (index[valid] - 1) * self.span + (key - self.kmin)
+        order = np.argsort(skey, kind='stable')
+        self.perm = valid[order]
+        self.skey = skey[order]
+        self.offset = np.arange(num_bins) * self.span
+        self.num_bins = num_bins
+        self.x = x
+
+    def prefix(self, data, pixel_index=None):
+        """
+        the cumulative sum of a frame in the sorted order
+        :param pixel_index: the pixels that data has; None for full frames
+        """
+        perm = self.perm
+        if pixel_index is not None:
+            # the sorted pixels are valid pixels, so they're all found
+            perm = np.searchsorted(pixel_index, perm)
+        cum = np.zeros(perm.size + 1, dtype=np.float64)
+        np.cumsum(data.ravel()[perm], out=cum[1:])
+        return cum
+
+    def query(self, cum, lo, hi):
+        """
+        :return: the sum and the number of pixels with lo <= key < hi in
+            each bin
+        """
+        # keep the limits inside one bin; the keys are in [0, span - 1]
+        lo = min(max(lo - self.kmin, 0), self.span - 0.5)
+        hi = min(max(hi - self.kmin, 0), self.span - 0.5)
+        beg = np.searchsorted(self.skey, self.offset + lo, side='left')
+        end = np.searchsorted(self.skey, self.offset + hi, side='left')
+        return cum[end] - cum[beg], end - beg
+
+    def average(self, cum, ranges):
+        """
+        the average of the pixels in a list of [lo, hi) key ranges
+        """
+        total = np.zeros(self.num_bins)
+        count = np.zeros(self.num_bins, dtype=np.int64)
+        for lo, hi in ranges:
+            a, b = self.query(cum, lo, hi)
+            total += a
+            count += b
+        return total / np.maximum(count, 1)
+
+
+def build_pie_bins(qmap, pmap, mask, sqspan):
+    qsize = len(sqspan) - 1
+    index = np.searchsorted(sqspan, qmap.ravel(), side='right')
+    index[index > qsize] = 0
+    index[mask.ravel() <= 0] = 0
+    return SortedBins(index, pmap.ravel(), qsize)
+
+
+def build_ring_bins(rmap, pmap, mask, num_fine=1440):
+    # fine phi bins over the whole detector; they are merged to the phi bins
+    # of a ring by get_ring_profile
+    valid = mask.ravel() > 0
+    pmap = pmap.ravel()
+    phi_min, phi_max = np.min(pmap[valid]), np.max(pmap[valid])
+    edges = np.linspace(phi_min, phi_max, num_fine + 1)
+    delta = (phi_max - phi_min) / num_fine
+    index = ((pmap - phi_min) / delta).astype(np.int64)
+    index[index >= num_fine] = num_fine - 1
+    index += 1
+    index[~valid] = 0
+    return SortedBins(index, rmap.ravel(), num_fine, x=edges)
+
+
+def get_ring_profile(bins, cum, radius, phi_num=180):
+    """
+    the phi profile of a ring from the fine phi bins; the phi range is the
+    range of the fine bins that the ring covers, so it matches the exact
+    phi range up to the size of one fine bin.
+    """
+    rmin, rmax = sorted(radius)
+    total, count = bins.query(cum, rmin, rmax)
+    nz = np.nonzero(count)[0]
+    if nz.size == 0:
+        return np.zeros(phi_num), np.zeros(phi_num)
+    edges = bins.x
+    phi_min, phi_max = edges[nz[0]], edges[nz[-1] + 1]
+    x = np.linspace(phi_min, phi_max, phi_num)
+    delta = (phi_max - phi_min) / phi_num
+
+    center = (edges[nz] + edges[nz + 1]) / 2.0
+    index = ((center - phi_min) / delta).astype(np.int64)
+    index = np.clip(index, 0, phi_num - 1)
+    total = np.bincount(index, total[nz], minlength=phi_num)
+    count = np.bincount(index, count[nz], minlength=phi_num)
+    return x, total / np.maximum(count, 1)
+
+
+def get_pie_ranges(angle_range):
+    pmin, pmax = angle_range
+    if pmax < pmin:
+        # the range crosses 0 degree
+        return [(pmin, np.inf), (-np.inf, pmax)]
+    return [(pmin, pmax)]
+
+
+class RoiOperatorCache(object):
+    """
+    the recently used roi operators, keyed by the geometry, the mask, the q
+    partition and the roi.
+    """
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, builder):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                return self.data[key]
+        op = builder()
+        with self.lock:
+            self.data[key] = op
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+        return op
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+roi_operator_cache = RoiOperatorCache()
+# the sorted pixels take much more memory than the operators
+sorted_bins_cache = RoiOperatorCache(max_entries=4)
+
+
+def get_roi_data_batch(xf_list, roi_list, phi_num=180,
+                       chunk_size=1024 ** 3 // 4):
+    """
+    get the roi data of many files; the files that share the same roi
+    operators are stacked and all the rois are evaluated with one sparse
+    matrix product;
+    :param xf_list: list of XpcsFile
+    :param roi_list: list of roi parameters
+    :param phi_num: number of phi bins for the ring rois
+    :param chunk_size: maximal size of the stacked saxs_2d block in bytes;
+        in the compact mode only the valid pixels are stacked
+    :return: nested list, result[file_index][roi_index] = (x, y)
+    """
+    result = [[None] * len(roi_list) for _ in xf_list]
+    if len(roi_list) == 0:
+        return result
+
+    # group the files by their operators and their pixels
+    groups = OrderedDict()
+    for n, xf in enumerate(xf_list):
+        ops = tuple([xf.get_roi_operator(roi, phi_num) for roi in roi_list])
+        pixel_index = xf.get_pixel_data()[0]
+        key = tuple([id(op) for op in ops])
+        if pixel_index is not None:
+            key = key + (get_digest(pixel_index), )
+        if key not in groups:
+            groups[key] = (ops, pixel_index, [])
+        groups[key][2].append(n)
+
+    for ops, pixel_index, index in groups.values():
+        matrix = [op.get_matrix(pixel_index) for op in ops]
+        split = np.cumsum([x.shape[0] for x in matrix])[:-1]
+        matrix = sparse.vstack(matrix, format='csr')
+        npix = matrix.shape[1]
+        step = max(1, chunk_size // (npix * 8))
+        for beg in range(0, len(index), step):
+            chunk = index[beg: beg + step]
+            block = np.empty((npix, len(chunk)), dtype=np.float64)
+            for m, n in enumerate(chunk):
+                block[:, m] = xf_list[n].get_pixel_data()[1]
+            values = np.split(matrix @ block, split, axis=0)
+            for m, n in enumerate(chunk):
+                for k, roi in enumerate(roi_list):
+                    result[n][k] = xf_list[n]._finish_roi_data(
+                        roi, ops[k], values[k][:, m].copy())
+    return result
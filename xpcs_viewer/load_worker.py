@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PyQt5 import QtCore
+from PyQt5.QtCore import QObject, pyqtSlot
+from .xpcs_file import XpcsFile
+
+
+logger = logging.getLogger(__name__)
+
+
+class LoadSignal(QObject):
+    # (number of files done, total number)
+    progress = QtCore.pyqtSignal(tuple)
+    # (fname, XpcsFile)
+    loaded = QtCore.pyqtSignal(tuple)
+    # (number of files loaded, total number, canceled)
+    finished = QtCore.pyqtSignal(tuple)
+
+
+def load_file(fname, cwd, lazy):
+    try:
+        return XpcsFile(fname, cwd, lazy=lazy)
+    except Exception as e:
+        logger.info("failed to load file: %s", fname)
+        logger.info("%s", str(e))
+        return None
+
+
+class LoadWorker(QtCore.QRunnable):
+    """
+    read a list of xpcs files with a thread pool; each XpcsFile is sent back
+    with the loaded signal as soon as it's ready, so the cache is only
+    modified in the gui thread.
+    """
+    def __init__(self, flist, cwd, lazy=True, max_workers=None):
+        super().__init__()
+        self.flist = list(flist)
+        self.cwd = cwd
+        self.lazy = lazy
+        if max_workers is None:
+            max_workers = min(32, os.cpu_count() or 1)
+        self.max_workers = max_workers
+        self.signals = LoadSignal()
+        self.is_killed = False
+
+    def kill(self):
+        self.is_killed = True
+
+    @pyqtSlot()
+    def run(self):
+        t0 = time.perf_counter()
+        total = len(self.flist)
+        done, loaded = 0, 0
+        pool = ThreadPoolExecutor(self.max_workers)
+        futures = {pool.submit(load_file, fn, self.cwd, self.lazy): fn
+                   for fn in self.flist}
+        try:
+            for future in as_completed(futures):
+                if self.is_killed:
+                    break
+                done += 1
+                xf_obj = future.result()
+                if xf_obj is not None:
+                    loaded += 1
+                    self.signals.loaded.emit((futures[future], xf_obj))
+                self.signals.progress.emit((done, total))
+        finally:
+            # the files being read will finish; the pending ones are dropped
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+        logger.info('loaded %d/%d files in %.2f s%s', loaded, total,
+                    time.perf_counter() - t0,
+                    ' (canceled)' if self.is_killed else '')
+        self.signals.finished.emit((loaded, total, self.is_killed))
+
+
+class Prefetcher(object):
+    """
+    read the files next to the current one in a single background thread so
+    browsing a series doesn't wait for the files to load; a new request
+    cancels the files that haven't been started. each XpcsFile is sent back
+    with the signals.loaded signal, so the cache is only modified in the gui
+    thread.
+    """
+    def __init__(self):
+        self.signals = LoadSignal()
+        self.pool = ThreadPoolExecutor(1)
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def submit(self, flist, cwd):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        self.pool.submit(self._run, list(flist), cwd, generation)
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+
+    def _run(self, flist, cwd, generation):
+        for fn in flist:
+            if generation != self.generation:
+                return
+            # read all the fields so the plots don't touch the disk
+            xf_obj = load_file(fn, cwd, lazy=False)
+            if xf_obj is not None and generation == self.generation:
+                self.signals.loaded.emit((fn, xf_obj))
+            # give way to the gui thread between the files
+            time.sleep(0.01)
@@ -9,6 +9,7 @@ from ..fileIO.hdf_reader import put
 from ..xpcs_file import XpcsFile as XF
 from shutil import copyfile
 from ..helper.listmodel import ListDataModel
+from ..helper.pixel_index import PixelSum
 import pyqtgraph as pg
 from tqdm import trange
 
@@ -123,14 +124,16 @@ class AverageToolbox(QtCore.QRunnable):
         mask = np.zeros(tot_num, dtype=np.int64)
         prev_percentage = 0
 
-        def validate_g2_baseline(g2_data, q_idx):
-            if q_idx >= g2_data.shape[1]:
+        def validate_g2_baseline(xf, q_idx):
+            if q_idx >= xf.ql_dyn.size:
                 idx = 0 
                 logger.info('q_index is out of range; using 0 instead')
             else:
                 idx = q_idx
 
-            g2_baseline = np.mean(g2_data[-avg_window:, idx])
+            # only read the last avg_window points from the file
+            g2_tail = xf.read_partial('g2', (slice(-avg_window, None), idx))
+            g2_baseline = np.mean(g2_tail)
             if avg_blmax >= g2_baseline >= avg_blmin:
                 return True, g2_baseline
             else:
@@ -139,6 +142,8 @@ class AverageToolbox(QtCore.QRunnable):
         result = {}
         for key in fields:
             result[key] = None 
+        # saxs_2d is summed on the valid pixels
+        saxs_2d_sum = PixelSum()
 
         t0 = time.perf_counter()
         for n in range(steps):
@@ -164,8 +169,8 @@ class AverageToolbox(QtCore.QRunnable):
 
                 fname = self.model[m]
                 try:
-                    xf = XF(fname, cwd=self.work_dir, fields=fields)
-                    flag, val = validate_g2_baseline(xf.g2, avg_qindex)
+                    xf = XF(fname, cwd=self.work_dir, fields=fields, lazy=True)
+                    flag, val = validate_g2_baseline(xf, avg_qindex)
                     self.baseline[self.ptr] = val
                     self.ptr += 1
                 # except Exceptionn as ec:
@@ -175,7 +180,14 @@ class AverageToolbox(QtCore.QRunnable):
 
                 if flag:
                     for key in fields:
-                        if key != 'saxs_1d':
+                        if key == 'saxs_2d':
+                            if saxs_2d_sum.add(*xf.get_pixel_data(),
+                                               xf.mask.shape):
+                                mask[m] = 1
+                            else:
+                                logger.info(f'data shape does not match for key {key}, {fname}')
+                            continue
+                        elif key != 'saxs_1d':
                             data = xf.at(key)
                         else:
                             data = xf.at('saxs_1d')['data_raw']
@@ -194,6 +206,8 @@ class AverageToolbox(QtCore.QRunnable):
             logger.info('no dataset is valid; check the baseline criteria.')
             return
         else:
+            if 'saxs_2d' in fields:
+                result['saxs_2d'] = saxs_2d_sum.get()
             for key in fields:
                 if key == 'saxs_1d':
                     # only keep the Iq component, put method doesn't accept dict
@@ -285,14 +299,16 @@ def do_average(flist, work_dir=None, save_path=None, avg_window=3,
     baseline = np.zeros(tot_num, dtype=np.float32)
     mask = np.zeros(tot_num, dtype=np.int64)
 
-    def validate_g2_baseline(g2_data, q_idx):
-        if q_idx >= g2_data.shape[1]:
+    def validate_g2_baseline(xf, q_idx):
+        if q_idx >= xf.ql_dyn.size:
             idx = 0 
             logger.info('q_index is out of range; using 0 instead')
         else:
             idx = q_idx
 
-        g2_baseline = np.mean(g2_data[-avg_window:, idx])
+        # only read the last avg_window points from the file
+        g2_tail = xf.read_partial('g2', (slice(-avg_window, None), idx))
+        g2_baseline = np.mean(g2_tail)
         if avg_blmax >= g2_baseline >= avg_blmin:
             return True, g2_baseline
         else:
@@ -301,12 +317,14 @@ def do_average(flist, work_dir=None, save_path=None, avg_window=3,
     result = {}
     for key in fields:
         result[key] = None 
+    # saxs_2d is summed on the valid pixels
+    saxs_2d_sum = PixelSum()
 
     for m in trange(tot_num):
         fname = flist[m]
         try:
-            xf = XF(fname, cwd=work_dir, fields=fields)
-            flag, val = validate_g2_baseline(xf.g2, avg_qindex)
+            xf = XF(fname, cwd=work_dir, fields=fields, lazy=True)
+            flag, val = validate_g2_baseline(xf, avg_qindex)
             baseline[m] = val
         except Exception as ec:
             flag, val = False, 0
@@ -314,7 +332,13 @@ def do_average(flist, work_dir=None, save_path=None, avg_window=3,
 
         if flag:
             for key in fields:
-                if key != 'saxs_1d':
+                if key == 'saxs_2d':
+                    if saxs_2d_sum.add(*xf.get_pixel_data(), xf.mask.shape):
+                        mask[m] = 1
+                    else:
+                        logger.info(f'data shape does not match for key {key}, {fname}')
+                    continue
+                elif key != 'saxs_1d':
                     data = xf.at(key)
                 else:
                     data = xf.at('saxs_1d')['data_raw']
@@ -337,6 +361,8 @@ def do_average(flist, work_dir=None, save_path=None, avg_window=3,
         logger.info('no dataset is valid; check the baseline criteria.')
         return
     else:
+        if 'saxs_2d' in fields:
+            result['saxs_2d'] = saxs_2d_sum.get()
         for key in fields:
             if key == 'saxs_1d':
                 result['saxs_1d'] /= abs_cs_scale_tot
@@ -0,0 +1,109 @@
+import numpy as np
+import pyqtgraph as pg
+from ..helper.roi_operator import get_roi_data_batch
+from .intt import colors
+
+
+def get_cut(x, cake, cut_type='phi', vrange=None):
+    """
+    slice a cake into a 1d profile;
+    :param x: (q, phi) axes of the cake
+    :param cake: (phi_num, q_num) array
+    :param cut_type: 'phi' gives the phi profile averaged over a q range;
+        'q' gives the q profile averaged over a phi range
+    :param vrange: (min, max) of the averaged axis; None uses all of it
+    :return: x, y of the profile
+    """
+    qx, phi = x
+    if cut_type == 'phi':
+        axis, xval, yval = 1, phi, qx
+    else:
+        axis, xval, yval = 0, qx, phi
+
+    if vrange is None:
+        sel = np.ones(yval.size, dtype=bool)
+    else:
+        sel = np.logical_and(yval >= min(vrange), yval <= max(vrange))
+    if not np.any(sel):
+        return xval, np.full(xval.size, np.nan)
+
+    data = np.compress(sel, cake, axis=axis)
+    valid = np.isfinite(data)
+    total = np.sum(np.where(valid, data, 0), axis=axis)
+    count = np.sum(valid, axis=axis)
+    y = total / np.maximum(count, 1)
+    y[count == 0] = np.nan
+    return xval, y
+
+
+def get_data(xf_list, q_num=256, phi_num=360):
+    """
+    the cakes of many files; the files with the same geometry and mask share
+    one remap operator and are remapped together.
+    """
+    roi = {'sl_type': 'Cake', 'q_num': q_num, 'phi_num': phi_num}
+    return [x[0] for x in get_roi_data_batch(xf_list, [roi])]
+
+
+def plot(xf_list, pg_hdl, legend=None, file_index=0, q_num=256, phi_num=360,
+         cut_type='phi', vrange=None, plot_type='log', cmap='jet'):
+    """
+    plot the cake of one file and the cut of all files
+    :param xf_list: list of xf objects
+    :param pg_hdl: PlotWidgetDev handler
+    :param legend: labels of the files
+    :param file_index: index of the file whose cake is shown
+    :param cut_type: 'phi' or 'q', see get_cut
+    :param vrange: range of the averaged axis of the cut
+    """
+    data = get_data(xf_list, q_num, phi_num)
+    file_index = min(max(file_index, 0), len(data) - 1)
+    (qx, phi), cake = data[file_index]
+
+    pg_hdl.clear()
+    p0 = pg_hdl.addPlot(row=0, col=0)
+    img = cake
+    if plot_type == 'log':
+        # empty bins and non-positive values are drawn as the minimum
+        with np.errstate(invalid='ignore', divide='ignore'):
+            img = np.log10(np.where(cake > 0, cake, np.nan))
+    finite = np.isfinite(img)
+    vmin = np.min(img[finite]) if np.any(finite) else 0
+    img = np.where(finite, img, vmin).astype(np.float32)
+
+    dq = qx[1] - qx[0] if qx.size > 1 else 1.0
+    dphi = phi[1] - phi[0] if phi.size > 1 else 1.0
+    item = pg.ImageItem(img)
+    item.setRect(qx[0] - dq / 2, phi[0] - dphi / 2, dq * qx.size,
+                 dphi * phi.size)
+    p0.addItem(item)
+    p0.setLabel('bottom', 'q (Å⁻¹)')
+    p0.setLabel('left', 'phi (deg)')
+    p0.setTitle(legend[file_index] if legend is not None else None)
+    bar = pg.ColorBarItem(colorMap=pg.colormap.getFromMatplotlib(cmap),
+                          interactive=False)
+    bar.setImageItem(item, insert_in=p0)
+
+    # mark the averaged range of the cut
+    if vrange is not None:
+        orientation = 'horizontal' if cut_type == 'phi' else 'vertical'
+        region = pg.LinearRegionItem(values=vrange, orientation=orientation,
+                                     movable=False)
+        p0.addItem(region)
+
+    p1 = pg_hdl.addPlot(row=1, col=0)
+    p1.addLegend(offset=(-1, 1), labelTextSize='8pt', verSpacing=-10)
+    if cut_type == 'phi':
+        p1.setLabel('bottom', 'phi (deg)')
+    else:
+        p1.setLabel('bottom', 'q (Å⁻¹)')
+        p1.setLogMode(x=True, y=True)
+    p1.setLabel('left', 'Intensity')
+    for n, (x, cake) in enumerate(data):
+        xval, yval = get_cut(x, cake, cut_type, vrange)
+        valid = np.isfinite(yval)
+        if cut_type == 'q':
+            valid = np.logical_and(valid, yval > 0)
+        name = legend[n] if legend is not None else None
+        p1.plot(xval[valid], yval[valid], name=name,
+                pen=pg.mkPen(colors[n % len(colors)], width=2))
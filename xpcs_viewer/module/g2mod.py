@@ -68,8 +68,8 @@ def get_data(xf_list, q_range=None, t_range=None):
     for fc in xf_list:
         tel.append(fc.t_el[tslice])
         qd.append(fc.ql_dyn[qslice])
-        g2.append(fc.g2[tslice, qslice])
-        g2_err.append(fc.g2_err[tslice, qslice])
+        g2.append(fc.read_partial('g2', (tslice, qslice)))
+        g2_err.append(fc.read_partial('g2_err', (tslice, qslice)))
 
     t_shape = set([t.shape for t in tel])
     q_shape = set([q.shape for q in qd])
@@ -194,63 +194,121 @@ def pg_plot(hdl, xf_list, q_range, t_range, y_range,
 
         t.setMouseEnabled(x=False, y=y_auto)
 
-    for m in range(num_data):
-        # default base line to be 1.0; used for non-fitting or fit error cases
-        baseline_offset = np.ones(num_qval)
-        if show_fit:
-            fit_summary = xf_list[m].fit_g2(q_range, t_range, bounds, fit_flag,
-                                            fit_func)
-            if fit_summary is not None and subtract_baseline:
-                # make sure the fitting is successful
-                if fit_summary['fit_line'][n].get('success', False):
-                    baseline_offset = fit_summary['fit_val'][:, 0, 3]
-
-        for n in range(num_qval):
-            color = colors[rows[m] % len(colors)]
-            label = None
-            if plot_type == 'multiple':
-                ax = axes[n]
-                title = 'q=%.5f Å⁻¹' % qd[0][n]
-                label = xf_list[m].label
-                if m == 0:
-                    ax.setTitle(title)
-            elif plot_type == 'single':
-                ax = axes[m]
-                # overwrite color; use the same color for the same set;
-                color = colors[n % len(colors)]
-                title = xf_list[m].label
-                label = 'q=%.5f Å⁻¹' % qd[0][n]
-                ax.setTitle(title)
-            elif plot_type == 'single-combined':
-                ax = axes[0]
-                label = xf_list[m].label + ' q=%.5f Å⁻¹' % qd[0][n]
-
-            ax.setLabel('bottom', 'tau (s)')
-            ax.setLabel('left', 'g2')
-
-            symbol = symbols[rows[m] % len(symbols)]
+    # everything needed to redraw one file when its fitting is updated
+    plot = {
+        'axes': axes,
+        'xf_list': xf_list,
+        'rows': rows,
+        'data': (tel, qd, g2, g2_err),
+        'items': [[] for _ in range(num_data)],
+        'fit_args': (q_range, t_range, bounds, fit_flag, fit_func),
+        'show_fit': show_fit,
+        'plot_type': plot_type,
+        'offset': offset,
+        'subtract_baseline': subtract_baseline,
+        'marker_size': marker_size,
+        't0_range': t0_range,
+        'y_range': None if y_auto else y_range
+    }
 
-            x = tel[m]
-            # normalize baseline
-            y = g2[m][:, n] - baseline_offset[n] + 1.0 + m * offset
-            y_err = g2_err[m][:, n]
-
-            pg_plot_one_g2(ax, x, y, y_err, color, label=label, symbol=symbol,
-                           symbol_size=marker_size)
-
-            ax.setRange(xRange=t0_range)
+    for m in range(num_data):
+        fit_summary = None
+        # the fittings that are outdated are drawn when they're updated;
+        # see pg_update_fit
+        if show_fit and xf_list[m].check_fit_summary(*plot['fit_args']):
+            fit_summary = xf_list[m].fit_summary
+        pg_plot_one_file(plot, m, fit_summary)
+    return plot
 
-            if not y_auto:
-                ax.setRange(yRange=y_range)
 
-            if show_fit and fit_summary is not None:
-                if fit_summary['fit_line'][n].get('success', False):
-                    y_fit = fit_summary['fit_line'][n]['fit_y'] + m * offset
-                    # normalize baseline
-                    y_fit = y_fit - baseline_offset[n] + 1.0
-                    ax.plot(fit_summary['fit_line'][n]['fit_x'], y_fit,
-                            pen=pg.mkPen(color, width=2.5))
-    return
+def pg_update_fit(plot, xf):
+    """
+    redraw the g2 of one file in a plot made by pg_plot after its
+    fit_summary is updated;
+    :param plot: the dictionary returned by pg_plot
+    :param xf: the XpcsFile
+    """
+    if plot is None or not plot['show_fit']:
+        return
+    for m, x in enumerate(plot['xf_list']):
+        if x is not xf:
+            continue
+        for ax, item in plot['items'][m]:
+            ax.removeItem(item)
+        plot['items'][m] = []
+        fit_summary = None
+        if xf.check_fit_summary(*plot['fit_args']):
+            fit_summary = xf.fit_summary
+        pg_plot_one_file(plot, m, fit_summary)
+
+
+def pg_plot_one_file(plot, m, fit_summary=None):
+    """
+    plot the g2 of the m-th file and its fitting lines;
+    """
+    tel, qd, g2, g2_err = plot['data']
+    xf, rows = plot['xf_list'][m], plot['rows']
+    axes, offset = plot['axes'], plot['offset']
+    plot_type = plot['plot_type']
+    num_qval = g2[m].shape[1]
+    items = plot['items'][m]
+
+    # default base line to be 1.0; used for non-fitting or fit error cases
+    baseline_offset = np.ones(num_qval)
+    if fit_summary is not None and plot['subtract_baseline']:
+        # only use the baseline of the successful fittings
+        success = [x.get('success', False) for x in fit_summary['fit_line']]
+        baseline_offset = np.where(success, fit_summary['fit_val'][:, 0, 3],
+                                   1.0)
+
+    for n in range(num_qval):
+        color = colors[rows[m] % len(colors)]
+        label = None
+        if plot_type == 'multiple':
+            ax = axes[n]
+            title = 'q=%.5f Å⁻¹' % qd[0][n]
+            label = xf.label
+            if m == 0:
+                ax.setTitle(title)
+        elif plot_type == 'single':
+            ax = axes[m]
+            # overwrite color; use the same color for the same set;
+            color = colors[n % len(colors)]
+            title = xf.label
+            label = 'q=%.5f Å⁻¹' % qd[0][n]
+            ax.setTitle(title)
+        elif plot_type == 'single-combined':
+            ax = axes[0]
+            label = xf.label + ' q=%.5f Å⁻¹' % qd[0][n]
+
+        ax.setLabel('bottom', 'tau (s)')
+        ax.setLabel('left', 'g2')
+
+        symbol = symbols[rows[m] % len(symbols)]
+
+        x = tel[m]
+        # normalize baseline
+        y = g2[m][:, n] - baseline_offset[n] + 1.0 + m * offset
+        y_err = g2_err[m][:, n]
+
+        for item in pg_plot_one_g2(ax, x, y, y_err, color, label=label,
+                                   symbol=symbol,
+                                   symbol_size=plot['marker_size']):
+            items.append((ax, item))
+
+        ax.setRange(xRange=plot['t0_range'])
+
+        if plot['y_range'] is not None:
+            ax.setRange(yRange=plot['y_range'])
+
+        if fit_summary is not None:
+            if fit_summary['fit_line'][n].get('success', False):
+                y_fit = fit_summary['fit_line'][n]['fit_y'] + m * offset
+                # normalize baseline
+                y_fit = y_fit - baseline_offset[n] + 1.0
+                item = ax.plot(fit_summary['fit_line'][n]['fit_x'], y_fit,
+                               pen=pg.mkPen(color, width=2.5))
+                items.append((ax, item))
 
 
 def pg_plot_one_g2(ax, x, y, dy, color, label, symbol, symbol_size=5):
@@ -259,9 +317,10 @@ def pg_plot_one_g2(ax, x, y, dy, color, label, symbol, symbol_size=5):
     line = pg.ErrorBarItem(x=np.log10(x), y=y, top=dy, bottom=dy,
                            pen=pen)
     pen = pg.mkPen(color=color, width=1)
-    ax.plot(x, y, pen=None, symbol=symbol, name=label, symbolSize=symbol_size,
-            symbolPen=pen, symbolBrush=pg.mkBrush(color=(*color, 0)))
+    scatter = ax.plot(x, y, pen=None, symbol=symbol, name=label,
+                      symbolSize=symbol_size, symbolPen=pen,
+                      symbolBrush=pg.mkBrush(color=(*color, 0)))
 
     ax.setLogMode(x=True, y=None)
     ax.addItem(line)
-    return
+    return scatter, line
@@ -1,6 +1,7 @@
 import numpy as np
 from .g2mod import create_slice
 from ..plothandler.matplot_qt import get_color_marker
+from ..helper.roi_operator import get_roi_data_batch
 
 
 def offset_intensity(Iq, n, plot_offset=None, yscale=None):
@@ -68,7 +69,12 @@ def plot(xf_list, mp_hdl, plot_type=2, plot_norm=0, plot_offset=0,
          loc='best', marker_size=3, sampling=1, all_phi=False, 
          absolute_crosssection=False, subtract_background=False, 
          bkg_file=None, weight=1.0, roi_list=None, show_roi=True,
-         show_phi_roi=True):
+         show_phi_roi=True, partition=None):
+    """
+    :param partition: None to plot the stored saxs_1d; or a dictionary of
+        q_num, phi_num, q_scale to re-partition saxs_2d, see
+        XpcsFile.get_saxs1d_partition
+    """
 
     xscale = ['linear', 'log'][plot_type % 2]
     yscale = ['linear', 'log'][plot_type // 2]
@@ -85,8 +91,12 @@ def plot(xf_list, mp_hdl, plot_type=2, plot_norm=0, plot_offset=0,
                 alpha[t] = 1.0
 
     if subtract_background and bkg_file is not None:
-        Iq_bkg = np.copy(bkg_file.saxs_1d['Iq'])
-        q_bkg = np.copy(bkg_file.saxs_1d['q'])
+        if partition is None:
+            saxs_1d_bkg = bkg_file.saxs_1d
+        else:
+            saxs_1d_bkg = bkg_file.get_saxs1d_partition(**partition)
+        Iq_bkg = np.copy(saxs_1d_bkg['Iq'])
+        q_bkg = np.copy(saxs_1d_bkg['q'])
         # apply sampling
         Iq_bkg, q_bkg = Iq_bkg[:, ::sampling], q_bkg[::sampling]
 
@@ -97,9 +107,23 @@ def plot(xf_list, mp_hdl, plot_type=2, plot_norm=0, plot_offset=0,
             bkg_file.abs_cross_section_scale is not None:
             Iq_bkg *= bkg_file.abs_cross_section_scale
 
+    # evaluate all the rois of all the files at once
+    xf_list = xf_list[slice(0, max_points)]
+    if roi_list is not None and (show_roi or show_phi_roi):
+        roi_data = get_roi_data_batch(xf_list, roi_list)
+
+    if partition is None:
+        saxs_1d_list = [fi.saxs_1d for fi in xf_list]
+    else:
+        roi = dict(sl_type='Cake', **partition)
+        part_data = get_roi_data_batch(xf_list, [roi])
+        saxs_1d_list = [fi.get_saxs1d_partition(**partition, roi_data=x[0])
+                        for fi, x in zip(xf_list, part_data)]
+
     plot_id = 0
-    for n, fi in enumerate(xf_list[slice(0, max_points)]):
-        Iq, q = np.copy(fi.saxs_1d['Iq']), np.copy(fi.saxs_1d['q'])
+    for n, fi in enumerate(xf_list):
+        saxs_1d = saxs_1d_list[n]
+        Iq, q = np.copy(saxs_1d['Iq']), np.copy(saxs_1d['q'])
         # apply sampling
         Iq, q = Iq[:, ::sampling], q[::sampling]
 
@@ -132,31 +156,31 @@ def plot(xf_list, mp_hdl, plot_type=2, plot_norm=0, plot_offset=0,
             cl, mk = get_color_marker(plot_id)
             Iqm = offset_intensity(Iq[m], plot_id, plot_offset, yscale)
             Iqm, _, xlabel, ylabel = norm_saxs_data(Iqm, q, plot_norm)
-            ax.plot(q, Iqm, mk + '-', label=fi.saxs_1d['labels'][m],
+            ax.plot(q, Iqm, mk + '-', label=saxs_1d['labels'][m],
                     ms=marker_size, alpha=alpha[n], color=cl, mfc='none')
             plot_id += 1
 
         if show_roi and roi_list is not None and not show_phi_roi:
-            for param in roi_list:
+            for param, data in zip(roi_list, roi_data[n]):
                 if not param['sl_type'] == 'Pie':
                     continue
-                q, y = fi.get_roi_data(param)
+                q, y = data
                 cl, mk = get_color_marker(plot_id)
                 Iqm = offset_intensity(y, plot_id, plot_offset, yscale)
                 Iqm, _, xlabel, ylabel = norm_saxs_data(Iqm, q, plot_norm)
                 ax.plot(q, Iqm, mk + '-', 
-                        label=fi.saxs_1d['labels'][0]+'_roi_'+str(plot_id),
+                        label=saxs_1d['labels'][0]+'_roi_'+str(plot_id),
                         ms=marker_size, alpha=alpha[n], color=cl, mfc='none')
                 plot_id += 1
 
         if show_phi_roi:
-            for param in roi_list:
+            for param, data in zip(roi_list, roi_data[n]):
                 if param['sl_type'] == 'Pie':
                     continue
-                x, y = fi.get_roi_data(param)
+                x, y = data
                 cl, mk = get_color_marker(plot_id)
                 ax.plot(x, y, mk + '-', 
-                        label=fi.saxs_1d['labels'][0]+'_ring',
+                        label=saxs_1d['labels'][0]+'_ring',
                         ms=marker_size, alpha=alpha[n], color=cl, mfc='none')
                 plot_id += 1
 
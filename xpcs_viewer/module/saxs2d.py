@@ -73,3 +73,22 @@ def plot(ans, pg_hdl=None, plot_type='log', cmap='jet', rotate=False,
         pg_hdl.add_roi(sl_type='Center', center=center, label='Center')
 
     return rotate # , pg_hdl.levelMin, pg_hdl.levelMax
+
+
+def plot_roi_profile(pg_hdl, x, y, sl_type='Pie', color='b'):
+    """
+    plot the profile of the roi that is being edited on the saxs_2d tab
+    """
+    pg_hdl.clear()
+    if sl_type == 'Pie':
+        pg_hdl.setLogMode(x=True, y=True)
+        pg_hdl.setLabel('bottom', 'q (Å⁻¹)')
+    else:
+        pg_hdl.setLogMode(x=False, y=False)
+        pg_hdl.setLabel('bottom', 'phi (deg)')
+    pg_hdl.setLabel('left', 'Intensity')
+    # log mode can't handle the empty bins
+    valid = np.logical_and(np.isfinite(y), np.isfinite(x))
+    if sl_type == 'Pie':
+        valid = np.logical_and(valid, y > 0)
+    pg_hdl.plot(x[valid], y[valid], pen=pg.mkPen(color, width=2))
@@ -8,6 +8,10 @@ pg.setConfigOptions(imageAxisOrder='row-major')
 
 
 class ImageViewDev(ImageView):
+    # label of the roi that is being changed / has been changed
+    sigRoiChanged = QtCore.Signal(str)
+    sigRoiChangeFinished = QtCore.Signal(str)
+
     def __init__(self, *args, **kwargs) -> None:
         super(ImageViewDev, self).__init__(*args, **kwargs)
         self.roi_record = {}
@@ -164,6 +168,10 @@ class ImageViewDev(ImageView):
         self.addItem(new_roi)
         if sl_type != 'Center':
             new_roi.sigRemoveRequested.connect(lambda: self.remove_roi(label))
+            new_roi.sigRegionChanged.connect(
+                lambda: self.sigRoiChanged.emit(label))
+            new_roi.sigRegionChangeFinished.connect(
+                lambda: self.sigRoiChangeFinished.emit(label))
         return label 
     
     def remove_rois(self, filter_str=None):
@@ -179,6 +187,23 @@ class ImageViewDev(ImageView):
         if t is not None:
             self.removeItem(t)
 
+    def get_roi_parameter(self, label):
+        """
+        get the parameter of one roi; None if it doesn't exist
+        """
+        if label.startswith('Ring'):
+            if 'RingA' not in self.roi_record or \
+                    'RingB' not in self.roi_record:
+                return None
+            return {
+                'sl_type': 'Ring',
+                'radius': (
+                    self.roi_record['RingB'].getState()['size'][1] / 2.0,
+                    self.roi_record['RingA'].getState()['size'][1] / 2.0)}
+        elif label.startswith('roi') and label in self.roi_record:
+            return self.roi_record[label].get_parameter()
+        return None
+
     def get_roi_list(self):
         parameter = []
         for key, roi in self.roi_record.items():
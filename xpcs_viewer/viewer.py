@@ -1,6 +1,11 @@
 from PyQt5 import QtCore, QtWidgets
+import pyqtgraph as pg
 from .viewer_ui import Ui_mainWindow as Ui
 from .viewer_kernel import ViewerKernel
+from .fileIO.reduced_cache import reduced_cache
+from .helper.qmap import qmap_cache
+from .helper.fit_cache import fit_cache
+from .xpcs_file import XpcsFile
 
 import os
 import numpy as np
@@ -46,16 +51,17 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         self.tabWidget.setCurrentIndex(self.tab_id)
         self.tab_dict = {
             0: "saxs_2d",
-            1: "saxs_1d",
-            2: "stability",
-            3: "intensity_t",
-            4: "g2",
-            5: "diffusion",
-            6: "twotime",
-            7: "average",
-            8: "metadata",
-            9: "log",
-            # 10: "None"
+            1: "saxs_cake",
+            2: "saxs_1d",
+            3: "stability",
+            4: "intensity_t",
+            5: "g2",
+            6: "diffusion",
+            7: "twotime",
+            8: "average",
+            9: "metadata",
+            10: "log",
+            # 11: "None"
         }
 
         # finite states
@@ -65,6 +71,14 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         logger.info('Maximal threads: %d', self.thread_pool.maxThreadCount())
 
         self.vk = None
+        # memory budget for the loaded files; see default_setting.json
+        self.max_cache_size = 1024 ** 3 * 2
+        # the LoadWorker that is reading the target files
+        self.load_worker = None
+        # the FitWorker that is fitting g2; the canceled ones are kept until
+        # they finish so their signals stay alive
+        self.fit_worker = None
+        self.fit_worker_killed = []
         # list widget models
         self.source_model = None
         self.target_model = None
@@ -85,9 +99,19 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         
         self.saxs1d_lb_type.currentIndexChanged.connect(self.switch_saxs1d_line)
 
+        # profile of the roi being edited on the saxs_2d tab
+        self.pg_saxs_roi = pg.PlotWidget(self.tab1_1)
+        self.pg_saxs_roi.setBackground('w')
+        self.pg_saxs_roi.setMinimumWidth(320)
+        self.pg_saxs_roi.hide()
+        self.gridLayout_26.addWidget(self.pg_saxs_roi, 1, 2, 1, 1)
+        self.pg_saxs.sigRoiChanged.connect(self.update_roi_profile)
+        self.pg_saxs.sigRoiChangeFinished.connect(self.finish_roi_profile)
+
         self.tabWidget.currentChanged.connect(self.init_tab)
         # self.list_view_target.indexesMoved.connect(self.reorder_target)
         self.list_view_target.clicked.connect(self.update_selection)
+        self.list_view_source.clicked.connect(self.prefetch_source)
 
         self.cb_twotime_type.currentIndexChanged.connect(self.init_twotime)
         self.cb_twotime_saxs_cmap.currentIndexChanged.connect(
@@ -110,7 +134,7 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         self.avg_job_table.clicked.connect(self.update_avg_info)
         self.show_g2_fit_summary.clicked.connect(self.show_g2_fit_summary_func)
         self.hdf_key_filter.textChanged.connect(self.show_hdf_info)
-        self.btn_g2_refit.clicked.connect(self.plot_g2)
+        self.btn_g2_refit.clicked.connect(self.refit_g2)
         self.saxs2d_autorange.stateChanged.connect(self.update_saxs2d_range)
         self.load_default_setting()
         self.btn_deselect.clicked.connect(self.clear_target_selection)
@@ -132,6 +156,7 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
 
         # saxs2d roi
         self.btn_saxs2d_roi_add.clicked.connect(self.saxs2d_roi_add)
+        self.btn_cake_plot.clicked.connect(self.plot_cake)
 
         self.update_g2_fitting_function()
         self.show()
@@ -155,12 +180,34 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
                 new_size = (config["window_size_w"], config["window_size_h"])
                 logger.info('set mainwindow to size %s', new_size)
                 self.resize(*new_size)
-
-        # remove joblib cache
+            # memory budget for the loaded files
+            self.max_cache_size = int(config.get("cache_size_gb", 2) *
+                                      1024 ** 3)
+            if self.vk is not None:
+                self.vk.set_max_cache_size(self.max_cache_size)
+            # single precision qmaps for large detectors
+            if config.get("qmap_float32", False):
+                qmap_cache.set_dtype(np.float32)
+            # the on-disk cache of the reduced data; off by default
+            reduced_cache.set_config(
+                enabled=config.get("reduced_cache", False),
+                max_size=config.get("reduced_cache_size_gb", 8) * 1024 ** 3)
+            # keep only the valid pixels of saxs_2d in memory
+            XpcsFile.compact_saxs_2d = config.get("compact_saxs2d", False)
+            # the g2 fitting results in memory and on disk
+            fit_cache.set_config(
+                max_size=config.get("fit_cache_size_mb", 64) * 1024 ** 2,
+                max_disk_size=config.get("fit_cache_disk_size_mb", 256) *
+                1024 ** 2)
+            # the bootstrap intervals of the g2 fitting; off by default
+            self.g2_bootstrap = (config.get("g2_bootstrap_samples", 0),
+                                 config.get("g2_bootstrap_level", 0.95))
+
+        # remove the joblib cache used by the old versions
         cache_dir = os.path.join(os.path.expanduser('~'), '.xpcs_viewer',
-                                 'joblib/xpcs_viewer')
+                                 'joblib')
         if os.path.isdir(cache_dir):
-            shutil.rmtree(cache_dir)
+            shutil.rmtree(cache_dir, ignore_errors=True)
 
         return
 
@@ -179,10 +226,16 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         idx = self.tabWidget.currentIndex()
         tab_name = self.tab_dict[idx]
 
+        # warm the cache with the neighbours of the clicked file
+        if len(rows) > 0:
+            self.vk.prefetch(self.vk.target, rows[-1])
+
         if tab_name == 'saxs_2d':
             if rows == [] or len(self.vk.target) <= 1:
                 return
             self.pg_saxs.setCurrentIndex(rows[0])
+        elif tab_name == 'saxs_cake':
+            self.plot_cake()
         elif tab_name == 'saxs_1d':
             self.plot_saxs_1D()
         elif tab_name == 'intensity_t':
@@ -192,6 +245,10 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         elif tab_name == 'twotime':
             self.init_twotime()
 
+    def prefetch_source(self, index):
+        if self.vk is not None and self.source_model is not None:
+            self.vk.prefetch(self.source_model, index.row())
+
     def init_tab(self):
         if self.data_state < 2:
             return
@@ -211,6 +268,8 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
 
         if tab_name == 'saxs_2d':
             self.plot_saxs_2D()
+        elif tab_name == 'saxs_cake':
+            self.plot_cake()
         elif tab_name == 'saxs_1d':
             self.plot_saxs_1D()
         elif tab_name == 'stability':
@@ -250,11 +309,48 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
                                        1000)
             return
 
+        if self.load_worker is not None:
+            # the button works as the cancel button during the loading
+            if self.sender() is self.btn_load_data:
+                self.cancel_load_data()
+            return
+
+        worker = self.vk.get_load_worker()
+        if worker is None:
+            self.load_data_finished(None, (0, 0, False))
+            return
+
         self.statusbar.showMessage('Loading hdf files into RAM ...')
         logger.info('loading hdf files into RAM')
 
         # the state must be 2
-        self.vk.load(progress_bar=self.progress_bar)
+        self.progress_bar.setValue(0)
+        worker.signals.progress.connect(
+            lambda x: self.progress_bar.setValue(int(x[0] / x[1] * 100)))
+        worker.signals.loaded.connect(self.vk.add_loaded)
+        worker.signals.finished.connect(
+            lambda x, w=worker: self.load_data_finished(w, x))
+        self.load_worker = worker
+        self.btn_load_data.setText('cancel')
+        self.btn_load_data.repaint()
+        self.thread_pool.start(worker)
+
+    def cancel_load_data(self):
+        if self.load_worker is None:
+            return
+        self.load_worker.kill()
+        self.load_worker = None
+        self.statusbar.showMessage('Loading is canceled.', 1000)
+        self.btn_load_data.setText('update')
+        self.btn_load_data.setEnabled(True)
+        self.btn_load_data.repaint()
+
+    def load_data_finished(self, worker, result):
+        # skip the workers that have been canceled
+        if worker is not self.load_worker:
+            return
+        self.load_worker = None
+        self.progress_bar.setValue(100)
 
         self.data_state = 3
         self.plot_state[:] = 0
@@ -311,6 +407,36 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         }
         self.vk.add_roi(self.pg_saxs, **kwargs)
 
+    def update_roi_profile(self, label, live=True):
+        if not self.check_status(show_msg=False):
+            return
+        flag = self.vk.plot_roi_profile(self.pg_saxs, self.pg_saxs_roi, label,
+                                        file_index=self.pg_saxs.currentIndex,
+                                        live=live)
+        self.pg_saxs_roi.setVisible(flag)
+
+    def finish_roi_profile(self, label):
+        # replace the live profile with the exact one; saxs_1d uses the rois
+        self.update_roi_profile(label, live=False)
+        self.plot_state[2] = 0
+
+    def plot_cake(self):
+        if not self.check_status():
+            return
+
+        kwargs = {
+            'rows': self.get_selected_rows(),
+            'q_num': self.sb_cake_qnum.value(),
+            'phi_num': self.sb_cake_phinum.value(),
+            'cut_type': ('phi', 'q')[self.cb_cake_cut.currentIndex()],
+            'plot_type': ('linear', 'log')[self.cb_cake_log.isChecked()],
+            'cmap': self.cb_saxs2D_cmap.currentText(),
+        }
+        vrange = (self.cake_cut_min.value(), self.cake_cut_max.value())
+        if vrange[0] < vrange[1]:
+            kwargs['vrange'] = vrange
+        self.vk.plot_cake(self.pg_cake, **kwargs)
+
     def plot_saxs_1D(self):
         if not self.check_status():
             return
@@ -331,7 +457,14 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
             'weight': self.bkg_weight.value(),
             'show_roi': self.box_show_roi.isChecked(),
             'show_phi_roi': self.box_show_phi_roi.isChecked(),
+            'partition': None,
         }
+        if self.cb_saxs1d_partition.isChecked():
+            kwargs['partition'] = {
+                'q_num': self.sb_partition_qnum.value(),
+                'phi_num': self.sb_partition_phinum.value(),
+                'q_scale': self.cb_partition_qscale.currentText(),
+            }
         if kwargs['qmin'] >= kwargs['qmax']:
             self.statusbar.showMessage('check qmin and qmax')
             return
@@ -463,7 +596,8 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
             return
         rows = self.get_selected_rows()
         self.tree = self.vk.get_pg_tree(rows)
-        self.tree.show()
+        if self.tree is not None:
+            self.tree.show()
 
     def plot_stability_iq(self):
         if not self.check_status():
@@ -727,7 +861,14 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         if qmax < np.min(qd) or qmax < self.g2_qmin.value():
             self.g2_qmin.setValue(np.max(qd) * 1.1)
 
-    def plot_g2(self, max_points=3):
+    def refit_g2(self):
+        # the button works as the cancel button during the fitting
+        if self.fit_worker is not None:
+            self.cancel_fit_g2()
+            return
+        self.plot_g2(refit=True)
+
+    def plot_g2(self, max_points=3, refit=False):
         if not self.check_status() or self.vk.type != 'Multitau':
             return
 
@@ -779,6 +920,65 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
         # switch tabs;
         self.plot_state[6] = 0
 
+        if kwargs['show_fit']:
+            self.start_fit_g2(kwargs, refit)
+
+    def start_fit_g2(self, kwargs, refit=False):
+        """
+        fit the g2 in background; the fitting lines are drawn as the files
+        are fitted
+        """
+        # the settings may have changed; restart the fitting
+        if self.fit_worker is not None:
+            self.cancel_fit_g2()
+
+        worker = self.vk.get_fit_worker(
+            kwargs['q_range'], kwargs['t_range'], kwargs['bounds'],
+            kwargs['fit_flag'], kwargs['fit_func'], rows=kwargs['rows'],
+            refit=refit, bootstrap=self.g2_bootstrap[0],
+            level=self.g2_bootstrap[1])
+        if worker is None:
+            return
+
+        self.statusbar.showMessage('fitting g2 ...')
+        self.progress_bar.setValue(0)
+        worker.signals.progress.connect(
+            lambda x: self.progress_bar.setValue(int(x[0] / x[1] * 100)))
+        worker.signals.fitted.connect(
+            lambda x: self.update_g2_fit(worker, x))
+        worker.signals.finished.connect(
+            lambda x: self.fit_g2_finished(worker, x))
+        self.fit_worker = worker
+        self.btn_g2_refit.setText('cancel')
+        self.thread_pool.start(worker)
+
+    def cancel_fit_g2(self):
+        if self.fit_worker is None:
+            return
+        self.fit_worker.kill()
+        self.fit_worker_killed.append(self.fit_worker)
+        self.fit_worker = None
+        self.statusbar.showMessage('g2 fitting is canceled.', 1000)
+        self.btn_g2_refit.setText('refit')
+
+    def update_g2_fit(self, worker, result):
+        # the results of a canceled worker may be outdated
+        if worker is self.fit_worker:
+            self.vk.update_g2_fit(result)
+
+    def fit_g2_finished(self, worker, result):
+        # skip the workers that have been canceled
+        if worker is not self.fit_worker:
+            if worker in self.fit_worker_killed:
+                self.fit_worker_killed.remove(worker)
+            return
+        self.fit_worker = None
+        self.progress_bar.setValue(100)
+        self.btn_g2_refit.setText('refit')
+        self.statusbar.showMessage('fitted g2 of %d/%d files.' % result[:2],
+                                   1000)
+        self.plot_state[6] = 0
+
     def export_g2(self):
         self.vk.export_g2()
 
@@ -823,6 +1023,7 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
 
         if self.vk is None:
             self.vk = ViewerKernel(f, self.statusbar)
+            self.vk.set_max_cache_size(self.max_cache_size)
         else:
             self.vk.set_path(f)
             self.vk.clear()
@@ -888,6 +1089,7 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
             return
 
         # the target list has changed;
+        self.cancel_load_data()
         self.btn_load_data.setText('update')
         self.btn_load_data.setEnabled(True)
         self.btn_load_data.repaint()
@@ -950,6 +1152,7 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
             rmv_list.append(x.data())
 
         self.progress_bar.setValue(0)
+        self.cancel_load_data()
         self.vk.remove_target(rmv_list)
         # clear selection to avoid the bug: when the last one is selected, then
         # the list will out of bounds
@@ -967,12 +1170,15 @@ class XpcsViewer(QtWidgets.QMainWindow, Ui):
             self.load_data()
 
     def reset_gui(self):
+        self.cancel_load_data()
         self.data_state = 1
         self.plot_state[:] = 0
         self.vk.reset_kernel()
-        for x in [self.pg_saxs, self.pg_intt, self.mp_tauq, self.mp_2t,
-                  self.mp_2t_map, self.mp_g2, self.mp_saxs, self.mp_stab]:
+        for x in [self.pg_saxs, self.pg_cake, self.pg_intt, self.mp_tauq,
+                  self.mp_2t, self.mp_2t_map, self.mp_g2, self.mp_saxs,
+                  self.mp_stab]:
             x.clear()
+        self.pg_saxs_roi.hide()
         self.le_bkg_fname.clear()
 
     def trie_search(self):
@@ -1,13 +1,17 @@
 import numpy as np
 from .file_locator import FileLocator
-from .module import saxs2d, saxs1d, intt, stability, g2mod, tauq, twotime
+from .module import (saxs2d, saxs1d, intt, stability, g2mod, tauq, twotime,
+                     cake)
 from .module.average_toolbox import AverageToolbox
-import h5py
+from .fileIO.hdf_reader import get_keys
 from .helper.listmodel import TableDataModel
 import pyqtgraph as pg
 import os
 import logging
 from .xpcs_file import XpcsFile
+from .helper.fitting import fit_tauq_batch
+from .fit_worker import FitWorker
+from .helper.roi_operator import get_roi_data_batch
 
 
 logger = logging.getLogger(__name__)
@@ -23,6 +27,8 @@ class ViewerKernel(FileLocator):
         self.avg_worker = TableDataModel()
         self.avg_jid = 0
         self.avg_worker_active = {}
+        # the g2 plot that receives the fittings from FitWorker
+        self.g2_plot = None
 
     def reset_meta(self):
         self.meta = {
@@ -80,7 +86,9 @@ class ViewerKernel(FileLocator):
     def get_pg_tree(self, rows):
         if rows in [None, []]:
             rows = [0]
-        xfile = self.cache[self.target[rows[0]]]
+        xfile = self.get_xf(self.target[rows[0]])
+        if xfile is None:
+            return None
         return xfile.get_pg_tree()
     
     def get_fitting_tree(self, rows, max_points=12):
@@ -96,10 +104,44 @@ class ViewerKernel(FileLocator):
     def plot_g2(self, handler, q_range, t_range, y_range, max_points=128,
                 rows=None, **kwargs):
         xf_list = self.get_xf_list(max_points, rows=rows) 
-        g2mod.pg_plot(handler, xf_list, q_range, t_range, y_range, rows=rows,
-                      **kwargs)
+        self.g2_plot = g2mod.pg_plot(handler, xf_list, q_range, t_range,
+                                     y_range, rows=rows, **kwargs)
         return
 
+    def get_fit_worker(self, q_range, t_range, bounds, fit_flag, fit_func,
+                       max_points=128, rows=None, refit=False,
+                       max_workers=None, bootstrap=0, level=0.95):
+        """
+        create a FitWorker to fit the g2 of the selected files in background;
+        connect its fitted signal to update_g2_fit;
+        :param refit: if False, the files that are fitted with the same
+            settings are skipped, the results in fit_cache are used and the
+            others start from their current fit_summary
+        :param bootstrap: number of bootstrap samples of each q; 0 to skip
+            the bootstrap intervals
+        :return: the worker or None if there's nothing to fit
+        """
+        xf_list = self.get_xf_list(max_points, rows=rows)
+        if not refit:
+            xf_list = [xf for xf in xf_list if not xf.check_fit_summary(
+                q_range, t_range, bounds, fit_flag, fit_func,
+                bootstrap=bootstrap, level=level)]
+        if len(xf_list) == 0:
+            return None
+        return FitWorker(xf_list, q_range, t_range, bounds, fit_flag,
+                         fit_func, max_workers=max_workers,
+                         use_cache=not refit, warm_start=not refit,
+                         bootstrap=bootstrap, level=level)
+
+    def update_g2_fit(self, result):
+        """
+        set the fit_summary made by FitWorker and redraw the file's g2;
+        :param result: tuple of (XpcsFile, fit_summary)
+        """
+        xf, fit_summary = result
+        xf.fit_summary = fit_summary
+        g2mod.pg_update_fit(self.g2_plot, xf)
+
     def plot_tauq_pre(self, hdl=None, max_points=128, rows=None):
         xf_list = self.get_xf_list(max_points, rows=rows)
         short_list = [xf for xf in xf_list if xf.fit_summary is not None]
@@ -109,12 +151,13 @@ class ViewerKernel(FileLocator):
                   fit_flag=None, offset=None, max_points=128, q_range=None):
         
         xf_list = self.get_xf_list(max_points, rows=rows) 
+        # all the files are fitted together
+        fit_tauq_batch(xf_list, q_range, bounds, fit_flag)
         result = {}
         for x in xf_list:
             if x.fit_summary is None:
                 logger.info('g2 fitting is not available for %s', x.fname)
             else:
-                x.fit_tauq(q_range, bounds, fit_flag)
                 result[x.label] = x.get_fitting_info(mode='tauq_fitting')
         
         tauq.plot(xf_list, hdl=hdl, q_range=q_range, offset=offset,
@@ -123,11 +166,13 @@ class ViewerKernel(FileLocator):
         return result
 
     def plot_saxs_2d(self, *args, **kwargs):
-        ans = [self.cache[fn].saxs_2d for fn in self.target]
+        xf_list = self.get_xf_list(max_points=0)
+        if len(xf_list) == 0:
+            return
+        ans = [x.saxs_2d for x in xf_list]
         # extents = extent = (qy_min, qy_max, qx_min, qx_max)
-        extent = self.cache[self.target[0]].get_detector_extent()
-        center = (self.cache[self.target[0]].bcx,
-                  self.cache[self.target[0]].bcy)
+        extent = xf_list[0].get_detector_extent()
+        center = (xf_list[0].bcx, xf_list[0].bcy)
         saxs2d.plot(ans, extent=extent, center=center, *args, **kwargs)
     
     def add_roi(self, hdl, max_points=128, **kwargs):
@@ -144,6 +189,40 @@ class ViewerKernel(FileLocator):
             hdl.add_roi(cen=cen, radius=radius, label='RingA', **kwargs)
             hdl.add_roi(cen=cen, radius=0.8*radius, label='RingB', **kwargs)
 
+    def plot_roi_profile(self, pg_hdl, pg_roi, label, file_index=0,
+                         live=True):
+        """
+        plot the profile of one roi of one file;
+        :param pg_hdl: the saxs_2d image handler with the rois
+        :param pg_roi: the plot widget for the profile
+        :param label: label of the roi
+        :param file_index: index of the file in the target list
+        :param live: use the fast approximation while the roi is dragged
+        :return: True if the profile is plotted
+        """
+        roi = pg_hdl.get_roi_parameter(label)
+        if roi is None or self.target is None or \
+                file_index >= len(self.target):
+            return False
+        xf_list = self.get_xf_list(rows=[file_index])
+        if len(xf_list) == 0:
+            return False
+        if live:
+            x, y = xf_list[0].get_roi_data_live(roi)
+        else:
+            x, y = xf_list[0].get_roi_data(roi)
+        saxs2d.plot_roi_profile(pg_roi, np.asarray(x), np.asarray(y),
+                                sl_type=roi['sl_type'])
+        return True
+
+    def plot_cake(self, pg_hdl, max_points=128, rows=None, **kwargs):
+        xf_list = self.get_xf_list(max_points)
+        if len(xf_list) == 0:
+            return
+        file_index = rows[0] if rows else 0
+        cake.plot(xf_list, pg_hdl, legend=self.id_list[:len(xf_list)],
+                  file_index=file_index, **kwargs)
+
     def plot_saxs_1d(self, pg_hdl, mp_hdl, max_points=128, **kwargs):
         xf_list = self.get_xf_list(max_points)
         roi_list = pg_hdl.get_roi_list()
@@ -153,8 +232,9 @@ class ViewerKernel(FileLocator):
     def export_saxs_1d(self, pg_hdl, folder, max_points=128):
         xf_list = self.get_xf_list(max_points)
         roi_list = pg_hdl.get_roi_list()
-        for xf in xf_list:
-            xf.export_saxs1d(roi_list, folder)
+        roi_data = get_roi_data_batch(xf_list, roi_list)
+        for xf, data in zip(xf_list, roi_data):
+            xf.export_saxs1d(roi_list, folder, roi_data=data)
         return
     
     def switch_saxs1d_line(self, mp_hdl, lb_type):
@@ -163,10 +243,9 @@ class ViewerKernel(FileLocator):
     def setup_twotime(self, file_index=0, group='xpcs'):
         fname = self.target[file_index]
         res = []
-        with h5py.File(os.path.join(self.cwd, fname), 'r') as f:
-            for key in f.keys():
-                if 'xpcs' in key:
-                    res.append(key)
+        for key in get_keys(os.path.join(self.cwd, fname)):
+            if 'xpcs' in key:
+                res.append(key)
         return res
 
     def get_twotime_qindex(self, ix, iy, hdl):
@@ -177,7 +256,9 @@ class ViewerKernel(FileLocator):
         if fname is None:
             fname = self.target[0]
 
-        xfile = self.cache[fname]
+        xfile = self.get_xf(fname)
+        if xfile is None:
+            return
         twotime.plot_twotime_map(xfile, hdl, meta=self.meta, **kwargs)
         return
 
@@ -188,7 +269,9 @@ class ViewerKernel(FileLocator):
             return None
 
         fname = self.target[current_file_index]
-        xfile = self.cache[fname]
+        xfile = self.get_xf(fname)
+        if xfile is None:
+            return None
         ret = twotime.plot_twotime(xfile, hdl, hdl_map, plot_index=plot_index,
                                    meta=self.meta, **kwargs)
         return ret
@@ -198,7 +281,9 @@ class ViewerKernel(FileLocator):
         intt.plot(xf_list, pg_hdl, self.id_list, **kwargs)
 
     def plot_stability(self, mp_hdl, plot_id, **kwargs):
-        fc = self.cache[self.target[plot_id]]
+        fc = self.get_xf(self.target[plot_id])
+        if fc is None:
+            return
         stability.plot(fc, mp_hdl, **kwargs)
 
     def submit_job(self, *args, **kwargs):
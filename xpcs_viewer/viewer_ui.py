@@ -353,6 +353,70 @@ class Ui_mainWindow(object):
         self.gridLayout_3.addWidget(self.btn_saxs2d_roi_add, 0, 6, 1, 1)
         self.gridLayout_26.addWidget(self.groupBox_16, 3, 0, 1, 1)
         self.tabWidget.addTab(self.tab1_1, "")
+        self.tab_cake = QtWidgets.QWidget()
+        self.tab_cake.setObjectName("tab_cake")
+        self.gridLayout_cake = QtWidgets.QGridLayout(self.tab_cake)
+        self.gridLayout_cake.setObjectName("gridLayout_cake")
+        self.pg_cake = PlotWidgetDev(self.tab_cake)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.pg_cake.sizePolicy().hasHeightForWidth())
+        self.pg_cake.setSizePolicy(sizePolicy)
+        self.pg_cake.setObjectName("pg_cake")
+        self.gridLayout_cake.addWidget(self.pg_cake, 0, 0, 1, 1)
+        self.groupBox_cake = QtWidgets.QGroupBox(self.tab_cake)
+        self.groupBox_cake.setObjectName("groupBox_cake")
+        self.gridLayout_cake_2 = QtWidgets.QGridLayout(self.groupBox_cake)
+        self.gridLayout_cake_2.setObjectName("gridLayout_cake_2")
+        self.label_cake_qnum = QtWidgets.QLabel(self.groupBox_cake)
+        self.label_cake_qnum.setObjectName("label_cake_qnum")
+        self.gridLayout_cake_2.addWidget(self.label_cake_qnum, 0, 0, 1, 1)
+        self.sb_cake_qnum = QtWidgets.QSpinBox(self.groupBox_cake)
+        self.sb_cake_qnum.setMinimum(8)
+        self.sb_cake_qnum.setMaximum(4096)
+        self.sb_cake_qnum.setProperty("value", 256)
+        self.sb_cake_qnum.setObjectName("sb_cake_qnum")
+        self.gridLayout_cake_2.addWidget(self.sb_cake_qnum, 0, 1, 1, 1)
+        self.label_cake_phinum = QtWidgets.QLabel(self.groupBox_cake)
+        self.label_cake_phinum.setObjectName("label_cake_phinum")
+        self.gridLayout_cake_2.addWidget(self.label_cake_phinum, 0, 2, 1, 1)
+        self.sb_cake_phinum = QtWidgets.QSpinBox(self.groupBox_cake)
+        self.sb_cake_phinum.setMinimum(4)
+        self.sb_cake_phinum.setMaximum(3600)
+        self.sb_cake_phinum.setProperty("value", 360)
+        self.sb_cake_phinum.setObjectName("sb_cake_phinum")
+        self.gridLayout_cake_2.addWidget(self.sb_cake_phinum, 0, 3, 1, 1)
+        self.cb_cake_log = QtWidgets.QCheckBox(self.groupBox_cake)
+        self.cb_cake_log.setChecked(True)
+        self.cb_cake_log.setObjectName("cb_cake_log")
+        self.gridLayout_cake_2.addWidget(self.cb_cake_log, 0, 4, 1, 1)
+        self.label_cake_cut = QtWidgets.QLabel(self.groupBox_cake)
+        self.label_cake_cut.setObjectName("label_cake_cut")
+        self.gridLayout_cake_2.addWidget(self.label_cake_cut, 1, 0, 1, 1)
+        self.cb_cake_cut = QtWidgets.QComboBox(self.groupBox_cake)
+        self.cb_cake_cut.setObjectName("cb_cake_cut")
+        self.cb_cake_cut.addItem("")
+        self.cb_cake_cut.addItem("")
+        self.gridLayout_cake_2.addWidget(self.cb_cake_cut, 1, 1, 1, 1)
+        self.label_cake_range = QtWidgets.QLabel(self.groupBox_cake)
+        self.label_cake_range.setObjectName("label_cake_range")
+        self.gridLayout_cake_2.addWidget(self.label_cake_range, 1, 2, 1, 1)
+        self.cake_cut_min = QtWidgets.QDoubleSpinBox(self.groupBox_cake)
+        self.cake_cut_min.setDecimals(4)
+        self.cake_cut_min.setMaximum(360.0)
+        self.cake_cut_min.setObjectName("cake_cut_min")
+        self.gridLayout_cake_2.addWidget(self.cake_cut_min, 1, 3, 1, 1)
+        self.cake_cut_max = QtWidgets.QDoubleSpinBox(self.groupBox_cake)
+        self.cake_cut_max.setDecimals(4)
+        self.cake_cut_max.setMaximum(360.0)
+        self.cake_cut_max.setObjectName("cake_cut_max")
+        self.gridLayout_cake_2.addWidget(self.cake_cut_max, 1, 4, 1, 1)
+        self.btn_cake_plot = QtWidgets.QPushButton(self.groupBox_cake)
+        self.btn_cake_plot.setObjectName("btn_cake_plot")
+        self.gridLayout_cake_2.addWidget(self.btn_cake_plot, 1, 5, 1, 1)
+        self.gridLayout_cake.addWidget(self.groupBox_cake, 1, 0, 1, 1)
+        self.tabWidget.addTab(self.tab_cake, "")
         self.tab_2 = QtWidgets.QWidget()
         self.tab_2.setObjectName("tab_2")
         self.gridLayout_25 = QtWidgets.QGridLayout(self.tab_2)
@@ -519,6 +583,40 @@ class Ui_mainWindow(object):
         self.pushButton_10.setSizePolicy(sizePolicy)
         self.pushButton_10.setObjectName("pushButton_10")
         self.gridLayout_24.addWidget(self.pushButton_10, 1, 2, 2, 1)
+        self.groupBox_partition = QtWidgets.QGroupBox(self.groupBox_6)
+        self.groupBox_partition.setObjectName("groupBox_partition")
+        self.gridLayout_partition = QtWidgets.QGridLayout(self.groupBox_partition)
+        self.gridLayout_partition.setObjectName("gridLayout_partition")
+        self.cb_saxs1d_partition = QtWidgets.QCheckBox(self.groupBox_partition)
+        self.cb_saxs1d_partition.setObjectName("cb_saxs1d_partition")
+        self.gridLayout_partition.addWidget(self.cb_saxs1d_partition, 0, 0, 1, 1)
+        self.label_partition_qnum = QtWidgets.QLabel(self.groupBox_partition)
+        self.label_partition_qnum.setObjectName("label_partition_qnum")
+        self.gridLayout_partition.addWidget(self.label_partition_qnum, 0, 1, 1, 1)
+        self.sb_partition_qnum = QtWidgets.QSpinBox(self.groupBox_partition)
+        self.sb_partition_qnum.setEnabled(False)
+        self.sb_partition_qnum.setMinimum(4)
+        self.sb_partition_qnum.setMaximum(4096)
+        self.sb_partition_qnum.setProperty("value", 128)
+        self.sb_partition_qnum.setObjectName("sb_partition_qnum")
+        self.gridLayout_partition.addWidget(self.sb_partition_qnum, 0, 2, 1, 1)
+        self.cb_partition_qscale = QtWidgets.QComboBox(self.groupBox_partition)
+        self.cb_partition_qscale.setEnabled(False)
+        self.cb_partition_qscale.setObjectName("cb_partition_qscale")
+        self.cb_partition_qscale.addItem("")
+        self.cb_partition_qscale.addItem("")
+        self.gridLayout_partition.addWidget(self.cb_partition_qscale, 0, 3, 1, 1)
+        self.label_partition_phinum = QtWidgets.QLabel(self.groupBox_partition)
+        self.label_partition_phinum.setObjectName("label_partition_phinum")
+        self.gridLayout_partition.addWidget(self.label_partition_phinum, 0, 4, 1, 1)
+        self.sb_partition_phinum = QtWidgets.QSpinBox(self.groupBox_partition)
+        self.sb_partition_phinum.setEnabled(False)
+        self.sb_partition_phinum.setMinimum(1)
+        self.sb_partition_phinum.setMaximum(360)
+        self.sb_partition_phinum.setProperty("value", 1)
+        self.sb_partition_phinum.setObjectName("sb_partition_phinum")
+        self.gridLayout_partition.addWidget(self.sb_partition_phinum, 0, 5, 1, 1)
+        self.gridLayout_24.addWidget(self.groupBox_partition, 3, 0, 1, 3)
         self.gridLayout_25.addWidget(self.groupBox_6, 1, 0, 1, 1)
         self.tabWidget.addTab(self.tab_2, "")
         self.tab_3 = QtWidgets.QWidget()
@@ -1612,6 +1710,9 @@ class Ui_mainWindow(object):
         self.cb_sub_bkg.toggled['bool'].connect(self.le_bkg_fname.setEnabled)
         self.cb_sub_bkg.toggled['bool'].connect(self.btn_select_bkgfile.setEnabled)
         self.cb_sub_bkg.toggled['bool'].connect(self.bkg_weight.setEnabled)
+        self.cb_saxs1d_partition.toggled['bool'].connect(self.sb_partition_qnum.setEnabled)
+        self.cb_saxs1d_partition.toggled['bool'].connect(self.cb_partition_qscale.setEnabled)
+        self.cb_saxs1d_partition.toggled['bool'].connect(self.sb_partition_phinum.setEnabled)
         self.box_show_phi_roi.toggled['bool'].connect(self.box_show_roi.setDisabled)
         self.box_show_phi_roi.toggled['bool'].connect(self.box_all_phi.setDisabled)
         QtCore.QMetaObject.connectSlotsByName(mainWindow)
@@ -1796,8 +1897,24 @@ class Ui_mainWindow(object):
         self.label_61.setText(_translate("mainWindow", "linewidth:"))
         self.btn_saxs2d_roi_add.setText(_translate("mainWindow", "Add"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab1_1), _translate("mainWindow", "SAXS-2D"))
+        self.groupBox_cake.setTitle(_translate("mainWindow", "Cake"))
+        self.label_cake_qnum.setText(_translate("mainWindow", "q bins:"))
+        self.label_cake_phinum.setText(_translate("mainWindow", "phi bins:"))
+        self.cb_cake_log.setText(_translate("mainWindow", "log"))
+        self.label_cake_cut.setText(_translate("mainWindow", "cut:"))
+        self.cb_cake_cut.setItemText(0, _translate("mainWindow", "phi profile over q range"))
+        self.cb_cake_cut.setItemText(1, _translate("mainWindow", "q profile over phi range"))
+        self.label_cake_range.setText(_translate("mainWindow", "range:"))
+        self.btn_cake_plot.setText(_translate("mainWindow", "plot"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_cake), _translate("mainWindow", "SAXS-Cake"))
         self.groupBox_6.setTitle(_translate("mainWindow", "SAXS 1D Plot Setting"))
         self.groupBox_14.setTitle(_translate("mainWindow", "Background"))
+        self.groupBox_partition.setTitle(_translate("mainWindow", "Re-partition SAXS-2D"))
+        self.cb_saxs1d_partition.setText(_translate("mainWindow", "enable"))
+        self.label_partition_qnum.setText(_translate("mainWindow", "q bins:"))
+        self.cb_partition_qscale.setItemText(0, _translate("mainWindow", "linear"))
+        self.cb_partition_qscale.setItemText(1, _translate("mainWindow", "log"))
+        self.label_partition_phinum.setText(_translate("mainWindow", "phi sectors:"))
         self.cb_sub_bkg.setText(_translate("mainWindow", "subtract background"))
         self.btn_select_bkgfile.setText(_translate("mainWindow", "select"))
         self.label_59.setText(_translate("mainWindow", "weight"))
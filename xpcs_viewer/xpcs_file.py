@@ -1,61 +1,32 @@
 import os
 import numpy as np
-from .fileIO.hdf_reader import get, get_type, create_id, get_abs_cs_scale
-from .fileIO.ftype_utils import get_ftype
+from .fileIO.hdf_reader import (get, probe_type, create_id,
+                                get_abs_cs_scale)
+from .fileIO.reduced_cache import reduced_cache
+from .helper.intern_store import array_store
+from .helper.qmap import qmap_cache
+from .helper.pixel_index import compact_frame, expand_frame
+from .helper.roi_operator import (get_digest, get_roi_key, roi_operator_cache,
+                                  build_pie_operator, build_ring_operator,
+                                  build_cake_operator, get_q_edges,
+                                  sorted_bins_cache, build_pie_bins,
+                                  build_ring_bins, get_pie_ranges,
+                                  get_ring_profile)
 from .plothandler.matplot_qt import MplCanvasBarV
 from .module import saxs2d, saxs1d, intt, stability, g2mod
 from .module.g2mod import create_slice
-from .helper.fitting import fit_with_fixed
+from .helper.fitting import (single_exp_all, double_exp_all, power_law,
+                             default_num_starts, fit_g2_batch, fit_tauq_batch,
+                             fit_g2_global_batch)
+from .helper.fit_cache import fit_cache, file_signature
 import pyqtgraph as pg
 from .fileIO.hdf_to_str import get_hdf_info
 from pyqtgraph.Qt import QtGui
 import traceback
+import logging
 
 
-
-
-def single_exp_all(x, a, b, c, d):
-    """
-    single exponential fitting for xpcs-multitau analysis
-    :param x: delay in seconds
-    :param a: contrast
-    :param b: tau
-    :param c: restriction factor
-    :param d: baseline
-    :return:
-    """
-    return a * np.exp(-2 * (x / b) ** c) + d
-
-
-def double_exp_all(x, a, b1, c1, d, b2, c2, f):
-    """
-    double exponential fitting for xpcs-multitau analysis
-    Args:
-        x: delay in seconds, float or 1d-numpy.ndarray
-        a: contrast
-        f: fraction for the 1st exp function; the 2nd has (1-f) weight
-        b1: tau for 1st exp function
-        c1: restriction factor for the 1st exp function
-        b2: tau for 2nd exp function
-        c2: restriction factor for the 2nd exp function
-        d: baseline
-    Return:
-        function value
-    """
-    t1 = np.exp(-1 * (x / b1) ** c1) * f
-    t2 = np.exp(-1 * (x / b2) ** c2) * (1 - f)
-    return a * (t1 + t2) ** 2 + d
-
-
-def power_law(x, a, b):
-    """
-    power law for fitting the diffusion factor
-    :param x: tau
-    :param a:
-    :param b:
-    :return:
-    """
-    return a * x ** b
+logger = logging.getLogger(__name__)
 
 
 def reshape_static_analysis(info):
@@ -89,32 +60,74 @@ class XpcsFile(object):
     XpcsFile is a class that wraps an Xpcs analysis hdf file;
     """
 
-    def __init__(self, fname, cwd='.', fields=None):
+    # small fields that are always read when the file is opened
+    meta_fields = ['t0', 't1', 'ql_dyn', 'type', 'bcx', 'bcy', 'det_dist',
+                   'pix_dim_x', 'pix_dim_y', 'X_energy', 'avg_frames',
+                   'stride_frames', 'snoq', 'snophi', 'dnoq', 'dnophi',
+                   'ccdx', 'ccdx0', 'ccdy', 'ccdy0']
+
+    # fields that need post-processing; the value is the name of the method
+    # that reads the whole group from the hdf file; the other fields are
+    # read as they are.
+    group_loaders = {
+        'saxs_2d': '_load_saxs_2d',
+        'mask': '_load_saxs_2d',
+        'saxs_2d_valid': '_load_saxs_2d',
+        'pixel_index': '_load_saxs_2d',
+        'saxs_1d': '_load_saxs_1d',
+        'Iqp': '_load_saxs_1d',
+        'ql_sta': '_load_saxs_1d',
+        'dqmap': '_load_dqmap',
+        'tau': '_load_tau',
+        't_el': '_load_tau',
+        'g2': '_load_g2',
+        'g2_err': '_load_g2',
+        'g2_err_mod': '_load_g2',
+        'g2_full': '_load_g2',
+        'g2_partials': '_load_g2',
+        'abs_cross_section_scale': '_load_abs_cs_scale',
+    }
+
+    # fields that are usually identical for the files in a series; one
+    # read-only copy is shared by all the files
+    shared_fields = ['dqmap', 'mask', 'sqspan', 'ql_sta', 'ql_dyn', 'tau',
+                     't_el', 'sphilist', 'dphilist', 'pixel_index']
+
+    # keep only the valid pixels of saxs_2d (saxs_2d_valid at pixel_index);
+    # the dense saxs_2d is rebuilt when it's accessed
+    compact_saxs_2d = False
+
+    def __init__(self, fname, cwd='.', fields=None, lazy=False):
         self.fname = fname
         self.full_path = os.path.join(cwd, fname)
         self.cwd = cwd
 
         # label is a short string to describe the file/filename
         self.label = create_id(fname)
-        self.ftype = get_ftype(self.full_path)
-        # print(fname, self.ftype)
-
-        if self.ftype == 'nexus':
-            self.type = 'Multitau'
-        else:
-            self.type = get_type(self.full_path)
-
-        self.keys, attr = self._load(fields)
+        # nexus files are always Multitau
+        self.ftype, self.type = probe_type(self.full_path)
+        self._compact = XpcsFile.compact_saxs_2d
+        # key of the reduced data cache entry; None if the cache is disabled
+        self._cache_key = reduced_cache.get_key(self.full_path)
+        # content signature for the fitting results; see get_fit_key
+        self._signature = file_signature(self.full_path)
+
+        # in the lazy mode, the fields in _lazy_fields are read from the hdf
+        # file when they are accessed for the first time
+        self._lazy_fields = set()
+        self.keys, attr = self._load(fields, lazy=lazy)
         self.__dict__.update(attr)
 
         self.hdf_info = None
         self.fit_summary = None
+        # cumulative sums of saxs_2d for the live roi profiles
+        self._roi_cumsum = {}
 
     def __str__(self):
         ans = ['File:' + str(self.full_path)]
         for key, val in self.__dict__.items():
             # omit those to avoid lengthy output
-            if key in ['hdf_key', "hdf_info"]:
+            if key in ['hdf_key', "hdf_info"] or key.startswith('_'):
                 continue
             elif isinstance(val, np.ndarray) and val.size > 1:
                 val = str(val.shape)
@@ -162,51 +175,159 @@ class XpcsFile(object):
 
         return msg
 
-    def _load(self, extra_fields=None):
+    def _load_meta(self):
+        ret = reduced_cache.read(self._cache_key, self.meta_fields)
+        if ret is not None:
+            return self._share(ret)
+
+        ret = get(self.full_path, self.meta_fields, 'alias', ftype=self.ftype)
+
+        # get the avg_frames and stride_frames into t0; t0 is in seconds
+        ret['t0'] = ret['t0'] * ret['avg_frames'] * ret['stride_frames']
+
+        for key in ['snoq', 'snophi', 'dnoq', 'dnophi']:
+            ret[key] = int(ret[key])
+
+        ret['bcx'] += (ret['ccdx'] - ret['ccdx0']) / ret['pix_dim_x']
+        ret['bcy'] += (ret['ccdy'] - ret['ccdy0']) / ret['pix_dim_y']
+
+        reduced_cache.write(self._cache_key, ret)
+        return self._share(ret)
+
+    def _load(self, extra_fields=None, lazy=False):
+        ret = self._load_meta()
+
         # default common fields for both twotime and multitau analysis;
-        fields = ['saxs_2d', "saxs_1d", 'Iqp', 'ql_sta', 'Int_t', 't0', 't1',
-                  'ql_dyn', 'type', 'dqmap', 'bcx', 'bcy', 'det_dist',
-                  'pix_dim_x', 'pix_dim_y', 'X_energy',
-                  'avg_frames', 'stride_frames', 'snoq', 'snophi', 'dnoq',
-                  'dnophi', 'sphilist', 'dphilist', 'sqspan', 'ql_sta',
-                  'mask', 'ccdx', 'ccdx0', 'ccdy', 'ccdy0']
+        fields = ['saxs_2d', 'saxs_1d', 'Iqp', 'ql_sta', 'Int_t', 'dqmap',
+                  'sphilist', 'dphilist', 'sqspan', 'mask',
+                  'abs_cross_section_scale']
 
         # extra fields for twotime analysis
         if self.type == 'Twotime':
-            fields = fields + ['g2_full', 'g2_partials']
+            fields = fields + ['g2_full', 'g2_partials', 'g2', 't_el']
         # extra fields for multitau analysis
         else:
-            fields = fields + ['tau', 'g2', 'g2_err']
+            fields = fields + ['tau', 'g2', 'g2_err', 'g2_err_mod', 't_el']
 
         # append other extra fields, eg 'G2', 'IP', 'IF'
         if isinstance(extra_fields, list):
             fields += extra_fields
 
+        if self._compact:
+            fields = [x for x in fields if x != 'saxs_2d']
+            fields += ['saxs_2d_valid', 'pixel_index']
+
         # avoid multiple keys
-        fields = list(set(fields))
+        fields = [x for x in set(fields) if x not in ret]
 
-        ret = get(self.full_path, fields, 'alias', ftype=self.ftype)
-        ret['dqmap'] = ret['dqmap'].astype(np.uint16)
+        if lazy:
+            self._lazy_fields.update(fields)
+            return list(ret.keys()) + fields, ret
 
-        # get the avg_frames and stride_frames into t0; t0 is in seconds
-        ret['t0'] = ret['t0'] * ret['avg_frames'] * ret['stride_frames']
+        # read the fields group by group
+        while len(fields) > 0:
+            ret.update(self._load_field(fields[0], ret))
+            fields = [x for x in fields if x not in ret]
 
-        # get t_el which is in the unit of seconds;
-        if 'tau' in ret:
-            ret['t_el'] = ret['t0'] * ret['tau']
+        return ret.keys(), ret
 
-        if self.type == 'Twotime':
-            ret['g2'] = ret['g2_full']
-            ret['t_el'] = np.arange(ret['g2'].shape[0]) * ret['t0']
+    def _load_field(self, key, info):
+        """
+        read the group that key belongs to from the hdf file;
+        :param key: the name of the field
+        :param info: dictionary with the metadata fields
+        :return: a dictionary of the fields in the same group
+        """
+        # the post-processed fields are saved in the cache one by one
+        ret = reduced_cache.read(self._cache_key, [key])
+        if ret is not None:
+            return self._share(ret)
+
+        if key in self.group_loaders:
+            ret = getattr(self, self.group_loaders[key])(info)
         else:
-            # correct g2_err to avoid fitting divergence
-            ret['g2_err_mod'] = self.correct_g2_err(ret['g2_err'])
+            ret = get(self.full_path, [key], 'alias', ftype=self.ftype)
+        reduced_cache.write(self._cache_key, ret)
+        return self._share(ret)
+
+    def _share(self, ret):
+        for key in self.shared_fields:
+            if key in ret:
+                ret[key] = array_store.intern(ret[key])
+        return ret
+
+    def _load_lazy(self, key):
+        ret = self._load_field(key, self.__dict__)
+        self.__dict__.update(ret)
+        self._lazy_fields.difference_update(ret.keys())
+
+    @property
+    def nbytes(self):
+        """
+        the memory held by the arrays of this file in bytes; memory-mapped
+        arrays and the shared fields are not counted.
+        """
+        def sizeof(val):
+            if isinstance(val, np.memmap):
+                return 0
+            elif isinstance(val, np.ndarray):
+                return val.nbytes
+            elif isinstance(val, dict):
+                return sum([sizeof(x) for x in val.values()])
+            elif isinstance(val, (list, tuple)):
+                return sum([sizeof(x) for x in val])
+            return 0
+        return sum([sizeof(v) for k, v in self.__dict__.items()
+                    if k not in self.shared_fields])
+
+    def release(self, min_size=4096):
+        """
+        free the large fields; they are read again when accessed;
+        :param min_size: fields smaller than min_size bytes are kept
+        """
+        self._roi_cumsum = {}
+        for key in self.keys:
+            val = self.__dict__.get(key, None)
+            if key in self.meta_fields or not isinstance(val, np.ndarray):
+                continue
+            if val.nbytes >= min_size:
+                # the whole group is dropped because they are read together
+                for x in self.keys:
+                    if self.group_loaders.get(x, x) == \
+                            self.group_loaders.get(key, key):
+                        self.__dict__.pop(x, None)
+                        self._lazy_fields.add(x)
+
+    def _load_saxs_2d(self, info):
+        ret = get(self.full_path, ['saxs_2d', 'mask'], 'alias',
+                  ftype=self.ftype)
+        # apply mask
+        if ret['mask'].shape != ret['saxs_2d'].shape:
+            ret['mask'] = ret['mask'].T
+        if self._compact:
+            saxs_2d = ret.pop('saxs_2d')
+            ret['pixel_index'], ret['saxs_2d_valid'] = compact_frame(
+                saxs_2d, ret['mask'])
+        else:
+            ret['saxs_2d'] = ret['saxs_2d'] * ret['mask']
+        return ret
 
-        for key in ['snoq', 'snophi', 'dnoq', 'dnophi']:
-            ret[key] = int(ret[key])
+    def get_pixel_data(self):
+        """
+        the saxs_2d values for the roi and averaging code;
+        :return: (pixel_index, values); in the compact mode values are the
+            valid pixels at pixel_index; otherwise pixel_index is None and
+            values is the flattened saxs_2d
+        """
+        if self._compact:
+            return self.pixel_index, self.saxs_2d_valid
+        return None, self.saxs_2d.ravel()
 
-        ret['bcx'] += (ret['ccdx'] - ret['ccdx0']) / ret['pix_dim_x']
-        ret['bcy'] += (ret['ccdy'] - ret['ccdy0']) / ret['pix_dim_y']
+    def _load_saxs_1d(self, info):
+        ret = get(self.full_path, ['saxs_1d', 'Iqp', 'ql_sta', 'sphilist'],
+                  'alias', ftype=self.ftype)
+        for key in ['snoq', 'snophi']:
+            ret[key] = info[key]
 
         self.reshape_phi_analysis(ret)
 
@@ -217,15 +338,38 @@ class XpcsFile(object):
         ret['Iqp'] = ret['Iqp'][:, ord_idx]
         ret['ql_sta'] = ret['ql_sta'][ord_idx]
 
-        scale = get_abs_cs_scale(self.full_path, ftype=self.ftype)
-        ret['abs_cross_section_scale'] = scale
+        return {key: ret[key] for key in ['saxs_1d', 'Iqp', 'ql_sta']}
 
-        # apply mask
-        if ret['mask'].shape != ret['saxs_2d'].shape:
-            ret['mask'] = ret['mask'].T
-        ret['saxs_2d'] = ret['saxs_2d'] * ret['mask']
+    def _load_dqmap(self, info):
+        dqmap = get(self.full_path, ['dqmap'], 'alias', ret_type='list',
+                    ftype=self.ftype)[0]
+        return {'dqmap': dqmap.astype(np.uint16)}
 
-        return ret.keys(), ret
+    def _load_tau(self, info):
+        # twotime's t_el depends on the shape of g2
+        if self.type == 'Twotime':
+            return self._load_g2(info)
+        ret = get(self.full_path, ['tau'], 'alias', ftype=self.ftype)
+        # get t_el which is in the unit of seconds;
+        ret['t_el'] = info['t0'] * ret['tau']
+        return ret
+
+    def _load_g2(self, info):
+        if self.type == 'Twotime':
+            ret = get(self.full_path, ['g2_full', 'g2_partials'], 'alias',
+                      ftype=self.ftype)
+            ret['g2'] = ret['g2_full']
+            ret['t_el'] = np.arange(ret['g2'].shape[0]) * info['t0']
+        else:
+            ret = get(self.full_path, ['g2', 'g2_err'], 'alias',
+                      ftype=self.ftype)
+            # correct g2_err to avoid fitting divergence
+            ret['g2_err_mod'] = self.correct_g2_err(ret['g2_err'])
+        return ret
+
+    def _load_abs_cs_scale(self, info):
+        scale = get_abs_cs_scale(self.full_path, ftype=self.ftype)
+        return {'abs_cross_section_scale': scale}
 
     def reshape_phi_analysis(self, info):
         """
@@ -285,14 +429,65 @@ class XpcsFile(object):
         }
         return
 
+    def read_partial(self, key, selection):
+        """
+        get a part of a 2d correlation field, eg. g2[t_slice, q_slice]; if
+        the field hasn't been loaded, only the selected part is read from the
+        hdf file;
+        :param key: one of ['g2', 'g2_err', 'g2_err_mod', 'g2_full',
+            'g2_partials']
+        :param selection: index/slice/index array or a tuple of them
+        :return: numpy.ndarray
+        """
+        if key in self.__dict__:
+            return self.__dict__[key][selection]
+
+        if self.type == 'Twotime' and key == 'g2':
+            key = 'g2_full'
+
+        if key == 'g2_err_mod':
+            # the correction averages over the whole t axis; read the
+            # selected q columns and then apply the t selection
+            if not isinstance(selection, tuple):
+                selection = (selection, )
+            t_sel, q_sel = (tuple(selection) + (slice(None), ) * 2)[0:2]
+            if isinstance(q_sel, slice):
+                g2_err = self.read_partial('g2_err', (slice(None), q_sel))
+                return self.correct_g2_err(g2_err)[t_sel]
+            q_sel = np.asarray(q_sel)
+            if q_sel.dtype == bool:
+                q_sel = np.nonzero(q_sel)[0]
+            q_uniq, q_inv = np.unique(q_sel, return_inverse=True)
+            g2_err = self.read_partial('g2_err', (slice(None), q_uniq))
+            g2_err_mod = self.correct_g2_err(g2_err)
+            return g2_err_mod[t_sel, q_inv.reshape(q_sel.shape)]
+
+        if key not in ['g2', 'g2_err', 'g2_full', 'g2_partials']:
+            return self.at(key)[selection]
+
+        return get(self.full_path, [key], 'alias', ret_type='list',
+                   ftype=self.ftype, slices={key: selection})[0]
+
     def at(self, key):
-        return self.__dict__[key]
+        if key in self.__dict__:
+            return self.__dict__[key]
+        return self.__getattr__(key)
 
     def __getattr__(self, key):
-        if key in self.__dict__:
+        # only called when key is not found in self.__dict__
+        if key == 'saxs_2d' and self.__dict__.get('_compact', False):
+            # rebuilt for display; it's not kept to save the memory, so
+            # use the shape of mask if only the shape is needed
+            return expand_frame(self.pixel_index, self.saxs_2d_valid,
+                                self.mask.shape)
+        elif key in self.__dict__.get('_lazy_fields', ()):
+            self._load_lazy(key)
             return self.__dict__[key]
+        elif key.startswith('__'):
+            # special methods are looked up by copy and pickle
+            raise AttributeError(key)
         else:
-            raise KeyError
+            raise KeyError(key)
 
     def read_extra_metadata(self, key, alias, callback_function=None):
         value = get(self.full_path, [key], ret_type='list', ftype=self.ftype)[0]
@@ -359,7 +554,11 @@ class XpcsFile(object):
         get the angular extent on the detector, for saxs2d, qmap/display;
         :return:
         """
-        shape = self.saxs_2d.shape
+        if self._compact:
+            # the dense saxs_2d would be rebuilt just for its shape
+            shape = self.mask.shape
+        else:
+            shape = self.saxs_2d.shape
 
         wlength = 12.398 / self.X_energy
         pix2q_x = self.pix_dim_x / self.det_dist * (2 * np.pi / wlength)
@@ -451,8 +650,16 @@ class XpcsFile(object):
 
         if mode == 'g2_fitting':
             result = self.fit_summary.copy()
-            # fit_line is not useful to display
-            result.pop('fit_line', None)
+            # fit_line is not useful to display, except the solver's stats
+            lines = result.pop('fit_line', None)
+            result['fit_diag'] = np.array([
+                'nit = %d, nfev = %d, time = %.2f ms, stop = %s: %s' % (
+                    x.get('nit', 0), x.get('nfev', 0),
+                    x.get('time', 0) * 1000, x.get('stop', ''), x['msg']) +
+                ('; %d/%d starts converged, %d near the best' % (
+                    x['num_converged'], x['num_starts'], x['num_best'])
+                 if 'num_starts' in x else '')
+                for x in lines])
             val = result.pop('fit_val', None)
             if result['fit_func'] == 'single':
                 prefix = ['a', 'b', 'c', 'd']
@@ -468,6 +675,15 @@ class XpcsFile(object):
                 msg.append(', '.join(temp))
             result['fit_val'] = np.array(msg)
 
+            if 'fit_ci' in result:
+                ci = result.pop('fit_ci')
+                msg = []
+                for n in range(ci.shape[0]):
+                    msg.append(', '.join(['%s: [%f, %f]' % (
+                        prefix[m], ci[n, 0, m], ci[n, 1, m])
+                        for m in range(len(prefix))]))
+                result['fit_ci'] = np.array(msg)
+
         elif mode == 'tauq_fitting':
             if 'tauq_fit_val' not in self.fit_summary:
                 result = 'tauq fitting is not available'
@@ -481,7 +697,8 @@ class XpcsFile(object):
         return result
 
     def fit_g2(self, q_range=None, t_range=None, bounds=None,
-               fit_flag=None, fit_func='single'):
+               fit_flag=None, fit_func='single', num_starts=None,
+               bootstrap=0, level=0.95):
         """
         fit the g2 values using single exponential decay function
         :param q_range: a tuple of q lower bound and upper bound
@@ -490,27 +707,80 @@ class XpcsFile(object):
         :param fit_flag: tuple of bools; True to fit and False to float
         :param fit_func: ['single' | 'double']: to fit with single exponential
             or double exponential function
+        :param num_starts: number of starts of each q; None to use
+            default_num_starts
+        :param bootstrap: number of bootstrap samples of each q; 0 to skip
+            the bootstrap intervals
+        :param level: the confidence level of the bootstrap intervals
         :return: dictionary with the fitting result;
         """
-        assert len(bounds) == 2
-        if fit_func == 'single':
-            assert len(bounds[0]) == 4, \
-                "for single exp, the shape of bounds must be (2, 4)"
-            if fit_flag is None:
-                fit_flag = [True for _ in range(4)]
-            func = single_exp_all
-        else:
-            assert len(bounds[0]) == 7, \
-                "for single exp, the shape of bounds must be (2, 4)"
-            if fit_flag is None:
-                fit_flag = [True for _ in range(7)]
-            func = double_exp_all
+        return fit_g2_batch([self], q_range, t_range, bounds, fit_flag,
+                            fit_func, num_starts=num_starts,
+                            bootstrap=bootstrap, level=level)[0]
+
+    def fit_g2_global(self, q_range=None, t_range=None, bounds=None,
+                      fit_flag=None, tauq_bounds=None, tauq_flag=None,
+                      share=(False, False, False)):
+        """
+        fit the g2 of all q with the single exp together, with tau tied to q
+        by the power law tau = a * q ** b; the power law is saved in the
+        tauq fields of fit_summary.
+        :param tauq_bounds: bounds of the power law's (a, b)
+        :param tauq_flag: tuple of two bools; True to fit and False to fix
+        :param share: tuple of three bools for contrast, stretch and
+            baseline; True to use one value for all q
+        :return: dictionary with the fitting result;
+        """
+        return fit_g2_global_batch([self], q_range, t_range, bounds,
+                                   fit_flag, tauq_bounds, tauq_flag,
+                                   share)[0]
 
+    def get_fit_key(self, q_range, t_range, bounds, fit_flag, fit_func,
+                    fit_mode='independent', **settings):
+        """
+        the key of the g2 fitting result in fit_cache; None if the file
+        can't be accessed
+        :param fit_mode: 'independent' or 'global'
+        :param settings: other settings of the fitting mode, by name
+        """
+        return fit_cache.get_key(self._signature, fit_func=fit_func,
+                                 fit_mode=fit_mode, q_range=q_range,
+                                 t_range=t_range, bounds=bounds,
+                                 fit_flag=fit_flag, **settings)
+
+    def check_fit_summary(self, q_range, t_range, bounds, fit_flag,
+                          fit_func, num_starts=None, bootstrap=0,
+                          level=0.95):
+        """
+        check if the fit_summary is made with the given settings;
+        :return: True if it's up to date, False otherwise
+        """
+        t = self.fit_summary
+        if t is None:
+            return False
+        if num_starts is None:
+            num_starts = default_num_starts.get(fit_func, 1)
+        boot = t.get('bootstrap', {'num_samples': 0, 'level': level})
+        return (t['fit_func'] == fit_func and
+                t.get('num_starts', 1) == num_starts and
+                boot['num_samples'] == bootstrap and
+                (bootstrap == 0 or boot['level'] == level) and
+                t.get('fit_mode', 'independent') == 'independent' and
+                t['q_range'] == str(q_range) and
+                t['t_range'] == str(t_range) and
+                same_fit_flag(t['fit_flag'], fit_flag) and
+                np.array_equal(t['bounds'], bounds))
+
+    def get_g2_fit_data(self, q_range=None, t_range=None):
+        """
+        the data to fit for the given q and t ranges;
+        :return: (t_el, q, g2, sigma, q_range, t_range)
+        """
         if q_range is None:
             q_range = [np.min(self.ql_dyn) * 0.95, np.max(self.ql_dyn) * 1.05]
 
         if t_range is None:
-            q_range = [np.min(self.t_el) * 0.95, np.max(self.t_el) * 1.05]
+            t_range = [np.min(self.t_el) * 0.95, np.max(self.t_el) * 1.05]
 
         # create a data slice for the given range;
         t_slice = create_slice(self.t_el, t_range)
@@ -518,37 +788,9 @@ class XpcsFile(object):
 
         t_el = self.t_el[t_slice]
         q = self.ql_dyn[q_slice]
-        g2 = self.g2[t_slice, q_slice]
-        sigma = self.g2_err_mod[t_slice, q_slice]
-
-        # set the initial guess
-        p0 = np.array(bounds).mean(axis=0)
-        # tau's bounds are in log scale, set as the geometric average
-        p0[1] = np.sqrt(bounds[0][1] * bounds[1][1])
-        if fit_func == 'double':
-            p0[4] = np.sqrt(bounds[0][4] * bounds[1][4])
-
-        fit_x = np.logspace(np.log10(np.min(t_el)) - 0.5,
-                            np.log10(np.max(t_el)) + 0.5, 128)
-
-        fit_line, fit_val = fit_with_fixed(func, t_el, g2, sigma,
-                                           bounds, fit_flag, fit_x, p0=p0)
-
-        self.fit_summary = {
-            'fit_func': fit_func,
-            'fit_val': fit_val,
-            't_el': t_el,
-            'q_val': q,
-            # 'g2': g2,
-            # 'sigma': sigma,
-            'q_range': str(q_range),
-            't_range': str(t_range),
-            'bounds': bounds,
-            'fit_flag': str(fit_flag),
-            'fit_line': fit_line
-        }
-
-        return self.fit_summary
+        g2 = self.read_partial('g2', (t_slice, q_slice))
+        sigma = self.read_partial('g2_err_mod', (t_slice, q_slice))
+        return t_el, q, g2, sigma, q_range, t_range
 
     @staticmethod
     def correct_g2_err(g2_err=None, threshold=1E-6):
@@ -572,154 +814,185 @@ class XpcsFile(object):
         if self.fit_summary is None:
             return
 
-        x = self.fit_summary['q_val']
-        q_slice = create_slice(x, q_range)
-        x = x[q_slice]
-
-        y = self.fit_summary['fit_val'][q_slice, 0, 1]
-        sigma = self.fit_summary['fit_val'][q_slice, 1, 1]
-
-        # filter out those invalid fittings; failed g2 fitting has -1 err
-        valid_idx = (sigma > 0)
+        fit_tauq_batch([self], q_range, bounds, fit_flag)
+        return self.fit_summary
 
-        if np.sum(valid_idx) == 0:
-            self.fit_summary['tauq_success'] = False
-            return
+    def compute_qmap(self):
+        """
+        get the q, phi and r_pixel maps; the maps are shared by the files
+        with the same geometry, so they are read-only.
+        """
+        return qmap_cache.get(self.mask.shape, self.bcx, self.bcy,
+                              self.det_dist, self.X_energy, self.pix_dim_x,
+                              self.pix_dim_y)
 
-        x = x[valid_idx]
-        y = y[valid_idx]
-        sigma = sigma[valid_idx]
+    def get_roi_operator(self, roi_parameter, phi_num=180):
+        """
+        get the sparse operator that maps the saxs_2d pixels to the bins of
+        a roi; the operators are shared by the files with the same geometry,
+        mask and q partition.
+        """
+        roi_key = get_roi_key(roi_parameter, phi_num)
+        geometry = qmap_cache.get_key(self.mask.shape, self.bcx, self.bcy,
+                                      self.det_dist, self.X_energy,
+                                      self.pix_dim_x, self.pix_dim_y)
+        if roi_key[0] == 'Pie':
+            partition = get_digest(self.sqspan)
+        else:
+            partition = None
+        key = (geometry, get_digest(self.mask), partition, roi_key)
+
+        def builder():
+            qmap = self.compute_qmap()
+            if roi_key[0] == 'Pie':
+                return build_pie_operator(qmap['q'], qmap['phi'], self.mask,
+                                          self.sqspan,
+                                          roi_parameter['angle_range'])
+            elif roi_key[0] == 'Cake':
+                q_scale, qmin, qmax = roi_key[3:]
+                q_edges = get_q_edges(qmap['q'], self.mask, roi_key[1],
+                                      q_scale, qmin, qmax)
+                return build_cake_operator(qmap['q'], qmap['phi'], self.mask,
+                                           q_edges, roi_key[2], q_scale)
+            else:
+                return build_ring_operator(qmap['r_pixel'], qmap['phi'],
+                                           self.mask, roi_parameter['radius'],
+                                           phi_num)
 
-        # reshape to two-dimension so the fit_with_fixed function works
-        y = y.reshape(-1, 1)
-        sigma = sigma.reshape(-1, 1)
+        return roi_operator_cache.get(key, builder)
 
-        # the initial value for typical gel systems
-        p0 = [1.0e-7, -2.0]
-        fit_x = np.logspace(np.log10(np.min(x) / 1.1),
-                            np.log10(np.max(x) * 1.1), 128)
+    def get_roi_data(self, roi_parameter, phi_num=180):
+        op = self.get_roi_operator(roi_parameter, phi_num)
+        pixel_index, values = self.get_pixel_data()
+        return self._finish_roi_data(roi_parameter, op,
+                                     op.apply(values, pixel_index))
 
-        fit_line, fit_val = fit_with_fixed(power_law, x, y, sigma, bounds,
-                                           fit_flag, fit_x, p0=p0)
+    def get_cake(self, q_num=256, phi_num=360):
+        """
+        remap saxs_2d to a q-phi image; the remap operator is shared by the
+        files with the same geometry and mask. use get_roi_data_batch with
+        the same roi for many files.
+        :param q_num: number of linear q bins over the valid pixels
+        :param phi_num: number of phi bins over [0, 360)
+        :return: ((q, phi), cake); cake has the shape of (phi_num, q_num) and
+            the empty bins are nan
+        """
+        roi = {'sl_type': 'Cake', 'q_num': q_num, 'phi_num': phi_num}
+        return self.get_roi_data(roi)
 
-        # fit_line and fit_val are lists with just one element;
-        self.fit_summary['tauq_success'] = fit_line[0]['success']
-        self.fit_summary['tauq_q'] = x
-        self.fit_summary['tauq_tau'] = np.squeeze(y)
-        self.fit_summary['tauq_tau_err'] = np.squeeze(sigma)
-        self.fit_summary['tauq_fit_line'] = fit_line[0]
-        self.fit_summary['tauq_fit_val'] = fit_val[0]
+    def get_saxs1d_partition(self, q_num=128, phi_num=1, q_scale='linear',
+                             qmin=None, qmax=None, roi_data=None):
+        """
+        re-partition saxs_2d into new q bins and phi sectors without running
+        the reduction again; the binning operator is shared by the files
+        with the same geometry and mask.
+        :param q_num: number of q bins
+        :param phi_num: number of phi sectors over [0, 360)
+        :param q_scale: 'linear' or 'log' q bins
+        :param qmin: lower edge of the q bins; None uses the valid pixels
+        :param qmax: upper edge of the q bins; None uses the valid pixels
+        :param roi_data: the result of get_roi_data for the same partition
+            if it's computed already, eg. by get_roi_data_batch
+        :return: dictionary in the same layout as saxs_1d
+        """
+        roi = {'sl_type': 'Cake', 'q_num': q_num, 'phi_num': phi_num,
+               'q_scale': q_scale, 'qmin': qmin, 'qmax': qmax}
+        if roi_data is None:
+            roi_data = self.get_roi_data(roi)
+        (q, phi), Iq = roi_data
+        if phi_num > 1:
+            # weight the sectors by the number of pixels
+            count = self.get_roi_operator(roi).count.reshape(Iq.shape)
+            total = np.sum(np.where(count > 0, Iq, 0) * count, axis=0)
+            avg = total / np.maximum(np.sum(count, axis=0), 1)
+            avg[np.sum(count, axis=0) == 0] = np.nan
+            Iq = np.vstack([avg, Iq])
+            labels = [self.label] + [self.label + '_%d' % (n + 1)
+                                     for n in range(phi_num)]
+        else:
+            labels = [self.label]
 
-        return self.fit_summary
-    
-    def compute_qmap(self):
-        shape = self.saxs_2d.shape
-        k0 = 2 * np.pi / (12.398 / self.X_energy)
-        v = np.arange(shape[0], dtype=np.uint32) - self.bcy
-        h = np.arange(shape[1], dtype=np.uint32) - self.bcx
-        vg, hg = np.meshgrid(v, h, indexing='ij')
-
-        r = np.hypot(vg * self.pix_dim_y, hg * self.pix_dim_x)
-        r_pixel = np.hypot(vg, hg)
-        # phi = np.arctan2(vg, hg)
-        # to be compatible with matlab xpcs-gui; phi = 0 starts at 6 clock
-        # and it goes clockwise;
-        phi = np.arctan2(hg, vg)
-        phi[phi < 0] = phi[phi < 0] + np.pi * 2.0
-        phi = np.max(phi) - phi     # make it clockwise
-
-        alpha = np.arctan(r / self.det_dist)
-        qr = np.sin(alpha) * k0
-        qr = 2 * np.sin(alpha / 2) * k0
-        # qx = qr * np.cos(phi)
-        # qy = qr * np.sin(phi)
-        phi = np.rad2deg(phi)
-
-        # keep phi and q as np.float64 to keep the precision.
-        qmap = {
+        return {
+            'q': q,
+            'Iq': Iq,
             'phi': phi,
-            'q': qr,
-            'r_pixel': r_pixel
+            'num_lines': phi_num,
+            'labels': labels,
         }
 
-        return qmap
-    
-    def get_roi_data(self, roi_parameter, phi_num=180):
-        qmap_all = self.compute_qmap()
-        qmap = qmap_all['q']
-        pmap = qmap_all['phi']
-        rmap = qmap_all['r_pixel']
+    def get_roi_data_live(self, roi_parameter, phi_num=180):
+        """
+        a fast version of get_roi_data for updating the roi profiles while
+        the roi is being dragged; the pixels are sorted once per geometry and
+        the saxs_2d's cumulative sum once per file, after that each update
+        only takes O(bins) lookups. the ring's phi bins are merged from
+        finer bins, so their edges can differ slightly from get_roi_data.
+        """
+        sl_type = roi_parameter['sl_type']
+        geometry = qmap_cache.get_key(self.mask.shape, self.bcx, self.bcy,
+                                      self.det_dist, self.X_energy,
+                                      self.pix_dim_x, self.pix_dim_y)
+        if sl_type == 'Pie':
+            key = (geometry, get_digest(self.mask), get_digest(self.sqspan),
+                   'Pie')
+        else:
+            key = (geometry, get_digest(self.mask), 'Ring')
 
-        if roi_parameter['sl_type'] == 'Pie':
-            pmin, pmax = roi_parameter['angle_range'] 
-            if pmax < pmin:
-                pmax += 360.0
-                pmap[pmap < pmin] += 360.0
-            proi = np.logical_and(pmap >= pmin, pmap < pmax)
-            proi = np.logical_and(proi, (self.mask > 0))
-            qmap_idx = np.zeros_like(qmap, dtype=np.uint32)
-
-            index = 1
-            qsize = len(self.sqspan) - 1
-            for n in range(qsize):
-                q0, q1 = self.sqspan[n: n + 2]
-                select = (qmap >= q0) * (qmap < q1)
-                qmap_idx[select] = index
-                index += 1
-            qmap_idx = (qmap_idx * proi).ravel()
-
-            saxs_roi = np.bincount(qmap_idx, self.saxs_2d.ravel(),
-                                   minlength=qsize+1)
-            saxs_nor = np.bincount(qmap_idx, minlength=qsize+1)
-            saxs_nor[saxs_nor == 0] = 1.0
-            saxs_roi = saxs_roi * 1.0 / saxs_nor
-
-            # remove the 0th term
-            saxs_roi = saxs_roi[1:]
+        def builder():
+            qmap = self.compute_qmap()
+            if sl_type == 'Pie':
+                return build_pie_bins(qmap['q'], qmap['phi'], self.mask,
+                                      self.sqspan)
+            else:
+                return build_ring_bins(qmap['r_pixel'], qmap['phi'],
+                                       self.mask)
+
+        bins = sorted_bins_cache.get(key, builder)
+        if key not in self._roi_cumsum:
+            pixel_index, values = self.get_pixel_data()
+            self._roi_cumsum[key] = bins.prefix(values, pixel_index)
+        cum = self._roi_cumsum[key]
+
+        if sl_type == 'Pie':
+            ranges = get_pie_ranges(roi_parameter['angle_range'])
+            return self._finish_roi_data(roi_parameter, None,
+                                         bins.average(cum, ranges))
+        else:
+            return get_ring_profile(bins, cum, roi_parameter['radius'],
+                                    phi_num)
 
+    def _finish_roi_data(self, roi_parameter, op, saxs_roi):
+        if roi_parameter['sl_type'] == 'Pie':
             # set the qmax cutoff
             dist = roi_parameter['dist']
             # qmax = qmap[int(self.bcy), int(self.bcx + dist)]
             wlength = 12.398 / self.X_energy
             qmax = dist * self.pix_dim_x / self.det_dist * 2 * np.pi / wlength
             saxs_roi[self.ql_sta >= qmax] = 0
-            saxs_roi[saxs_roi <=0] = np.nan
+            saxs_roi[saxs_roi <= 0] = np.nan
             return self.ql_sta, saxs_roi
+        elif roi_parameter['sl_type'] == 'Cake':
+            saxs_roi[op.count == 0] = np.nan
+            shape = (roi_parameter['phi_num'], roi_parameter['q_num'])
+            return op.x, saxs_roi.reshape(shape)
+        else:
+            return op.x, saxs_roi
 
-        elif roi_parameter['sl_type'] == 'Ring':
-            rmin, rmax = roi_parameter['radius']
-            if rmin > rmax:
-                rmin, rmax = rmax, rmin
-            rroi = np.logical_and(rmap >= rmin, rmap < rmax)
-            rroi = np.logical_and(rroi, (self.mask > 0))
-
-            phi_min, phi_max = np.min(pmap[rroi]), np.max(pmap[rroi])
-            x = np.linspace(phi_min, phi_max, phi_num)
-            delta = (phi_max - phi_min) / phi_num
-            index = ((pmap - phi_min) / delta).astype(np.int64)
-            index[index == phi_num] = phi_num - 1
-            index += 1
-            # q_avg = qmap[rroi].mean()
-            index = (index * rroi).ravel()
-
-            saxs_roi = np.bincount(index, self.saxs_2d.ravel(),
-                                   minlength=phi_num+1)
-            saxs_nor = np.bincount(index, minlength=phi_num+1)
-            saxs_nor[saxs_nor == 0] = 1.0
-            saxs_roi = saxs_roi * 1.0 / saxs_nor
-
-            # remove the 0th term
-            saxs_roi = saxs_roi[1:]
-            return x, saxs_roi
-    
-    def export_saxs1d(self, roi_list, folder):
+    def export_saxs1d(self, roi_list, folder, roi_data=None):
+        """
+        :param roi_data: the data of the rois if it's computed already, eg.
+            by get_roi_data_batch; list of (x, y)
+        """
         # export ROI
         idx = 0
         for roi in roi_list:
             fname = os.path.join(folder,
                 self.label + '_' + roi['sl_type'] + f'_{idx:03d}.txt')
+            if roi_data is None:
+                x, y = self.get_roi_data(roi)
+            else:
+                x, y = roi_data[idx]
             idx += 1
-            x, y = self.get_roi_data(roi)
             if roi['sl_type'] == 'Ring':
                 header = 'phi(degree) Intensity'
             else: